@@ -0,0 +1,95 @@
+"""
+Sustituto local de fakestoreapi.com para pruebas de carga.
+
+Sirve ``/products`` y ``/products/<id>`` con la misma forma de respuesta que la
+API real, añadiendo una latencia configurable y una proporción de errores 500 y
+respuestas 404. Como la API real, los IDs fuera del catálogo devuelven un 200
+con el cuerpo vacío.
+
+Uso:
+    python -m benchmarks.api_simulada --puerto 8765 --latencia-ms 50 --tasa-error 0.01
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def crear_catalogo(num_productos: int):
+    return {
+        i: {"id": i, "title": f"Producto {i}", "price": round(5 + (i * 7.31) % 200, 2),
+            "description": f"Descripción del producto {i}", "category": "benchmark"}
+        for i in range(1, num_productos + 1)
+    }
+
+
+class ManejadorApi(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, como la API real.
+    config = None
+    catalogo = {}
+    _rng = random.Random()
+    _rng_lock = threading.Lock()
+
+    def do_GET(self):
+        with self._rng_lock:
+            azar_error, azar_404, azar_latencia = self._rng.random(), self._rng.random(), self._rng.random()
+        latencia = self.config.latencia_ms + (azar_latencia * 2 - 1) * self.config.jitter_ms
+        time.sleep(max(latencia, 0) / 1000)
+
+        partes = self.path.strip('/').split('/')
+        if azar_error < self.config.tasa_error:
+            return self._responder(500, b'{"error": "simulated"}')
+        if partes == ['products']:
+            return self._responder(200, json.dumps(list(self.catalogo.values())).encode())
+        if len(partes) != 2 or partes[0] != 'products' or not partes[1].isdigit():
+            return self._responder(404, b'')
+        if azar_404 < self.config.ratio_404:
+            return self._responder(404, b'')
+        producto = self.catalogo.get(int(partes[1]))
+        self._responder(200, json.dumps(producto).encode() if producto else b'')
+
+    def _responder(self, status, cuerpo):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def crear_servidor(config) -> ThreadingHTTPServer:
+    manejador = type('Manejador', (ManejadorApi,), {
+        'config': config,
+        'catalogo': crear_catalogo(config.num_productos),
+        '_rng': random.Random(config.semilla),
+    })
+    servidor = ThreadingHTTPServer(('127.0.0.1', config.puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia-ms', type=float, default=50.0, help="Latencia media por petición.")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="Variación uniforme +/- sobre la latencia.")
+    parser.add_argument('--tasa-error', type=float, default=0.0, help="Proporción de respuestas 500.")
+    parser.add_argument('--ratio-404', type=float, default=0.0, help="Proporción de respuestas 404.")
+    parser.add_argument('--num-productos', type=int, default=20, help="Tamaño del catálogo (IDs 1..N).")
+    parser.add_argument('--semilla', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    config = parsear_argumentos()
+    servidor = crear_servidor(config)
+    print(f"API simulada escuchando en http://127.0.0.1:{config.puerto}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
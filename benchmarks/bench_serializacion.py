@@ -0,0 +1,110 @@
+"""
+Comparación de serializadores para la cola de Huey.
+
+Para cada tamaño de pedido encola N tareas ``procesar_pedido_completo`` simuladas
+en una SqliteHuey temporal con cada serializador y mide el tamaño de los mensajes,
+el tamaño de huey.db, el throughput de encolado y desencolado (incluida la
+deserialización) y el coste de serializar/deserializar en memoria.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_serializacion --pedidos 5000 --salida bench_serializacion.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from huey import SqliteHuey
+from huey.serializer import Serializer
+
+from benchmarks.carga import generar_pedidos, percentiles
+from pedidos_app.serializacion import SerializadorCompacto
+
+SERIALIZADORES = {
+    'por_defecto': lambda: Serializer(),
+    'zlib_huey': lambda: Serializer(compression=True, use_zlib=True),
+    'compacto_sin_compresion': lambda: SerializadorCompacto(umbral_compresion=float('inf')),
+    'compacto': lambda: SerializadorCompacto(),
+}
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pedidos', type=int, default=5000)
+    parser.add_argument('--productos', type=int, nargs='+', default=[3, 20, 100],
+                        help="Líneas máximas por pedido de cada escenario.")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', default='bench_serializacion.json')
+    return parser.parse_args(argv)
+
+
+def medir(nombre_serializador, pedidos, directorio):
+    ruta = Path(directorio) / f'{nombre_serializador}.db'
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    huey = SqliteHuey('bench', filename=str(ruta), serializer=SERIALIZADORES[nombre_serializador](),
+                      journal_mode='wal', fsync=False)
+
+    @huey.task(retries=5, retry_delay=2.0, context=True)
+    def procesar_pedido_completo(pedido_data, task=None):
+        pass
+
+    tareas = [procesar_pedido_completo.s(pedido) for pedido in pedidos]
+    mensajes = [huey.serialize_task(tarea) for tarea in tareas]
+    inicio = time.perf_counter()
+    for tarea in tareas:
+        huey.serialize_task(tarea)
+    serializar_us = (time.perf_counter() - inicio) / len(tareas) * 1e6
+    inicio = time.perf_counter()
+    for mensaje in mensajes:
+        huey.deserialize_task(mensaje)
+    deserializar_us = (time.perf_counter() - inicio) / len(mensajes) * 1e6
+
+    inicio = time.perf_counter()
+    for tarea in tareas:
+        huey.enqueue(tarea)
+    encolado = time.perf_counter() - inicio
+    huey.storage.sql('pragma wal_checkpoint(TRUNCATE)', results=True)
+    tamano_db = os.path.getsize(ruta)
+
+    inicio = time.perf_counter()
+    desencoladas = 0
+    while huey.dequeue() is not None:
+        desencoladas += 1
+    desencolado = time.perf_counter() - inicio
+    assert desencoladas == len(tareas)
+
+    tamanos = [len(m) for m in mensajes]
+    return {
+        'bytes_por_mensaje': percentiles(tamanos),
+        'bytes_totales': sum(tamanos),
+        'tamano_huey_db': tamano_db,
+        'encolado_por_s': round(len(tareas) / encolado, 1),
+        'desencolado_por_s': round(len(tareas) / desencolado, 1),
+        'serializar_us': round(serializar_us, 1),
+        'deserializar_us': round(deserializar_us, 1),
+    }
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    informe = {'configuracion': vars(args), 'escenarios': {}}
+    with tempfile.TemporaryDirectory(prefix='pedidos-serializacion-') as directorio:
+        for max_productos in args.productos:
+            pedidos = generar_pedidos(argparse.Namespace(
+                pedidos=args.pedidos, semilla=args.semilla, max_productos=max_productos,
+                ratio_sku_invalido=0.0, num_productos=20))
+            escenario = informe['escenarios'][f'hasta_{max_productos}_productos'] = {}
+            for nombre in SERIALIZADORES:
+                escenario[nombre] = r = medir(nombre, pedidos, Path(directorio) / str(max_productos))
+                print(f"{max_productos:>4} productos | {nombre:<24} | {r['bytes_por_mensaje']['media']:>8} B/msg | "
+                      f"huey.db {r['tamano_huey_db'] / 1024:>8.0f} KiB | encolado {r['encolado_por_s']:>8}/s | "
+                      f"desencolado {r['desencolado_por_s']:>8}/s | {r['serializar_us']:>6} / "
+                      f"{r['deserializar_us']:>6} µs", flush=True)
+    Path(args.salida).write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
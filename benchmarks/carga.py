@@ -0,0 +1,316 @@
+"""
+Prueba de carga reproducible del pipeline de pedidos.
+
+Levanta la API simulada en un subproceso, prepara bases de datos temporales,
+encola N pedidos generados con una semilla fija y los procesa con un consumidor
+de Huey real dentro del mismo proceso. Al terminar escribe un informe JSON con
+el throughput, la latencia extremo a extremo (p50/p95/p99), el tiempo por etapa
+del pipeline (según ``TaskHistory.metricas``), el reparto entre espera en cola,
+API y base de datos, y el tiempo de escritura en SQLite (que incluye las esperas
+por bloqueo).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.carga --pedidos 2000 --workers 4 --latencia-ms 50 --salida bench.json
+    python -m benchmarks.carga --pedidos 2000 --modo asyncio --workers 8 --max-en-vuelo 64
+    python -m benchmarks.carga --pedidos 500 --rafaga 5000 [--sin-prioridad]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+CLIENTES = ["ACME Corp", "Stark Industries", "Wayne Enterprises", "Cyberdyne Systems", "OsCorp"]
+CLIENTE_RAFAGA = "Carga Masiva S.A."
+SENTENCIAS_ESCRITURA = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE')
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pedidos', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modo', choices=('thread', 'asyncio'), default='thread',
+                        help="Consumidor de hilos de Huey o consumidor asyncio (--workers pasa a ser el número de hilos ORM).")
+    parser.add_argument('--max-en-vuelo', type=int, default=None,
+                        help="Tareas desencoladas a la vez por el consumidor asyncio (por defecto 4 por hilo ORM).")
+    parser.add_argument('--pedidos-por-tarea', type=int, default=1)
+    parser.add_argument('--max-productos', type=int, default=3, help="Líneas máximas por pedido.")
+    parser.add_argument('--ratio-sku-invalido', type=float, default=0.0, help="Proporción de líneas con SKU fuera del catálogo.")
+    parser.add_argument('--latencia-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--ratio-404', type=float, default=0.0)
+    parser.add_argument('--num-productos', type=int, default=20)
+    parser.add_argument('--concurrencia-api', type=int, default=None,
+                        help="Peticiones simultáneas permitidas por la guarda de la API (por defecto, la de settings).")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--rafaga', type=int, default=0,
+                        help="Pedidos de un único cliente encolados antes que el resto (carga masiva).")
+    parser.add_argument('--sin-prioridad', action='store_true',
+                        help="Desactiva los carriles y turnos por cliente (cola FIFO) para comparar.")
+    parser.add_argument('--catalogo-local', action='store_true',
+                        help="Sincroniza la réplica local del catálogo antes de encolar (sin API en el camino crítico).")
+    parser.add_argument('--timeout', type=float, default=600.0, help="Segundos máximos esperando a que terminen los pedidos.")
+    parser.add_argument('--salida', default='bench_resultado.json')
+    return parser.parse_args(argv)
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentiles(valores):
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "media": None}
+    ordenados = sorted(valores)
+
+    def p(q):
+        return round(ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))], 2)
+
+    return {"p50": p(0.50), "p95": p(0.95), "p99": p(0.99), "max": round(ordenados[-1], 2),
+            "media": round(statistics.fmean(ordenados), 2)}
+
+
+def generar_pedidos(args):
+    rng = random.Random(args.semilla)
+    base_id = 10_000_000
+    pedidos = []
+    for i in range(args.pedidos):
+        productos = []
+        for _ in range(rng.randint(1, args.max_productos)):
+            if rng.random() < args.ratio_sku_invalido:
+                sku = f"P{args.num_productos + 900 + rng.randint(0, 99)}"
+            else:
+                sku = f"P{rng.randint(1, args.num_productos):03d}"
+            productos.append({"sku": sku, "cantidad": rng.randint(1, 5)})
+        pedidos.append({"id": base_id + i, "cliente": rng.choice(CLIENTES), "productos": productos})
+    return pedidos
+
+
+def generar_rafaga(args):
+    """Pedidos de la carga masiva de un solo cliente, con IDs que no coinciden con los del resto."""
+    rng = random.Random(args.semilla + 1)
+    return [{"id": 20_000_000 + i, "cliente": CLIENTE_RAFAGA,
+             "productos": [{"sku": f"P{rng.randint(1, args.num_productos):03d}", "cantidad": rng.randint(1, 5)}
+                           for _ in range(rng.randint(1, args.max_productos))]}
+            for i in range(args.rafaga)]
+
+
+def iniciar_api_simulada(args, puerto):
+    proceso = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.api_simulada', '--puerto', str(puerto),
+        '--latencia-ms', str(args.latencia_ms), '--jitter-ms', str(args.jitter_ms),
+        '--tasa-error', str(args.tasa_error), '--ratio-404', str(args.ratio_404),
+        '--num-productos', str(args.num_productos), '--semilla', str(args.semilla),
+    ], cwd=Path(__file__).resolve().parent.parent, stdout=subprocess.DEVNULL)
+    limite = time.monotonic() + 10
+    while time.monotonic() < limite:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{puerto}/products/1', timeout=1).read()
+            return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("La API simulada no arrancó a tiempo.")
+
+
+class Medidor:
+    """Acumula tiempos por tarea, por etapa y por sentencia SQL, de forma segura entre hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encolado = {}       # task_id -> instante de encolado
+        self.inicio = {}         # task_id -> instante del primer inicio de ejecución
+        self.fin = {}            # task_id -> (instante final, estado)
+        self.etapas = {"espera_cola": [], "ejecucion": [], "api": [], "db": []}
+        self.escrituras_sql = []
+        self.errores_bloqueo = 0
+        self._local = threading.local()
+
+    def sumar(self, clave, valor):
+        setattr(self._local, clave, getattr(self._local, clave, 0.0) + valor)
+
+    def extraer(self, clave):
+        valor = getattr(self._local, clave, 0.0)
+        setattr(self._local, clave, 0.0)
+        return valor
+
+    def envoltorio_sql(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            if 'locked' in str(e):
+                with self.lock:
+                    self.errores_bloqueo += 1
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.sumar('db', duracion)
+            if sql.lstrip().upper().startswith(SENTENCIAS_ESCRITURA):
+                with self.lock:
+                    self.escrituras_sql.append(duracion * 1000)
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    directorio = tempfile.mkdtemp(prefix='pedidos-bench-')
+    puerto = puerto_libre()
+    os.environ['PEDIDOS_BENCH_DIR'] = directorio
+    os.environ['PEDIDOS_BENCH_API_URL'] = f'http://127.0.0.1:{puerto}'
+    if args.concurrencia_api:
+        os.environ['PEDIDOS_BENCH_CONCURRENCIA_API'] = str(args.concurrencia_api)
+    if args.sin_prioridad:
+        os.environ['PEDIDOS_BENCH_SIN_PRIORIDAD'] = '1'
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+    import django
+    django.setup()
+    logging.getLogger().setLevel(logging.WARNING)  # El pipeline registra cada pedido en INFO.
+    from django.core.management import call_command
+    from django.db.backends.signals import connection_created
+    from huey import signals
+    from huey.contrib.djhuey import HUEY
+
+    from pedidos_app import tasks
+    from pedidos_app.encolado import _crear_tareas
+    from pedidos_app.models import TaskHistory
+
+    call_command('migrate', verbosity=0)
+    api = iniciar_api_simulada(args, puerto)
+    medidor = Medidor()
+
+    def instalar_envoltorio(sender, connection, **kwargs):
+        connection.execute_wrappers.append(medidor.envoltorio_sql)
+    connection_created.connect(instalar_envoltorio, weak=False)
+
+    obtener_productos_original = tasks.obtener_productos_catalogo
+
+    def obtener_productos_medido(*a, **k):
+        inicio = time.perf_counter()
+        try:
+            return obtener_productos_original(*a, **k)
+        finally:
+            medidor.sumar('api', time.perf_counter() - inicio)
+    tasks.obtener_productos_catalogo = obtener_productos_medido
+
+    if args.catalogo_local:
+        from pedidos_app.catalogo import sincronizar_catalogo
+        print(f"Catálogo local: {sincronizar_catalogo()}", flush=True)
+
+    @HUEY.pre_execute()
+    def al_iniciar(task):
+        medidor.extraer('api')
+        medidor.extraer('db')
+        medidor._local.inicio = time.perf_counter()
+        with medidor.lock:
+            medidor.inicio.setdefault(task.id, time.perf_counter())
+
+    @HUEY.post_execute()
+    def al_terminar(task, task_value, exc):
+        with medidor.lock:
+            medidor.etapas["ejecucion"].append((time.perf_counter() - medidor._local.inicio) * 1000)
+            medidor.etapas["api"].append(medidor.extraer('api') * 1000)
+            medidor.etapas["db"].append(medidor.extraer('db') * 1000)
+
+    @HUEY.signal(signals.SIGNAL_COMPLETE, signals.SIGNAL_ERROR)
+    def al_finalizar(signal, task, exc=None):
+        # Un error con reintentos pendientes no es final: el pedido volverá a la cola.
+        if signal == signals.SIGNAL_ERROR and task.retries:
+            return
+        with medidor.lock:
+            if task.id in medidor.encolado:
+                medidor.fin[task.id] = (time.perf_counter(), 'ok' if signal == signals.SIGNAL_COMPLETE else 'error')
+
+    rafaga = generar_rafaga(args)
+    pedidos = rafaga + generar_pedidos(args)
+    if args.modo == 'asyncio':
+        from pedidos_app.consumidor_asyncio import crear_consumidor
+        consumidor = crear_consumidor(HUEY, periodic=False, initial_delay=0.01, max_delay=0.1,
+                                      max_en_vuelo=args.max_en_vuelo, hilos_orm=args.workers)
+    else:
+        consumidor = HUEY.create_consumer(workers=args.workers, worker_type='thread', periodic=False,
+                                          initial_delay=0.01, max_delay=0.1, check_worker_health=False)
+    print(f"Encolando {len(pedidos)} pedidos y arrancando {args.workers} workers ({args.modo})...", flush=True)
+    inicio_total = time.perf_counter()
+    tareas, grupos = [], {}
+    for tarea, _ in _crear_tareas(pedidos, args.pedidos_por_tarea):
+        medidor.encolado[tarea.id] = time.perf_counter()
+        HUEY.enqueue(tarea)
+        tareas.append(tarea)
+        # Las tareas se crean en orden: las primeras contienen los pedidos de la ráfaga.
+        grupos[tarea.id] = 'rafaga' if len(tareas) * args.pedidos_por_tarea <= len(rafaga) else 'resto'
+    consumidor.start()
+
+    try:
+        limite = time.monotonic() + args.timeout
+        while len(medidor.fin) < len(tareas) and time.monotonic() < limite:
+            time.sleep(0.2)
+    finally:
+        consumidor.stop(graceful=True)
+        api.terminate()
+    fin_total = max((t for t, _ in medidor.fin.values()), default=time.perf_counter())
+
+    esperas_grupo, latencias_grupo = {}, {}
+    for task_id, t_inicio in medidor.inicio.items():
+        medidor.etapas["espera_cola"].append((t_inicio - medidor.encolado[task_id]) * 1000)
+        esperas_grupo.setdefault(grupos[task_id], []).append((t_inicio - medidor.encolado[task_id]) * 1000)
+    latencias = [(t - medidor.encolado[task_id]) * 1000 for task_id, (t, _) in medidor.fin.items()]
+    for task_id, (t, _) in medidor.fin.items():
+        latencias_grupo.setdefault(grupos[task_id], []).append((t - medidor.encolado[task_id]) * 1000)
+    duracion = fin_total - inicio_total
+    completados = sum(1 for _, estado in medidor.fin.values() if estado == 'ok')
+
+    etapas_pipeline = {}
+    for metricas in TaskHistory.objects.exclude(metricas=None).values_list('metricas', flat=True).iterator():
+        for etapa, ms in metricas.get('etapas_ms', {}).items():
+            etapas_pipeline.setdefault(etapa, []).append(ms)
+
+    informe = {
+        "configuracion": vars(args),
+        "resultados": {
+            "tareas": len(tareas),
+            "tareas_finalizadas": len(medidor.fin),
+            "tareas_completadas": completados,
+            "tareas_fallidas": len(medidor.fin) - completados,
+            "duracion_s": round(duracion, 3),
+            "pedidos_por_segundo": round(len(pedidos) * len(medidor.fin) / len(tareas) / duracion, 2) if duracion else None,
+            "latencia_extremo_a_extremo_ms": percentiles(latencias),
+            "etapas_ms": {etapa: percentiles(valores) for etapa, valores in medidor.etapas.items()},
+            "por_grupo_ms": {grupo: {"espera_cola": percentiles(esperas_grupo.get(grupo, [])),
+                                     "latencia_extremo_a_extremo": percentiles(latencias_grupo.get(grupo, []))}
+                             for grupo in sorted(set(grupos.values()))},
+            "etapas_pipeline_ms": {etapa: percentiles(valores) for etapa, valores in etapas_pipeline.items()},
+            "sqlite": {
+                "escrituras": len(medidor.escrituras_sql),
+                "tiempo_escrituras_s": round(sum(medidor.escrituras_sql) / 1000, 3),
+                "latencia_escritura_ms": percentiles(medidor.escrituras_sql),
+                "errores_bloqueo": medidor.errores_bloqueo,
+            },
+        },
+    }
+    Path(args.salida).write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+    r = informe["resultados"]
+    print(f"{r['tareas_finalizadas']}/{r['tareas']} tareas en {r['duracion_s']} s | "
+          f"{r['pedidos_por_segundo']} pedidos/s | p95 {r['latencia_extremo_a_extremo_ms']['p95']} ms | "
+          f"informe: {args.salida}")
+    if rafaga:
+        for grupo, valores in r["por_grupo_ms"].items():
+            print(f"  {grupo}: espera en cola p95 {valores['espera_cola']['p95']} ms | "
+                  f"extremo a extremo p95 {valores['latencia_extremo_a_extremo']['p95']} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Settings para las pruebas de carga.
+
+Reutilizan la configuración del proyecto apuntando las bases de datos a un
+directorio temporal y la API de productos a la API simulada local.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from pedidos_project.settings import *  # noqa: F401,F403
+
+DIR_BENCHMARK = Path(os.environ.get('PEDIDOS_BENCH_DIR') or tempfile.mkdtemp(prefix='pedidos-bench-'))
+
+DATABASES = {
+    'default': {**DATABASES['default'], 'NAME': DIR_BENCHMARK / 'db.sqlite3'},
+}
+
+HUEY = {
+    **HUEY,
+    'name': 'benchmark',
+    'filename': DIR_BENCHMARK / 'huey.db',
+    'immediate': False,
+}
+
+PEDIDOS_METRICAS = {**PEDIDOS_METRICAS, 'puerto_worker': None}
+
+PEDIDOS_API_PRODUCTOS = {
+    **PEDIDOS_API_PRODUCTOS,
+    'base_url': os.environ.get('PEDIDOS_BENCH_API_URL', 'http://127.0.0.1:8765'),
+}
+
+if os.environ.get('PEDIDOS_BENCH_CONCURRENCIA_API'):
+    _concurrencia = int(os.environ['PEDIDOS_BENCH_CONCURRENCIA_API'])
+    PEDIDOS_API_PRODUCTOS['max_concurrencia'] = _concurrencia
+    PEDIDOS_RESILIENCIA_API = {
+        **PEDIDOS_RESILIENCIA_API, 'concurrencia_max': _concurrencia, 'concurrencia_inicial': _concurrencia,
+        'tasa_por_segundo': 10.0 * _concurrencia, 'rafaga': 10 * _concurrencia,
+    }
+
+if os.environ.get('PEDIDOS_BENCH_SIN_PRIORIDAD'):
+    PEDIDOS_PRIORIDAD = {'activa': False}
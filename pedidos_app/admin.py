@@ -1,27 +1,203 @@
 """
 Configuracion de interfaz Django Admin.
 
-Definimos los modelos que vamos a registrar en el admnin de django asi como 
-las columnas a mostrar y filtros disponibles, se configuran permisos a nivel de vista."""
+Definimos los modelos que vamos a registrar en el admnin de django asi como
+las columnas a mostrar y filtros disponibles, se configuran permisos a nivel de vista.
+
+Las tablas de pedidos e historial crecen a millones de filas, por lo que los
+listados evitan los COUNT(*) completos, las consultas por fila y las búsquedas
+que no pueden usar índices. Por lo mismo no usan ``date_hierarchy`` ni filtros
+por valores de columna (ambos calculan un DISTINCT sobre toda la tabla en cada
+página): las opciones de los filtros salen de listas fijas o de tablas pequeñas."""
+
+import json
+from datetime import timedelta
 
 from django.contrib import admin
-from django.urls import reverse
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import TextField
+from django.db.models.functions import Cast, Substr
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import PedidoProcesado, TaskHistory
+from huey.contrib.djhuey import HUEY
+from . import inspector_huey
+from .models import PedidoProcesado, Producto, TaskHistory, VentaDiariaCliente
+from .resiliencia import CLAVE_ESTADO_API
+from .tasks import procesar_pedido_completo, procesar_pedidos_lote
+
+# Por encima de este número de filas los listados filtrados dejan de contar con exactitud.
+LIMITE_CONTEO_EXACTO = 10000
+LONGITUD_RESUMEN_DETALLE = 120
+# Opciones como máximo del filtro de clientes y días de ventas de los que se toman.
+LIMITE_OPCIONES_FILTRO = 50
+DIAS_CLIENTES_RECIENTES = 30
+# Las únicas tareas que escriben en el historial.
+TAREAS_CON_HISTORIAL = tuple(tarea.task_class.__name__ for tarea in (procesar_pedido_completo, procesar_pedidos_lote))
+
+
+def estimar_filas(model):
+    """
+    Estima el número de filas de una tabla a partir de las estadísticas de SQLite.
+
+    Usa ``sqlite_stat1`` (generada por ANALYZE / PRAGMA optimize), cuya lectura es
+    de coste constante. Devuelve None si no hay estadísticas disponibles.
+    """
+    connection = connections[model.objects.db]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s ORDER BY idx IS NOT NULL LIMIT 1", [model._meta.db_table])
+        fila = cursor.fetchone()
+    return int(fila[0].split()[0]) if fila else None
+
+
+class PaginadorConteoEstimado(Paginator):
+    """
+    Paginador que no ejecuta un COUNT(*) completo sobre tablas grandes.
+
+    Sin filtros usa la estimación de las estadísticas de SQLite; con filtros cuenta
+    como máximo ``LIMITE_CONTEO_EXACTO`` filas, de modo que el coste está acotado.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = estimar_filas(queryset.model)
+            if estimado is not None:
+                return estimado
+        return queryset[:LIMITE_CONTEO_EXACTO].count()
+
+
+class FiltroValorExacto(admin.SimpleListFilter):
+    """Filtro por igualdad sobre ``parameter_name``, que debe ser una columna indexada."""
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class ClienteRecienteFilter(FiltroValorExacto):
+    """Clientes con ventas en los últimos días, leídos del agregado diario y no de la tabla de pedidos."""
+    title = 'cliente'
+    parameter_name = 'cliente'
+
+    def lookups(self, request, model_admin):
+        desde = timezone.localdate() - timedelta(days=DIAS_CLIENTES_RECIENTES)
+        clientes = (VentaDiariaCliente.objects.filter(dia__gte=desde).order_by('cliente')
+                    .values_list('cliente', flat=True).distinct()[:LIMITE_OPCIONES_FILTRO])
+        return [(cliente, cliente) for cliente in clientes]
+
+
+class TareaFilter(FiltroValorExacto):
+    title = 'tarea'
+    parameter_name = 'task_name'
+
+    def lookups(self, request, model_admin):
+        return [(nombre, nombre) for nombre in TAREAS_CON_HISTORIAL]
+
+
+class WorkerFilter(FiltroValorExacto):
+    """Workers que publican el estado de su guarda de la API (ver ``publicar_estado_api``), sin leer el historial."""
+    title = 'worker'
+    parameter_name = 'worker_hostname'
+
+    def lookups(self, request, model_admin):
+        workers = set(HUEY.get(CLAVE_ESTADO_API, peek=True) or {})
+        if self.value():
+            workers.add(self.value())  # Un worker ya detenido sigue siendo seleccionable desde la URL.
+        return [(worker, worker) for worker in sorted(workers)]
+
 
 @admin.register(PedidoProcesado)
 class PedidoProcesadoAdmin(admin.ModelAdmin):
-    list_display = ('id_pedido_original', 'cliente','subtotal','descuento','total_final','detalle_completo' ,'fecha_procesado')
-    list_filter = ('cliente', 'fecha_procesado')
+    list_display = ('id_pedido_original', 'cliente','subtotal','descuento','total_final','resumen_detalle' ,'fecha_procesado')
+    # El filtro de fecha tiene rangos fijos (hoy, 7 días, mes, año) que usan el índice de fecha_procesado.
+    list_filter = (ClienteRecienteFilter, 'fecha_procesado')
     search_fields = ('id_pedido_original', 'cliente')
+    search_help_text = "ID exacto del pedido o nombre exacto del cliente."
+    ordering = ('-fecha_procesado',)
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+    change_list_template = 'admin/pedidos_app/pedido_procesado/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('huey-tasks/', self.admin_site.admin_view(self.huey_tasks_view), name='huey-tasks'),
+        ]
+        return urls + super().get_urls()
+
+    def huey_tasks_view(self, request):
+        """
+        Inspector de la cola de Huey: tareas pendientes, programadas, resultados y errores.
+
+        Cada petición lee una sola página de tamaño fijo con una conexión de solo lectura
+        (ver ``inspector_huey``), por lo que no frena al consumidor aunque la cola sea enorme.
+        """
+        context = {**self.admin_site.each_context(request), 'title': 'Tareas de Huey',
+                   'vistas': inspector_huey.VISTAS, 'disponible': inspector_huey.disponible()}
+        if context['disponible']:
+            pagina = inspector_huey.inspeccionar(request.GET.get('vista', ''), request.GET.get('cursor'))
+            context.update(pagina, tasks=pagina['tareas'])
+        return TemplateResponse(request, 'admin/huey_tasks.html', context)
+
+    def get_queryset(self, request):
+        # El JSON completo no se carga en el listado: solo un prefijo calculado en la base de datos.
+        return super().get_queryset(request).defer('detalle_completo').annotate(
+            detalle_preview=Substr(Cast('detalle_completo', TextField()), 1, LONGITUD_RESUMEN_DETALLE),
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Búsquedas exactas para que usen la clave primaria o el índice de cliente.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(id_pedido_original=int(search_term)), False
+        return queryset.filter(cliente=search_term), False
+
+    @admin.display(description='Detalle')
+    def resumen_detalle(self, obj):
+        preview = getattr(obj, 'detalle_preview', None)
+        if preview is None:
+            preview = json.dumps(obj.detalle_completo)
+        if len(preview) >= LONGITUD_RESUMEN_DETALLE:
+            preview = preview[:LONGITUD_RESUMEN_DETALLE - 1] + '…'
+        return preview
 
 # se agrega a nuestro Admin de Django la tabla con el historial de tareas.
 @admin.register(TaskHistory)
 class TaskHistoryAdmin(admin.ModelAdmin):
-    list_display = ('task_id', 'task_name', 'link_al_pedido', 'status','worker_hostname', 'start_time','error_message')
-    list_filter = ('status', 'task_name', 'worker_hostname')
-    search_fields = ('task_id', 'task_name', 'pedido__id_pedido_original') # Busca a través de la relación
-    
+    list_display = ('task_id', 'task_name', 'link_al_pedido', 'status', 'clasificacion_error', 'reintentos', 'worker_hostname', 'start_time', 'error_message')
+    list_filter = ('status', TareaFilter, WorkerFilter, 'start_time')
+    search_fields = ('task_id', 'id_pedido_original')
+    search_help_text = "ID exacto de la tarea o del pedido (también de los pedidos fallidos)."
+    ordering = ('-start_time',)
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Las métricas por etapa solo se muestran en el detalle.
+        return super().get_queryset(request).defer('metricas')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Búsquedas exactas por clave primaria o por el ID del pedido (índice con start_time), sin JOIN ni LIKE.
+        # El ID del pedido se guarda también cuando la tarea falla y no hay PedidoProcesado que enlazar.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(id_pedido_original=int(search_term)), False
+        return queryset.filter(task_id=search_term), False
+
     # Hacemos la vista de solo lectura
     def has_add_permission(self, request):
         return False
@@ -34,9 +210,54 @@ class TaskHistoryAdmin(admin.ModelAdmin):
     def link_al_pedido(self, obj):
         """
         Crea un enlace HTML al admin del PedidoProcesado.
+
+        La clave primaria del pedido es su ID original, así que el enlace se arma
+        con ``pedido_id`` sin consultar la tabla de pedidos por cada fila.
         """
-        if obj.pedido:
+        if obj.pedido_id is not None:
             # se construye la URL a la página de edición del PedidoProcesado
-            url = reverse('admin:pedidos_app_pedidoprocesado_change', args=[obj.pedido.pk])
-            return format_html('<a href="{}">{}</a>', url, obj.pedido.id_pedido_original)
-        return "-"
\ No newline at end of file
+            url = reverse('admin:pedidos_app_pedidoprocesado_change', args=[obj.pedido_id])
+            return format_html('<a href="{}">{}</a>', url, obj.pedido_id)
+        # Pedido que no llegó a guardarse (p. ej. una tarea fallida): se muestra su ID sin enlace.
+        return obj.id_pedido_original if obj.id_pedido_original is not None else "-"
+
+
+@admin.register(Producto)
+class ProductoAdmin(admin.ModelAdmin):
+    list_display = ('id_producto', 'titulo', 'precio', 'activo', 'fecha_actualizacion')
+    list_filter = ('activo',)
+    search_fields = ('titulo',)
+    ordering = ('id_producto',)
+
+    # La réplica solo la modifica la sincronización con la API.
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VentaDiariaCliente)
+class VentaDiariaClienteAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'cliente', 'pedidos', 'subtotal', 'descuento', 'total_final', 'fecha_actualizacion')
+    list_filter = ('cliente',)
+    search_fields = ('cliente',)
+    search_help_text = "Nombre exacto del cliente."
+    date_hierarchy = 'dia'
+    ordering = ('-dia', 'cliente')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Búsqueda exacta para que use el índice único (cliente, dia).
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(cliente=search_term), False
+
+    # Solo la mantienen el pipeline y el comando reconstruir_ventas.
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False
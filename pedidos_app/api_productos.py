@@ -0,0 +1,153 @@
+"""
+Cliente de la API externa de productos.
+
+Centraliza el acceso HTTP al catálogo: una sesión compartida con pool de
+conexiones keep-alive, la caché de productos del worker y la consulta concurrente
+de los SKUs de un pedido con concurrencia acotada y plazo máximo por pedido.
+Cada petición pasa por la guarda de ``resiliencia`` (circuito, tasa y concurrencia
+adaptativa), que puede rechazarla con ``APINoDisponible``. El consumidor asyncio
+usa ``consultar_api_async`` con un cliente httpx en lugar de la sesión de requests.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .cache import cache_productos
+from .errores import ErrorTransitorio
+from .metricas import MedicionTarea, registrar_llamada_api
+from .resiliencia import guarda_api
+
+CONFIG_API = {
+    'base_url': "https://fakestoreapi.com",
+    'timeout': 10,            # Segundos por petición individual.
+    'plazo_pedido': 20,       # Segundos máximos para enriquecer un pedido completo.
+    'max_concurrencia': 8,    # Peticiones simultáneas como máximo en todo el worker.
+    **getattr(settings, 'PEDIDOS_API_PRODUCTOS', {}),
+}
+API_BASE_URL = CONFIG_API['base_url']
+
+_session_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_executor = ThreadPoolExecutor(max_workers=CONFIG_API['max_concurrencia'], thread_name_prefix='api-productos')
+
+
+def get_session() -> requests.Session:
+    """Devuelve la sesión HTTP compartida, creándola la primera vez."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CONFIG_API['max_concurrencia'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def obtener_producto(product_id: str, medicion: Optional[MedicionTarea] = None) -> Optional[Dict[str, Any]]:
+    """
+    Obtiene los datos de un producto pasando primero por la caché del worker.
+
+    Las respuestas vacías o 404 se guardan como entradas negativas para no volver
+    a consultar SKUs inexistentes; los errores del servidor no se cachean y se
+    lanzan como ``ErrorTransitorio``.
+
+    Returns:
+        El diccionario del producto devuelto por la API, o None si no existe.
+    """
+    encontrado, api_data = cache_productos.obtener(product_id)
+    if encontrado:
+        return api_data
+    return _consultar_api(product_id, medicion)
+
+
+def _consultar_api(product_id: str, medicion: Optional[MedicionTarea] = None) -> Optional[Dict[str, Any]]:
+    """Consulta un producto en la API y guarda la respuesta en caché."""
+    with guarda_api.llamada() as resultado:
+        inicio = time.perf_counter()
+        try:
+            response = get_session().get(f"{API_BASE_URL}/products/{product_id}", timeout=CONFIG_API['timeout'])
+        except Exception:
+            registrar_llamada_api(time.perf_counter() - inicio, 'error', medicion)
+            raise
+        registrar_llamada_api(time.perf_counter() - inicio, response.status_code, medicion)
+        # Solo los errores del servidor y la limitación (429) cuentan contra la salud de la API.
+        resultado['exito'] = response.status_code < 500 and response.status_code != 429
+    return _interpretar_respuesta(product_id, response, resultado['exito'])
+
+
+async def consultar_api_async(cliente, product_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Versión de ``_consultar_api`` para el consumidor asyncio.
+
+    Usa un ``httpx.AsyncClient`` y la guarda asíncrona, y guarda la respuesta en
+    ``cache_productos`` igual que la versión síncrona.
+    """
+    async with guarda_api.llamada_async() as resultado:
+        inicio = time.perf_counter()
+        try:
+            response = await cliente.get(f"{API_BASE_URL}/products/{product_id}", timeout=CONFIG_API['timeout'])
+        except Exception:
+            registrar_llamada_api(time.perf_counter() - inicio, 'error')
+            raise
+        registrar_llamada_api(time.perf_counter() - inicio, response.status_code)
+        resultado['exito'] = response.status_code < 500 and response.status_code != 429
+    return _interpretar_respuesta(product_id, response, resultado['exito'])
+
+
+def _interpretar_respuesta(product_id: str, response, exito: bool) -> Optional[Dict[str, Any]]:
+    """Cachea la respuesta de la API (requests o httpx) y devuelve el producto, o None si no existe."""
+    if response.status_code == 200:
+        api_data = (response.json() if response.text else None) or None
+        cache_productos.guardar(product_id, api_data)
+        return api_data
+    if response.status_code == 404:
+        cache_productos.guardar(product_id, None)
+    elif not exito:
+        # Un 5xx o 429 no dice nada del producto: debe reintentarse, no tratarse como SKU inexistente.
+        raise ErrorTransitorio(f"La API de productos respondió {response.status_code} para el producto {product_id}.")
+    return None
+
+
+def obtener_productos(product_ids: Iterable[str], medicion: Optional[MedicionTarea] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Consulta concurrentemente un conjunto de productos, sin repetir IDs.
+
+    Los productos presentes en caché se resuelven sin pasar por el pool de hilos.
+    Las llamadas realizadas se anotan en ``medicion`` si se indica.
+    Si alguna consulta falla se relanza su excepción, y si el conjunto no termina
+    dentro de ``plazo_pedido`` se lanza ``TimeoutError`` para que Huey reintente.
+
+    Returns:
+        Un diccionario ``{product_id: datos o None}``.
+    """
+    resultados: Dict[str, Optional[Dict[str, Any]]] = {}
+    pendientes = []
+    for product_id in dict.fromkeys(product_ids):
+        encontrado, api_data = cache_productos.obtener(product_id)
+        if encontrado:
+            resultados[product_id] = api_data
+        else:
+            pendientes.append(product_id)
+
+    if len(pendientes) == 1:
+        resultados[pendientes[0]] = _consultar_api(pendientes[0], medicion)
+    elif pendientes:
+        futuros = {_executor.submit(_consultar_api, pid, medicion): pid for pid in pendientes}
+        hechos, no_hechos = wait(futuros, timeout=CONFIG_API['plazo_pedido'], return_when=FIRST_EXCEPTION)
+        # Tras el primer error o el plazo, las consultas que aún no empezaron se cancelan: el pedido ya ha
+        # fallado y no deben seguir ocupando el pool compartido, sus conexiones ni plazas de la guarda.
+        for futuro in no_hechos:
+            futuro.cancel()
+        for futuro in hechos:
+            resultados[futuros[futuro]] = futuro.result()  # Relanza el error de red si lo hubo.
+        if no_hechos:
+            raise TimeoutError(f"Plazo de enriquecimiento excedido para {len(no_hechos)} productos.")
+    return resultados
@@ -0,0 +1,165 @@
+"""
+Registro del historial de ejecución de tareas (TaskHistory).
+
+Ofrece dos modos configurables con ``PEDIDOS_AUDITORIA['modo']``:
+
+- ``sincrono``: cada transición se escribe inmediatamente en la base de datos.
+- ``buffer``: las transiciones se acumulan en memoria y un hilo en segundo plano
+  las vuelca con upserts masivos. Las transiciones de una misma tarea que aún no
+  se han volcado se fusionan, por lo que una tarea rápida cuesta una sola fila
+  dentro de un lote en lugar de varias escrituras sueltas compitiendo por el
+  bloqueo de SQLite.
+"""
+
+import atexit
+import copy
+import logging
+import socket
+import threading
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .estado_pedidos import invalidar_estados
+from .models import TaskHistory
+
+CONFIG_AUDITORIA = {
+    'modo': 'sincrono',
+    'max_buffer': 5000,       # Entradas pendientes como máximo antes de bloquear a los productores.
+    'tamano_flush': 500,      # Entradas que disparan un volcado anticipado.
+    'intervalo_flush': 1.0,   # Segundos entre volcados periódicos.
+    **getattr(settings, 'PEDIDOS_AUDITORIA', {}),
+}
+
+CAMPOS_ACTUALIZABLES = [
+    'task_name', 'status', 'start_time', 'end_time', 'error_message', 'worker_hostname', 'pedido', 'reintentos', 'metricas',
+    'clasificacion_error', 'id_pedido_original',
+]
+
+
+def guardar_historial(entradas: Iterable[TaskHistory]) -> None:
+    """Inserta o actualiza varias entradas del historial en una sola sentencia."""
+    entradas = list(entradas)
+    if entradas:
+        TaskHistory.objects.bulk_create(
+            entradas, update_conflicts=True, unique_fields=['task_id'], update_fields=CAMPOS_ACTUALIZABLES,
+        )
+        invalidar_estados(entrada.id_pedido_original for entrada in entradas)
+
+
+class EscritorAuditoria:
+    """
+    Buffer acotado de entradas del historial con volcado en segundo plano.
+
+    Si el buffer se llena, ``registrar`` bloquea al hilo productor hasta el
+    siguiente volcado, de modo que la memoria usada nunca supera ``max_buffer``.
+    """
+
+    def __init__(self, max_buffer: int = 5000, tamano_flush: int = 500, intervalo_flush: float = 1.0):
+        self.max_buffer = max_buffer
+        self.tamano_flush = tamano_flush
+        self.intervalo_flush = intervalo_flush
+        self._pendientes: Dict[str, TaskHistory] = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._detenido = False
+
+    def registrar(self, entrada: TaskHistory) -> None:
+        """Añade (o reemplaza) el estado actual de una tarea en el buffer."""
+        instantanea = copy.copy(entrada)
+        with self._cond:
+            self._iniciar_hilo()
+            while len(self._pendientes) >= self.max_buffer and entrada.task_id not in self._pendientes:
+                self._cond.notify_all()
+                self._cond.wait(timeout=self.intervalo_flush)
+            self._pendientes[entrada.task_id] = instantanea
+            if len(self._pendientes) >= self.tamano_flush:
+                self._cond.notify_all()
+
+    def flush(self) -> int:
+        """Vuelca todas las entradas pendientes. Devuelve el número de filas escritas."""
+        with self._flush_lock:
+            with self._cond:
+                lote, self._pendientes = self._pendientes, {}
+                self._cond.notify_all()
+            if not lote:
+                return 0
+            try:
+                guardar_historial(lote.values())
+            except Exception:
+                logging.exception(f"[Auditoria] Error al volcar {len(lote)} entradas del historial; se reintentará.")
+                with self._cond:
+                    for task_id, entrada in lote.items():
+                        self._pendientes.setdefault(task_id, entrada)
+                return 0
+            return len(lote)
+
+    def detener(self) -> None:
+        """Detiene el hilo de volcado tras escribir lo pendiente."""
+        with self._cond:
+            self._detenido = True
+            self._cond.notify_all()
+        if self._hilo is not None:
+            self._hilo.join(timeout=30)
+        self.flush()
+
+    def _iniciar_hilo(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detenido = False
+            self._hilo = threading.Thread(target=self._bucle, name='auditoria-flush', daemon=True)
+            self._hilo.start()
+
+    def _bucle(self) -> None:
+        while True:
+            with self._cond:
+                if not self._detenido and len(self._pendientes) < self.tamano_flush:
+                    self._cond.wait(timeout=self.intervalo_flush)
+                detenido = self._detenido
+            self.flush()
+            if detenido:
+                close_old_connections()
+                return
+
+
+escritor_auditoria = EscritorAuditoria(
+    max_buffer=CONFIG_AUDITORIA['max_buffer'],
+    tamano_flush=CONFIG_AUDITORIA['tamano_flush'],
+    intervalo_flush=CONFIG_AUDITORIA['intervalo_flush'],
+)
+# El worker lo detiene en su hook de apagado; esto cubre el resto de procesos (p. ej. modo inmediato).
+atexit.register(escritor_auditoria.detener)
+
+
+def iniciar_historial(task, id_pedido_original: Optional[int] = None) -> TaskHistory:
+    """
+    Registra el inicio (o el reintento) de una tarea.
+
+    En modo síncrono se hace con un único upsert que también resetea los campos
+    de una ejecución anterior; en modo buffer solo se anota en memoria.
+    """
+    entrada = TaskHistory(
+        task_id=task.id, task_name=task.name, status=TaskHistory.Status.STARTED,
+        worker_hostname=socket.gethostname(), start_time=timezone.now(),
+        reintentos=max(task.default_retries - task.retries, 0), id_pedido_original=id_pedido_original,
+    )
+    if CONFIG_AUDITORIA['modo'] == 'buffer':
+        escritor_auditoria.registrar(entrada)
+    else:
+        entrada, _ = TaskHistory.objects.update_or_create(
+            task_id=task.id,
+            defaults={field: getattr(entrada, field) for field in CAMPOS_ACTUALIZABLES},
+        )
+    return entrada
+
+
+def finalizar_historial(entrada: TaskHistory) -> None:
+    """Registra el estado final de una tarea."""
+    entrada.end_time = timezone.now()
+    if CONFIG_AUDITORIA['modo'] == 'buffer':
+        escritor_auditoria.registrar(entrada)
+    else:
+        entrada.save()
+        invalidar_estados([entrada.id_pedido_original])
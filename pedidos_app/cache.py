@@ -0,0 +1,121 @@
+"""
+Cachés en memoria compartidas entre los hilos del worker.
+
+El catálogo de la API externa tiene pocas decenas de SKUs que se repiten en casi
+todos los pedidos, por lo que cada worker mantiene una caché de productos con
+expiración por tiempo (TTL), desalojo LRU al alcanzar el tamaño máximo y entradas
+negativas para los productos que la API devuelve vacíos. La misma estructura se
+reutiliza para otros índices en memoria, como el de pedidos ya procesados.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from django.conf import settings
+
+from .metricas import registro
+
+
+class CacheLRU:
+    """
+    Caché LRU con TTL, segura para hilos.
+
+    Un valor ``None`` se almacena como entrada negativa (p. ej. el producto no existe)
+    y expira con su propio TTL, normalmente más corto que el de los positivos.
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl: float = 300.0, ttl_negativo: float = 60.0):
+        if max_entradas <= 0:
+            raise ValueError("max_entradas debe ser mayor que cero.")
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.aciertos_negativos = 0
+        self.fallos = 0
+        self.expirados = 0
+        self.desalojos = 0
+
+    def obtener(self, clave: Hashable) -> Tuple[bool, Optional[Any]]:
+        """
+        Busca una clave en la caché.
+
+        Returns:
+            Una tupla ``(encontrado, valor)``. Si ``encontrado`` es True y el valor
+            es None, se trata de una entrada negativa vigente.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return False, None
+            expira, valor = entrada
+            if expira <= ahora:
+                del self._datos[clave]
+                self.expirados += 1
+                self.fallos += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            if valor is None:
+                self.aciertos_negativos += 1
+            else:
+                self.aciertos += 1
+            return True, valor
+
+    def contiene(self, clave: Hashable) -> bool:
+        """Indica si hay una entrada vigente para la clave, sin alterar el orden LRU ni los contadores."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            return entrada is not None and entrada[0] > time.monotonic()
+
+    def guardar(self, clave: Hashable, valor: Optional[Any], ttl: Optional[float] = None) -> None:
+        """
+        Guarda un valor (o una entrada negativa si es None) desalojando el menos usado.
+
+        ``ttl`` sustituye al TTL por defecto de la caché para esta entrada.
+        """
+        if ttl is None:
+            ttl = self.ttl_negativo if valor is None else self.ttl
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Devuelve los contadores de uso para dimensionar la caché."""
+        with self._lock:
+            consultas = self.aciertos + self.aciertos_negativos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "aciertos_negativos": self.aciertos_negativos,
+                "fallos": self.fallos,
+                "expirados": self.expirados,
+                "desalojos": self.desalojos,
+                "tasa_aciertos": round((self.aciertos + self.aciertos_negativos) / consultas, 4) if consultas else 0.0,
+            }
+
+
+# Instancia compartida por todos los hilos del worker, configurable desde settings.
+cache_productos = CacheLRU(**getattr(settings, 'PEDIDOS_CACHE_PRODUCTOS', {}))
+
+registro.indicador(
+    'pedidos_cache_productos', 'Contadores y ocupación de la caché de productos del worker.',
+    lambda: {(campo,): valor for campo, valor in cache_productos.estadisticas().items()}, ['campo'],
+)
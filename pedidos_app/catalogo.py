@@ -0,0 +1,132 @@
+"""
+Réplica local del catálogo de productos.
+
+Una tarea periódica descarga el listado completo ``/products`` y actualiza la
+tabla ``Producto`` escribiendo solo las filas que cambiaron. El pipeline
+enriquece los pedidos consultando esa tabla por clave primaria, de modo que la
+API externa sale del camino crítico y el procesamiento continúa durante sus
+caídas. Los SKUs que no están en la réplica pueden consultarse en vivo
+(``PEDIDOS_CATALOGO['respaldo_api']``).
+"""
+
+import hashlib
+import json
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .api_productos import API_BASE_URL, CONFIG_API, get_session, obtener_productos
+from .metricas import MedicionTarea
+from .models import Producto
+from .resiliencia import guarda_api
+
+CONFIG_CATALOGO = {
+    'respaldo_api': True,     # Consultar en vivo los SKUs que no están en la réplica local.
+    'max_fraccion_retirados': 0.2,  # Fracción de productos activos que una sincronización puede desactivar.
+    **getattr(settings, 'PEDIDOS_CATALOGO', {}),
+}
+
+CAMPOS_ACTUALIZABLES = ['titulo', 'precio', 'datos', 'hash_datos', 'activo', 'fecha_actualizacion']
+
+
+def calcular_hash_producto(datos: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def descargar_catalogo() -> list:
+    """Descarga el listado completo de productos pasando por la guarda de la API."""
+    with guarda_api.llamada() as resultado:
+        response = get_session().get(f"{API_BASE_URL}/products", timeout=CONFIG_API['timeout'])
+        resultado['exito'] = response.status_code < 500 and response.status_code != 429
+    response.raise_for_status()
+    return response.json()
+
+
+def sincronizar_catalogo(productos: Optional[Iterable[Dict[str, Any]]] = None,
+                         forzar_retirados: bool = False) -> Dict[str, int]:
+    """
+    Actualiza la réplica local con el listado de la API.
+
+    Solo se escriben los productos nuevos o cuyos datos cambiaron; los que ya no
+    aparecen en el listado se marcan como inactivos. Si el listado viene vacío o
+    retiraría más de ``max_fraccion_retirados`` de los productos activos, se trata
+    como una respuesta truncada: se aplican las altas y los cambios, pero no se
+    desactiva nada (salvo con ``forzar_retirados``).
+
+    Args:
+        productos: Listado ya descargado; por defecto se descarga de la API.
+        forzar_retirados: Desactivar los productos ausentes aunque sean demasiados.
+
+    Returns:
+        Contadores ``creados``, ``actualizados``, ``desactivados``, ``retirados_omitidos``
+        y ``sin_cambios``.
+    """
+    if productos is None:
+        productos = descargar_catalogo()
+    existentes = {pk: (hash_datos, activo) for pk, hash_datos, activo
+                  in Producto.objects.values_list('id_producto', 'hash_datos', 'activo')}
+    ahora = timezone.now()
+    cambios, vistos, creados = [], set(), 0
+    for datos in productos:
+        try:
+            id_producto = int(datos['id'])
+            precio = Decimal(str(datos['price'])).quantize(Decimal('0.01'))
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            logging.warning(f"[Catalogo] Producto con formato inválido ignorado: {datos!r:.200}")
+            continue
+        vistos.add(id_producto)
+        hash_datos = calcular_hash_producto(datos)
+        if existentes.get(id_producto) == (hash_datos, True):
+            continue
+        creados += id_producto not in existentes
+        cambios.append(Producto(
+            id_producto=id_producto, titulo=str(datos.get('title', ''))[:255], precio=precio, datos=datos,
+            hash_datos=hash_datos, activo=True, fecha_actualizacion=ahora,
+        ))
+    retirados = [pk for pk, (_, activo) in existentes.items() if activo and pk not in vistos]
+    omitidos = 0
+    if retirados and not forzar_retirados:
+        activos = sum(1 for _, activo in existentes.values() if activo)
+        if not vistos or len(retirados) > CONFIG_CATALOGO['max_fraccion_retirados'] * activos:
+            # Un listado vacío o truncado desactivaría el catálogo y todos los pedidos fallarían por SKU inexistente.
+            logging.warning(f"[Catalogo] El listado retiraría {len(retirados)} de {activos} productos activos "
+                            f"({len(vistos)} recibidos): no se desactiva ninguno. Use forzar_retirados si es correcto.")
+            omitidos, retirados = len(retirados), []
+
+    with transaction.atomic():
+        if cambios:
+            Producto.objects.bulk_create(
+                cambios, batch_size=500, update_conflicts=True, unique_fields=['id_producto'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+        if retirados:
+            Producto.objects.filter(pk__in=retirados).update(activo=False, fecha_actualizacion=ahora)
+
+    return {
+        'creados': creados, 'actualizados': len(cambios) - creados, 'desactivados': len(retirados),
+        'retirados_omitidos': omitidos, 'sin_cambios': len(vistos) - len(cambios),
+    }
+
+
+def obtener_productos_catalogo(product_ids: Iterable[str], medicion: Optional[MedicionTarea] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Resuelve los productos de un pedido desde la réplica local.
+
+    Tiene la misma interfaz que ``api_productos.obtener_productos``. Los IDs que no
+    están en la réplica se consultan en la API si ``respaldo_api`` está activo; si
+    no, se devuelven como inexistentes (None).
+
+    Returns:
+        Un diccionario ``{product_id: datos o None}``.
+    """
+    ids = {pid: int(pid) for pid in dict.fromkeys(product_ids) if pid.isdigit()}
+    locales = dict(Producto.objects.filter(pk__in=ids.values(), activo=True).values_list('id_producto', 'datos'))
+    resultados = {pid: locales.get(id_numerico) for pid, id_numerico in ids.items()}
+    desconocidos = [pid for pid, datos in resultados.items() if datos is None]
+    if desconocidos and CONFIG_CATALOGO['respaldo_api']:
+        resultados.update(obtener_productos(desconocidos, medicion))
+    return resultados
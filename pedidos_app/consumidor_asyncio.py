@@ -0,0 +1,341 @@
+"""
+Consumidor de Huey basado en asyncio.
+
+Alternativa al consumidor de hilos para cargas dominadas por E/S: un único
+proceso desencola hasta ``max_en_vuelo`` tareas sobre un bucle de eventos.
+
+- Las consultas a la API de productos que necesitan los pedidos se adelantan con
+  un cliente HTTP asíncrono (httpx) y dejan las respuestas en ``cache_productos``,
+  así que las tareas esperan a la red sin ocupar un hilo cada una.
+- La ejecución de la tarea se delega a ``HUEY.execute`` en un pool acotado de
+  ``hilos_orm`` hilos (ORM y SQLite): como mucho ``hilos_orm`` tareas se ejecutan a
+  la vez y el resto espera a la red o a un hilo libre. La semántica de la cola, los reintentos, las
+  señales, los resultados y el historial (TaskHistory) es la misma que con el
+  consumidor de hilos: el código de las tareas no cambia.
+- Las tareas programadas y periódicas se encolan como en el ``Scheduler`` de Huey.
+
+Una tarea desencolada solo vive en memoria hasta que termina. Si el proceso
+muere sin detenerse ordenadamente (SIGKILL, caída) se pierden todas las que tenía,
+igual que las que ejecutan los workers del consumidor de hilos. Por eso
+``max_en_vuelo`` es por defecto ``4 × hilos_orm``: suficiente para solapar la red
+con la ejecución sin vaciar la cola persistente en la memoria del proceso.
+
+httpx es una dependencia opcional: sin ella el consumidor funciona igual, pero
+cada tarea consulta la API al ejecutarse.
+
+Si la consulta adelantada falla o es rechazada por la guarda de la API, la tarea se
+ejecuta igualmente y repite la consulta por la vía síncrona, que aplica la
+clasificación de errores y los aplazamientos habituales.
+
+Se activa con ``HUEY['consumer']['worker_type'] = 'asyncio'`` (comando ``run_huey``).
+"""
+
+import asyncio
+import importlib.util
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from huey.exceptions import ConfigurationError
+
+from .api_productos import CONFIG_API, consultar_api_async
+from .cache import cache_productos
+from .catalogo import CONFIG_CATALOGO
+from .esquema import esquema_pedido
+from .metricas import registro
+from .models import Producto
+from .resiliencia import CONFIG_RESILIENCIA
+from .tasks import extraer_product_ids, procesar_pedido_completo, procesar_pedidos_lote
+
+CONFIG_CONSUMIDOR_ASYNCIO = {
+    'max_en_vuelo': None,    # Tareas desencoladas a la vez (esperando red, un hilo o ejecutándose); None = 4 × hilos_orm.
+    'hilos_orm': 8,          # Hilos que ejecutan las tareas (ORM y SQLite).
+    'precarga_api': None,    # Adelantar con httpx las consultas a la API (None = solo si httpx está instalado).
+    **getattr(settings, 'PEDIDOS_CONSUMIDOR_ASYNCIO', {}),
+}
+
+# Tareas desencoladas por hilo ORM cuando no se configura max_en_vuelo.
+FACTOR_EN_VUELO = 4
+
+# Segundos entre comprobaciones de tareas periódicas, como en huey.consumer.Scheduler.
+INTERVALO_PERIODICAS = 60
+
+logger = logging.getLogger('huey.consumer')
+
+
+def _pedidos_de_tarea(task) -> List[Any]:
+    """Payloads de pedido que recibe una tarea del pipeline."""
+    if isinstance(task, procesar_pedido_completo.task_class):
+        datos = task.args[0] if task.args else task.kwargs.get('pedido_data')
+        return [datos]
+    if isinstance(task, procesar_pedidos_lote.task_class):
+        datos = task.args[0] if task.args else task.kwargs.get('pedidos')
+        return datos if isinstance(datos, list) else []
+    return []
+
+
+def _httpx_disponible() -> bool:
+    # Solo comprueba que está instalado: el módulo se importa al abrir el cliente HTTP.
+    return importlib.util.find_spec('httpx') is not None
+
+
+def _productos_en_replica(ids: Iterable[str]) -> set:
+    return {str(pk) for pk in Producto.objects.filter(pk__in=[int(pid) for pid in ids], activo=True)
+            .values_list('id_producto', flat=True)}
+
+
+class ConsumidorAsyncio:
+    """
+    Consumidor de una cola de Huey sobre un bucle de eventos.
+
+    Expone la misma interfaz que ``huey.consumer.Consumer`` (``run``, ``start`` y
+    ``stop``) para poder sustituirlo en el comando ``run_huey`` y en las pruebas de carga.
+    """
+
+    def __init__(self, huey, periodic: bool = True, initial_delay: float = 0.1, backoff: float = 1.15,
+                 max_delay: float = 10.0, scheduler_interval: int = 1, flush_locks: bool = False,
+                 extra_locks: Optional[str] = None, max_en_vuelo: Optional[int] = None,
+                 hilos_orm: Optional[int] = None, precarga_api: Optional[bool] = None):
+        self.huey = huey
+        self.periodic = periodic
+        self.initial_delay = initial_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.scheduler_interval = max(min(scheduler_interval, 60), 1)
+        self.hilos_orm = hilos_orm or CONFIG_CONSUMIDOR_ASYNCIO['hilos_orm']
+        self.max_en_vuelo = (max_en_vuelo or CONFIG_CONSUMIDOR_ASYNCIO['max_en_vuelo']
+                             or FACTOR_EN_VUELO * self.hilos_orm)
+        if precarga_api is None:
+            precarga_api = CONFIG_CONSUMIDOR_ASYNCIO['precarga_api']
+        if precarga_api is None:
+            precarga_api = _httpx_disponible()
+            if not precarga_api:
+                logger.warning("[Consumidor asyncio] httpx no está instalado: las consultas a la API no se "
+                               "adelantan y cada tarea las hace al ejecutarse (pip install httpx para activarlas).")
+        elif precarga_api and not _httpx_disponible():
+            raise ImproperlyConfigured(
+                "PEDIDOS_CONSUMIDOR_ASYNCIO['precarga_api'] necesita httpx (pip install httpx); "
+                "use None para activarla solo si está instalado.")
+        self.precarga_api = precarga_api
+
+        self.en_vuelo = 0
+        self.precargas = 0
+        self._consultas: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._detener: Optional[asyncio.Event] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._arrancado = threading.Event()
+
+        if flush_locks or extra_locks:
+            flushed = huey.flush_locks(*(extra_locks.split(',') if extra_locks else ()))
+            if flushed:
+                logger.warning(f"[Consumidor asyncio] Locks obsoletos liberados: {', '.join(flushed)}")
+
+    # --- Interfaz de huey.consumer.Consumer ---
+
+    def run(self) -> None:
+        """Ejecuta el consumidor en el hilo actual hasta recibir SIGINT o SIGTERM."""
+        self._comprobar_huey()
+        asyncio.run(self._principal(senales=True))
+        self.huey.notify_interrupted_tasks()
+        logger.info("[Consumidor asyncio] Consumidor detenido.")
+
+    def start(self) -> None:
+        """Arranca el consumidor en un hilo en segundo plano."""
+        self._comprobar_huey()
+        self._hilo = threading.Thread(target=asyncio.run, args=(self._principal(),), name='consumidor-asyncio',
+                                      daemon=True)
+        self._hilo.start()
+        self._arrancado.wait()
+
+    def stop(self, graceful: bool = False) -> None:
+        """Deja de desencolar; con ``graceful`` espera a que terminen las tareas en curso."""
+        if self._loop is not None and self._detener is not None:
+            self._loop.call_soon_threadsafe(self._detener.set)
+        if graceful and self._hilo is not None:
+            self._hilo.join()
+
+    # --- Bucle de eventos ---
+
+    def _comprobar_huey(self) -> None:
+        if self.huey.immediate:
+            raise ConfigurationError('El consumidor no puede ejecutarse con HUEY en modo "immediate".')
+
+    async def _principal(self, senales: bool = False) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._detener = asyncio.Event()
+        self._arrancado.set()
+        if senales:
+            for senal in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(senal, self._al_recibir_senal, senal)
+        self._plazas = asyncio.Semaphore(self.max_en_vuelo)
+        self._tareas = set()
+        # Un hilo propio para leer la cola, para que desencolar no espere a los hilos del ORM.
+        self._cola = ThreadPoolExecutor(1, thread_name_prefix='huey-cola')
+        self._orm = ThreadPoolExecutor(self.hilos_orm, thread_name_prefix='huey-orm',
+                                       initializer=self._ejecutar_hooks, initargs=(self.huey._startup, 'startup'))
+        self._http = None
+        if self.precarga_api:
+            import httpx
+            self._http = httpx.AsyncClient(
+                timeout=CONFIG_API['timeout'],
+                limits=httpx.Limits(max_connections=CONFIG_RESILIENCIA['concurrencia_max']),
+            )
+        logger.info(f"[Consumidor asyncio] Iniciado: hasta {self.max_en_vuelo} tareas desencoladas, "
+                    f"{self.hilos_orm} hilos ORM, precarga de la API {'activa' if self._http else 'inactiva'}.")
+
+        programador = asyncio.create_task(self._programador())
+        try:
+            await self._bucle_cola()
+        finally:
+            programador.cancel()
+            if self._tareas:
+                logger.info(f"[Consumidor asyncio] Esperando a {len(self._tareas)} tareas en curso...")
+                await asyncio.gather(*self._tareas, return_exceptions=True)
+            if self._http is not None:
+                await self._http.aclose()
+            await self._loop.run_in_executor(self._orm, self._ejecutar_hooks, self.huey._shutdown, 'shutdown')
+            self._orm.shutdown()
+            self._cola.shutdown()
+
+    def _al_recibir_senal(self, senal: int) -> None:
+        logger.info(f"[Consumidor asyncio] Recibida {signal.Signals(senal).name}: deteniendo tras las tareas en curso.")
+        self._detener.set()
+
+    async def _esperar(self, segundos: float) -> None:
+        """Duerme ``segundos`` o hasta que se pida detener el consumidor."""
+        try:
+            await asyncio.wait_for(self._detener.wait(), segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _bucle_cola(self) -> None:
+        espera = self.initial_delay
+        while not self._detener.is_set():
+            await self._plazas.acquire()
+            if self._detener.is_set():
+                self._plazas.release()
+                break
+            try:
+                task = await self._loop.run_in_executor(self._cola, self.huey.dequeue)
+            except Exception:
+                logger.exception("[Consumidor asyncio] Error al leer de la cola.")
+                task = None
+            if task is None:
+                self._plazas.release()
+                await self._esperar(espera)
+                espera = min(espera * self.backoff, self.max_delay)
+                continue
+            espera = self.initial_delay
+            tarea = asyncio.create_task(self._ejecutar(task))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _ejecutar(self, task) -> None:
+        self.en_vuelo += 1
+        try:
+            if self._http is not None and self.huey.ready_to_run(task):
+                await self._precargar(task)
+            await self._loop.run_in_executor(self._orm, self.huey.execute, task)
+        except Exception:
+            logger.exception(f"[Consumidor asyncio] Error no controlado al ejecutar la tarea {task.id}.")
+        finally:
+            self.en_vuelo -= 1
+            self._plazas.release()
+
+    async def _programador(self) -> None:
+        """Encola las tareas programadas que ya vencieron y, cada minuto, las periódicas."""
+        siguiente_periodica = time.monotonic()
+        while not self._detener.is_set():
+            periodicas = self.periodic and time.monotonic() >= siguiente_periodica
+            if periodicas:
+                siguiente_periodica += INTERVALO_PERIODICAS
+            try:
+                await self._loop.run_in_executor(self._cola, self._encolar_programadas, periodicas)
+            except Exception:
+                logger.exception("[Consumidor asyncio] Error al leer las tareas programadas.")
+            await self._esperar(self.scheduler_interval)
+
+    def _encolar_programadas(self, periodicas: bool) -> None:
+        ahora = self.huey._get_timestamp()
+        for task in self.huey.read_schedule(ahora):
+            self.huey.enqueue(task)
+        if periodicas:
+            for task in self.huey.read_periodic(ahora):
+                logger.info(f"[Consumidor asyncio] Encolando la tarea periódica {task}.")
+                self.huey.enqueue(task)
+
+    @staticmethod
+    def _ejecutar_hooks(hooks: Dict[str, Any], tipo: str) -> None:
+        for nombre, hook in hooks.items():
+            try:
+                hook()
+            except Exception:
+                logger.exception(f"[Consumidor asyncio] Falló el hook de {tipo} '{nombre}'.")
+
+    # --- Consultas adelantadas a la API ---
+
+    async def _precargar(self, task) -> None:
+        """
+        Deja en ``cache_productos`` los productos del pedido que la tarea pediría a la API.
+
+        Nunca lanza excepciones: cualquier fallo se resuelve después por la vía síncrona.
+        """
+        if not CONFIG_CATALOGO['respaldo_api']:
+            return
+        ids = {pid for pedido in _pedidos_de_tarea(task) if not esquema_pedido.errores(pedido)
+               for pid in extraer_product_ids(pedido) if pid}
+        ids = [pid for pid in ids if not cache_productos.contiene(pid)]
+        if not ids:
+            return
+        try:
+            locales = await self._loop.run_in_executor(self._orm, _productos_en_replica, ids)
+        except Exception:
+            logger.exception("[Consumidor asyncio] Error al consultar la réplica del catálogo.")
+            return
+        consultas = [self._consulta(pid) for pid in ids if pid not in locales]
+        if consultas:
+            # Las consultas se comparten entre tareas: si vence el plazo no se cancelan, solo se deja de esperar.
+            await asyncio.wait(consultas, timeout=CONFIG_API['plazo_pedido'])
+
+    def _consulta(self, product_id: str) -> asyncio.Future:
+        """Devuelve la consulta en curso de un producto, iniciándola si no la hay."""
+        consulta = self._consultas.get(product_id)
+        if consulta is None:
+            consulta = asyncio.ensure_future(consultar_api_async(self._http, product_id))
+            self._consultas[product_id] = consulta
+            self.precargas += 1
+            consulta.add_done_callback(lambda c: self._fin_consulta(product_id, c))
+        return consulta
+
+    def _fin_consulta(self, product_id: str, consulta: asyncio.Future) -> None:
+        self._consultas.pop(product_id, None)
+        if not consulta.cancelled() and consulta.exception() is not None:
+            logger.debug(f"[Consumidor asyncio] Precarga del producto {product_id} fallida: {consulta.exception()!r}")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {'en_vuelo': self.en_vuelo, 'consultas_api_en_curso': len(self._consultas),
+                'precargas': self.precargas}
+
+
+_consumidor_activo: Optional[ConsumidorAsyncio] = None
+
+
+def crear_consumidor(huey, **opciones) -> ConsumidorAsyncio:
+    """Crea el consumidor del proceso y publica sus contadores en el registro de métricas."""
+    global _consumidor_activo
+    _consumidor_activo = ConsumidorAsyncio(huey, **opciones)
+    return _consumidor_activo
+
+
+registro.indicador(
+    'pedidos_consumidor_asyncio', 'Tareas en curso y consultas adelantadas del consumidor asyncio.',
+    lambda: {(campo,): valor for campo, valor in _consumidor_activo.estadisticas().items()}
+    if _consumidor_activo else {},
+    ['campo'],
+)
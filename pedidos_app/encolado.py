@@ -0,0 +1,88 @@
+"""
+Encolado masivo de pedidos en Huey.
+
+Encolar con ``procesar_pedido_completo(pedido)`` abre una transacción de escritura
+en huey.db por cada pedido. Para las ráfagas de pedidos se serializan las tareas
+en memoria y se insertan por lotes en una única transacción por lote.
+
+Opcionalmente los pedidos se agrupan en micro-lotes de ``procesar_pedidos_lote``
+para que cada tarea del consumidor procese varios pedidos a la vez.
+
+Todas las tareas se crean aquí: llevan la prioridad de su carril y turno de
+cliente (ver ``prioridad``) y el instante de encolado para medir la espera en cola.
+"""
+
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from huey.contrib.djhuey import HUEY
+from huey.storage import SqliteStorage, to_blob
+
+from .prioridad import prioridad_lote, prioridad_pedido
+from .tasks import procesar_pedido_completo, procesar_pedidos_lote
+
+TAMANO_LOTE_ENCOLADO = 500
+# Pedidos por tarea: 1 encola una procesar_pedido_completo por pedido; N > 1 agrupa en procesar_pedidos_lote.
+PEDIDOS_POR_TAREA = getattr(settings, 'PEDIDOS_POR_TAREA', 1)
+
+
+def encolar_pedidos(pedidos: Iterable[Dict[str, Any]], tamano_lote: int = TAMANO_LOTE_ENCOLADO,
+                    pedidos_por_tarea: Optional[int] = None) -> int:
+    """
+    Encola pedidos ya validados escribiendo en la cola por lotes.
+
+    Si Huey está en modo inmediato o usa un almacenamiento distinto de SQLite,
+    se recurre al encolado estándar tarea por tarea.
+
+    Args:
+        pedidos: Pedidos a encolar.
+        tamano_lote: Número máximo de tareas insertadas por transacción.
+        pedidos_por_tarea: Pedidos agrupados en cada tarea; por defecto ``PEDIDOS_POR_TAREA``.
+
+    Returns:
+        El número de pedidos encolados.
+    """
+    pedidos_por_tarea = pedidos_por_tarea or PEDIDOS_POR_TAREA
+    total = 0
+    filas: List[tuple] = []
+    for tarea, cantidad in _crear_tareas(pedidos, pedidos_por_tarea):
+        total += cantidad
+        if HUEY.immediate or not isinstance(HUEY.storage, SqliteStorage):
+            HUEY.enqueue(tarea)
+            continue
+        filas.append((HUEY.storage.name, to_blob(HUEY.serialize_task(tarea)), tarea.priority or 0))
+        if len(filas) >= tamano_lote:
+            _insertar_lote(filas)
+            filas = []
+    if filas:
+        _insertar_lote(filas)
+    return total
+
+
+def encolar_pedido(pedido: Dict[str, Any]):
+    """Encola un único pedido ya validado (con su prioridad) y devuelve el resultado de Huey."""
+    return HUEY.enqueue(crear_tarea(pedido))
+
+
+def crear_tarea(pedido: Dict[str, Any]):
+    """Tarea ``procesar_pedido_completo`` de un pedido, con su prioridad y el instante de encolado."""
+    return procesar_pedido_completo.s(pedido, encolado_en=time.time(), priority=prioridad_pedido(pedido))
+
+
+def _crear_tareas(pedidos: Iterable[Dict[str, Any]], pedidos_por_tarea: int) -> Iterator[tuple]:
+    """Genera las tareas a encolar junto con el número de pedidos que contiene cada una."""
+    if pedidos_por_tarea <= 1:
+        for pedido in pedidos:
+            yield crear_tarea(pedido), 1
+        return
+    iterador = iter(pedidos)
+    while grupo := list(islice(iterador, pedidos_por_tarea)):
+        yield procesar_pedidos_lote.s(grupo, encolado_en=time.time(), priority=prioridad_lote(grupo)), len(grupo)
+
+
+def _insertar_lote(filas: List[tuple]) -> int:
+    with HUEY.storage.db(commit=True) as curs:
+        curs.executemany('insert into task (queue, data, priority) values (?, ?, ?)', filas)
+    return len(filas)
@@ -0,0 +1,72 @@
+"""
+Clasificación de errores del pipeline y política de reintentos.
+
+- Errores permanentes (datos inválidos, SKUs que no se pueden enriquecer): nunca
+  tendrán éxito, así que la tarea pasa directamente a ERROR sin reintentos.
+- Errores transitorios (red, 5xx, timeouts, bloqueos de SQLite): se reintentan
+  con espera exponencial con jitter y un tope.
+
+Los errores no reconocidos se tratan como transitorios para no perder pedidos.
+"""
+
+import logging
+import random
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, OperationalError
+
+CONFIG_REINTENTOS = {
+    'max_reintentos': 5,     # Reintentos de Huey para errores transitorios.
+    'espera_base': 2.0,      # Segundos de espera antes del primer reintento.
+    'espera_maxima': 300.0,  # Tope de la espera entre reintentos.
+    **getattr(settings, 'PEDIDOS_REINTENTOS', {}),
+}
+
+PERMANENTE = 'permanente'
+TRANSITORIO = 'transitorio'
+
+
+class ErrorPermanente(ValueError):
+    """Error en los datos del pedido que no se resuelve reintentando."""
+
+
+class ErrorTransitorio(Exception):
+    """Error temporal de una dependencia (API, base de datos) que merece reintento."""
+
+
+def clasificar_error(error: BaseException) -> str:
+    """Devuelve ``PERMANENTE`` o ``TRANSITORIO`` para una excepción del pipeline."""
+    # Va primero: requests.JSONDecodeError (p. ej. una página HTML de un 502) también es un ValueError.
+    if isinstance(error, (ErrorTransitorio, requests.RequestException, OperationalError, TimeoutError, OSError)):
+        return TRANSITORIO
+    if isinstance(error, (ErrorPermanente, IntegrityError, ValueError, TypeError, KeyError)):
+        return PERMANENTE
+    return TRANSITORIO
+
+
+def calcular_espera(intento: int) -> float:
+    """Espera exponencial con jitter ("equal jitter") para el reintento número ``intento`` (desde 0)."""
+    espera = min(CONFIG_REINTENTOS['espera_maxima'], CONFIG_REINTENTOS['espera_base'] * 2 ** intento)
+    return espera / 2 + random.uniform(0, espera / 2)
+
+
+def aplicar_politica_reintento(task, error: BaseException) -> str:
+    """
+    Ajusta los reintentos de la tarea de Huey en curso según el tipo de error.
+
+    Un error permanente anula los reintentos pendientes; uno transitorio fija la
+    espera del siguiente reintento. Huey lee ambos valores de la tarea al
+    reencolarla tras la excepción.
+
+    Returns:
+        La clasificación del error.
+    """
+    clasificacion = clasificar_error(error)
+    if clasificacion == PERMANENTE:
+        task.retries = 0
+    elif task.retries:
+        task.retry_delay = calcular_espera(max(task.default_retries - task.retries, 0))
+        logging.info(f"[Reintentos] {task.id}: error transitorio, reintento en {task.retry_delay:.1f}s "
+                     f"({task.retries} restantes).")
+    return clasificacion
@@ -0,0 +1,131 @@
+"""
+Esquema de validación de los pedidos de entrada.
+
+El esquema se construye una sola vez al importar el módulo (patrón de SKU
+compilado y límites leídos de ``PEDIDOS_ESQUEMA``) y se aplica en todos los
+puntos de entrada antes de escribir en la cola (vista de simulación, carga
+masiva, comando de ingesta) y de nuevo en el worker. Así un pedido inválido se
+rechaza al instante con errores estructurados por campo, sin costar una
+escritura en huey.db ni un hilo del worker.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .errores import ErrorPermanente
+from .prioridad import CONFIG_PRIORIDAD
+
+CONFIG_ESQUEMA = {
+    'patron_sku': r'^[A-Za-z]{1,10}[0-9]{1,9}$',   # Letras seguidas del ID numérico del producto.
+    'max_productos': 100,                          # Líneas por pedido.
+    'max_cantidad': 10000,                         # Unidades por línea.
+    'max_longitud_cliente': 255,                   # Igual que PedidoProcesado.cliente.
+    **getattr(settings, 'PEDIDOS_ESQUEMA', {}),
+}
+
+# Rango de models.IntegerField, la clave primaria de PedidoProcesado.
+MAX_ID_PEDIDO = 2 ** 31 - 1
+
+
+class ErrorValidacion(ErrorPermanente):
+    """Pedido que no cumple el esquema. ``errores`` contiene un dict por campo inválido."""
+
+    def __init__(self, errores: List[Dict[str, str]]):
+        self.errores = errores
+        super().__init__("; ".join(f"{e['campo']}: {e['error']}" if e['campo'] else e['error'] for e in errores))
+
+
+def _es_entero(valor: Any) -> bool:
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def id_pedido_valido(valor: Any) -> Optional[int]:
+    """Devuelve ``valor`` si es un ID de pedido válido según el esquema, o None."""
+    return valor if _es_entero(valor) and 0 < valor <= MAX_ID_PEDIDO else None
+
+
+class EsquemaPedido:
+    """Validador de pedidos con el patrón de SKU y los límites ya preparados."""
+
+    def __init__(self, patron_sku: str, max_productos: int, max_cantidad: int, max_longitud_cliente: int,
+                 carriles: tuple = ()):
+        self.patron_sku = re.compile(patron_sku)
+        self.max_productos = max_productos
+        self.max_cantidad = max_cantidad
+        self.max_longitud_cliente = max_longitud_cliente
+        self.carriles = carriles
+
+    def errores(self, pedido: Any) -> List[Dict[str, str]]:
+        """Devuelve la lista de errores del pedido (vacía si es válido)."""
+        if not isinstance(pedido, dict):
+            return [{'campo': '', 'error': "El pedido debe ser un objeto JSON."}]
+        errores = []
+
+        def error(campo, mensaje):
+            errores.append({'campo': campo, 'error': mensaje})
+
+        pedido_id = pedido.get('id')
+        if pedido_id is None:
+            error('id', "Campo obligatorio.")
+        elif not _es_entero(pedido_id) or not 0 < pedido_id <= MAX_ID_PEDIDO:
+            error('id', f"Debe ser un entero entre 1 y {MAX_ID_PEDIDO}.")
+
+        cliente = pedido.get('cliente')
+        if cliente is None:
+            error('cliente', "Campo obligatorio.")
+        elif not isinstance(cliente, str) or not cliente.strip():
+            error('cliente', "Debe ser un texto no vacío.")
+        elif len(cliente) > self.max_longitud_cliente:
+            error('cliente', f"Supera los {self.max_longitud_cliente} caracteres.")
+
+        productos = pedido.get('productos')
+        if productos is None:
+            error('productos', "Campo obligatorio.")
+        elif not isinstance(productos, list) or not productos:
+            error('productos', "Debe ser una lista no vacía.")
+        elif len(productos) > self.max_productos:
+            error('productos', f"Supera el máximo de {self.max_productos} líneas.")
+        else:
+            for i, linea in enumerate(productos):
+                campo = f'productos[{i}]'
+                if not isinstance(linea, dict):
+                    error(campo, "Debe ser un objeto con 'sku' y 'cantidad'.")
+                    continue
+                sku = linea.get('sku')
+                if not isinstance(sku, str) or not self.patron_sku.match(sku):
+                    error(f'{campo}.sku', "SKU ausente o con formato inválido.")
+                cantidad = linea.get('cantidad')
+                if not _es_entero(cantidad) or not 0 < cantidad <= self.max_cantidad:
+                    error(f'{campo}.cantidad', f"Debe ser un entero entre 1 y {self.max_cantidad}.")
+
+        # Carril de prioridad explícito (opcional); sin él se decide por el tamaño del pedido.
+        prioridad = pedido.get('prioridad')
+        if prioridad is not None and prioridad not in self.carriles:
+            error('prioridad', f"Debe ser uno de: {', '.join(self.carriles)}.")
+        return errores
+
+    def validar(self, pedido: Any) -> None:
+        """
+        Raises:
+            ErrorValidacion: Si el pedido no cumple el esquema.
+        """
+        errores = self.errores(pedido)
+        if errores:
+            raise ErrorValidacion(errores)
+
+
+esquema_pedido = EsquemaPedido(**CONFIG_ESQUEMA, carriles=tuple(CONFIG_PRIORIDAD['carriles']))
+
+
+def validar_pedido(pedido_data: Any) -> None:
+    """
+    Valida un pedido contra el esquema (Etapa A).
+
+    Se reutiliza tanto en el worker como en los puntos de entrada que encolan pedidos.
+
+    Raises:
+        ErrorValidacion: Si el pedido no cumple el esquema.
+    """
+    esquema_pedido.validar(pedido_data)
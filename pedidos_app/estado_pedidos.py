@@ -0,0 +1,176 @@
+"""
+Consulta del estado de los pedidos para los clientes que sondean su resultado.
+
+El estado de un pedido se calcula con dos búsquedas por índice: su última
+ejecución en ``TaskHistory`` (índice ``id_pedido_original, start_time``) y su
+``PedidoProcesado`` por clave primaria. Los estados se guardan en una caché LRU
+del proceso:
+
+- Los estados finales (``procesado``, ``fallido``) no cambian salvo que el pedido
+  se reprocese, así que se guardan ``ttl_final`` segundos. Como el historial lo
+  escriben los workers y no el servidor web, cada ``ttl_pendiente`` segundos se
+  comprueba que el pedido no tenga una ejecución posterior a la que produjo el
+  estado: una sola consulta, resuelta solo con el índice, para todos los estados
+  finales de la petición. Así ningún estado se sirve con más de ``ttl_pendiente``
+  segundos de retraso.
+- Los demás (``sin_registro``, ``en_proceso``, ``reintentando``) solo
+  ``ttl_pendiente`` segundos, de modo que un sondeo cada segundo cuesta como
+  mucho una consulta por pedido y segundo en cada proceso.
+
+Cuando una tarea escribe su historial en este mismo proceso (modo inmediato o
+worker), las entradas de sus pedidos se invalidan además en ese momento.
+
+Cada estado lleva su ETag, calculado una sola vez al guardarlo en la caché: una
+respuesta 304 no serializa nada.
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+
+from .cache import CacheLRU
+from .errores import CONFIG_REINTENTOS, TRANSITORIO
+from .metricas import registro
+from .models import PedidoProcesado, TaskHistory
+
+CONFIG_ESTADO_PEDIDOS = {
+    'max_entradas': 10000,              # Pedidos en la caché de estados de cada proceso.
+    'ttl_final': 300.0,                 # Segundos para los estados procesado y fallido.
+    'ttl_pendiente': 1.0,               # Segundos para los estados que aún pueden cambiar.
+    'max_ids': 100,                     # Pedidos por consulta en lote.
+    **getattr(settings, 'PEDIDOS_ESTADO', {}),
+}
+
+PROCESADO = 'procesado'
+FALLIDO = 'fallido'
+EN_PROCESO = 'en_proceso'
+REINTENTANDO = 'reintentando'
+SIN_REGISTRO = 'sin_registro'   # Aún en la cola o no recibido.
+ESTADOS_FINALES = (PROCESADO, FALLIDO)
+
+cache_estados = CacheLRU(max_entradas=CONFIG_ESTADO_PEDIDOS['max_entradas'], ttl=CONFIG_ESTADO_PEDIDOS['ttl_final'],
+                         ttl_negativo=CONFIG_ESTADO_PEDIDOS['ttl_pendiente'])
+
+registro.indicador(
+    'pedidos_cache_estados', 'Contadores y ocupación de la caché de estados de pedidos.',
+    lambda: {(campo,): valor for campo, valor in cache_estados.estadisticas().items()}, ['campo'],
+)
+
+CAMPOS_HISTORIAL = ('id_pedido_original', 'status', 'error_message', 'clasificacion_error', 'reintentos',
+                    'start_time', 'end_time')
+CAMPOS_PEDIDO = ('id_pedido_original', 'cliente', 'subtotal', 'descuento', 'total_final', 'fecha_procesado')
+
+
+def _calcular_estado(pedido_id: int, historial: Optional[Dict[str, Any]],
+                     pedido: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    status = historial['status'] if historial else None
+    if status == TaskHistory.Status.STARTED:
+        estado = EN_PROCESO
+    elif pedido is not None or status in (TaskHistory.Status.SUCCESS, TaskHistory.Status.SKIPPED):
+        estado = PROCESADO
+    elif status == TaskHistory.Status.ERROR:
+        # Un error transitorio sigue en manos de Huey hasta agotar los reintentos (los aplazamientos no los consumen).
+        pendiente = (historial['clasificacion_error'] == TRANSITORIO
+                     and historial['reintentos'] < CONFIG_REINTENTOS['max_reintentos'])
+        estado = REINTENTANDO if pendiente else FALLIDO
+    else:
+        estado = SIN_REGISTRO
+
+    resultado = {'id': pedido_id, 'estado': estado}
+    if pedido is not None:
+        resultado.update({campo: pedido[campo] for campo in CAMPOS_PEDIDO if campo != 'id_pedido_original'})
+    if historial is not None:
+        resultado['ultima_ejecucion'] = {
+            'inicio': historial['start_time'], 'fin': historial['end_time'], 'reintentos': historial['reintentos'],
+        }
+        if historial['error_message']:
+            resultado['ultimo_error'] = {'mensaje': historial['error_message'],
+                                         'clasificacion': historial['clasificacion_error']}
+    return resultado
+
+
+def _cargar(ids: List[int]) -> Dict[int, tuple]:
+    """Calcula desde la base de datos el estado de ``ids`` y lo guarda en la caché con su ETag."""
+    ultimos: Dict[int, Dict[str, Any]] = {}
+    # Por orden de inicio: la última ejecución de cada pedido sobrescribe a las anteriores.
+    for fila in (TaskHistory.objects.filter(id_pedido_original__in=ids)
+                 .order_by('id_pedido_original', 'start_time').values(*CAMPOS_HISTORIAL)):
+        ultimos[fila['id_pedido_original']] = fila
+    pedidos = {fila['id_pedido_original']: fila
+               for fila in PedidoProcesado.objects.filter(pk__in=ids).values(*CAMPOS_PEDIDO)}
+
+    cargados = {}
+    for pedido_id in ids:
+        historial = ultimos.get(pedido_id)
+        estado = _calcular_estado(pedido_id, historial, pedidos.get(pedido_id))
+        cuerpo = json.dumps(estado, cls=DjangoJSONEncoder, sort_keys=True)
+        etag = hashlib.sha1(cuerpo.encode()).hexdigest()[:20]
+        final = estado['estado'] in ESTADOS_FINALES
+        # Con el inicio de la ejecución que produjo el estado y el instante de la comprobación: si el estado es
+        # final, permiten detectar después una ejecución posterior hecha en otro proceso.
+        marca = historial['start_time'] if historial else None
+        cache_estados.guardar(pedido_id, (estado, etag, marca, time.monotonic()),
+                              ttl=CONFIG_ESTADO_PEDIDOS['ttl_final' if final else 'ttl_pendiente'])
+        cargados[pedido_id] = (estado, etag)
+    return cargados
+
+
+def _vigentes(finales: Dict[int, Optional[datetime]]) -> List[int]:
+    """IDs de ``finales`` (``{id: marca}``) cuyo estado sigue vigente: sin ejecuciones posteriores."""
+    ultimas = dict(TaskHistory.objects.filter(id_pedido_original__in=list(finales))
+                   .values('id_pedido_original').annotate(ultima=Max('start_time'))
+                   .values_list('id_pedido_original', 'ultima'))
+    return [pedido_id for pedido_id, marca in finales.items() if ultimas.get(pedido_id) == marca]
+
+
+def consultar_estados(ids: Iterable[int]) -> Dict[int, tuple]:
+    """
+    Devuelve ``{id: (estado, etag)}`` para los pedidos indicados, en el mismo orden.
+
+    Las entradas vigentes salen de la caché; el resto se calcula con una consulta
+    por tabla para todos los que faltan.
+    """
+    ids = list(dict.fromkeys(ids))
+    ahora = time.monotonic()
+    encontrados, faltan, por_verificar = {}, [], {}
+    for pedido_id in ids:
+        encontrado, entrada = cache_estados.obtener(pedido_id)
+        if not encontrado:
+            faltan.append(pedido_id)
+            continue
+        estado, etag, marca, verificado = entrada
+        encontrados[pedido_id] = (estado, etag)
+        if estado['estado'] in ESTADOS_FINALES and ahora - verificado >= CONFIG_ESTADO_PEDIDOS['ttl_pendiente']:
+            por_verificar[pedido_id] = entrada
+    if por_verificar:
+        vigentes = set(_vigentes({pedido_id: entrada[2] for pedido_id, entrada in por_verificar.items()}))
+        for pedido_id, (estado, etag, marca, _) in por_verificar.items():
+            if pedido_id in vigentes:
+                cache_estados.guardar(pedido_id, (estado, etag, marca, ahora), ttl=CONFIG_ESTADO_PEDIDOS['ttl_final'])
+            else:
+                del encontrados[pedido_id]
+                faltan.append(pedido_id)
+    if faltan:
+        encontrados.update(_cargar(faltan))
+    return {pedido_id: encontrados[pedido_id] for pedido_id in ids}
+
+
+def etag_estados(entradas: Iterable[tuple]) -> str:
+    """ETag de una respuesta a partir de los ETags de sus estados."""
+    etags = [etag for _, etag in entradas]
+    if len(etags) == 1:
+        return f'"{etags[0]}"'
+    return f'"{hashlib.sha1("|".join(etags).encode()).hexdigest()[:20]}"'
+
+
+def invalidar_estados(ids: Iterable[Optional[int]]) -> None:
+    """Descarta de la caché del proceso el estado de los pedidos cuya tarea acaba de escribir su historial."""
+    for pedido_id in ids:
+        if pedido_id is not None:
+            cache_estados.invalidar(pedido_id)
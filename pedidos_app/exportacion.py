@@ -0,0 +1,179 @@
+"""
+Exportación en streaming de los pedidos procesados (CSV o NDJSON).
+
+La usan la vista ``exportar_pedidos`` y el comando del mismo nombre. Los pedidos
+se leen por bloques con paginación por clave: ordenados por pk sin filtros, o por
+``(fecha_procesado, pk)`` cuando se filtra por cliente o por fecha, que es el
+orden de sus índices. Cada bloque continúa tras el último visto con una búsqueda
+en el índice, así que es una consulta corta e independiente: no hay
+OFFSET que crezca con la exportación, no se mantiene un cursor abierto ni una
+transacción larga que retenga el WAL de SQLite, y en memoria solo vive el bloque
+actual. Cada bloque se formatea y se entrega como un único fragmento de texto.
+"""
+
+import csv
+import json
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import PedidoProcesado
+
+CONFIG_EXPORTACION = {
+    'tamano_lote': 2000,                # Pedidos leídos por consulta.
+    **getattr(settings, 'PEDIDOS_EXPORTACION', {}),
+}
+
+FORMATO_CSV = 'csv'
+FORMATO_NDJSON = 'ndjson'
+FORMATOS = {
+    FORMATO_CSV: 'text/csv; charset=utf-8',
+    FORMATO_NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+CAMPOS = ['id_pedido_original', 'cliente', 'fecha_procesado', 'subtotal', 'descuento', 'total_final', 'hash_pedido']
+CAMPO_DETALLE = 'detalle_completo'
+
+
+def parsear_limite_fecha(valor: str, fin: bool = False) -> datetime:
+    """
+    Convierte un límite del rango (AAAA-MM-DD o fecha y hora ISO 8601) en un datetime con zona horaria.
+
+    Un día sin hora como límite final incluye el día entero (se devuelve el inicio del día siguiente).
+
+    Raises:
+        ValueError: Si el valor no es una fecha válida.
+    """
+    try:
+        # Primero como día: parse_datetime también acepta 'AAAA-MM-DD' (como medianoche).
+        dia = parse_date(valor)
+        momento = None if dia else parse_datetime(valor)
+    except ValueError:
+        momento = dia = None
+    if dia is not None:
+        momento = datetime.combine(dia + timedelta(days=1) if fin else dia, dt_time.min)
+    if momento is None:
+        raise ValueError(f"Fecha inválida '{valor}': use AAAA-MM-DD o fecha y hora ISO 8601.")
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
+def filtrar_pedidos(cliente: Optional[str] = None, desde: Optional[datetime] = None,
+                    hasta: Optional[datetime] = None):
+    """Pedidos de ``cliente`` procesados en ``[desde, hasta)``; cada filtro es opcional."""
+    pedidos = PedidoProcesado.objects.all()
+    if cliente:
+        pedidos = pedidos.filter(cliente=cliente)
+    if desde:
+        pedidos = pedidos.filter(fecha_procesado__gte=desde)
+    if hasta:
+        pedidos = pedidos.filter(fecha_procesado__lt=hasta)
+    return pedidos
+
+
+def iterar_lotes(pedidos, campos: List[str], tamano_lote: Optional[int] = None,
+                 por_fecha: bool = False) -> Iterator[List[Tuple]]:
+    """
+    Recorre ``pedidos`` por bloques, cada uno con una consulta que continúa tras el último visto.
+
+    Sin filtros se pagina por pk (recorrido de la tabla por rowid). Con ``por_fecha``
+    se pagina por ``(fecha_procesado, pk)``: es el orden de los índices de cliente y
+    de fecha, así que el mismo índice filtra, ordena y salta directamente al
+    siguiente bloque, sin releer ni ordenar el rango ya exportado.
+    """
+    tamano_lote = tamano_lote or CONFIG_EXPORTACION['tamano_lote']
+    indice_pk = campos.index('id_pedido_original')
+    indice_fecha = campos.index('fecha_procesado')
+    orden = ('fecha_procesado', 'pk') if por_fecha else ('pk',)
+    ultimo = None
+    while True:
+        if ultimo is None:
+            pagina = pedidos
+        elif por_fecha:
+            fecha, pk = ultimo
+            # El >= sobre la fecha acota el rango del índice; el OR solo desempata dentro de la misma fecha.
+            pagina = pedidos.filter(fecha_procesado__gte=fecha).filter(
+                Q(fecha_procesado__gt=fecha) | Q(fecha_procesado=fecha, pk__gt=pk))
+        else:
+            pagina = pedidos.filter(pk__gt=ultimo)
+        filas = list(pagina.order_by(*orden).values_list(*campos)[:tamano_lote])
+        if not filas:
+            return
+        yield filas
+        if len(filas) < tamano_lote:
+            return
+        ultimo = (filas[-1][indice_fecha], filas[-1][indice_pk]) if por_fecha else filas[-1][indice_pk]
+
+
+def _valor_json(valor: Any) -> Any:
+    if isinstance(valor, Decimal):
+        return str(valor)  # Sin pasar por float: los importes se concilian al céntimo.
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+class _Eco:
+    """Destino de ``csv.writer`` que devuelve cada línea en lugar de guardarla."""
+
+    def write(self, valor: str) -> str:
+        return valor
+
+
+def exportar(formato: str, cliente: Optional[str] = None, desde: Optional[datetime] = None,
+             hasta: Optional[datetime] = None, detalle: bool = False,
+             tamano_lote: Optional[int] = None) -> Iterator[str]:
+    """
+    Genera la exportación como fragmentos de texto, uno por bloque (más la cabecera en CSV).
+
+    Args:
+        formato: ``csv`` o ``ndjson``.
+        detalle: Incluye ``detalle_completo`` (en CSV, como texto JSON).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido '{formato}': use {' o '.join(FORMATOS)}.")
+    campos = CAMPOS + [CAMPO_DETALLE] if detalle else CAMPOS
+    lotes = iterar_lotes(filtrar_pedidos(cliente, desde, hasta), campos, tamano_lote,
+                         por_fecha=bool(cliente or desde or hasta))
+
+    if formato == FORMATO_NDJSON:
+        for filas in lotes:
+            yield ''.join(
+                json.dumps({campo: _valor_json(valor) for campo, valor in zip(campos, fila)}, ensure_ascii=False) + '\n'
+                for fila in filas)
+        return
+
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(campos)
+    for filas in lotes:
+        if detalle:
+            filas = [fila[:-1] + (json.dumps(fila[-1], ensure_ascii=False),) for fila in filas]
+        yield ''.join(escritor.writerow(_valor_json(valor) for valor in fila) for fila in filas)
+
+
+def nombre_archivo(formato: str, cliente: Optional[str] = None) -> str:
+    sufijo = f"-{''.join(c if c.isalnum() else '_' for c in cliente)}" if cliente else ''
+    return f"pedidos{sufijo}-{timezone.now():%Y%m%d-%H%M%S}.{formato}"
+
+
+def parametros_exportacion(datos: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Valida los parámetros de una exportación (de la query string o de la línea de comandos).
+
+    Raises:
+        ValueError: Si el formato o alguna de las fechas no son válidos.
+    """
+    formato = datos.get('formato') or FORMATO_CSV
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido '{formato}': use {' o '.join(FORMATOS)}.")
+    desde = parsear_limite_fecha(datos['desde']) if datos.get('desde') else None
+    hasta = parsear_limite_fecha(datos['hasta'], fin=True) if datos.get('hasta') else None
+    if desde and hasta and hasta <= desde:
+        raise ValueError("'hasta' debe ser posterior a 'desde'.")
+    return {'formato': formato, 'cliente': datos.get('cliente') or None, 'desde': desde, 'hasta': hasta}
@@ -0,0 +1,83 @@
+"""
+Idempotencia de la entrada de pedidos.
+
+Antes de enriquecer un pedido se calcula un hash barato de su payload y se busca
+en un índice de entradas ya procesadas (primero en memoria y después en la tabla
+HuellaPedido). Si el mismo payload ya generó un PedidoProcesado, la tarea puede
+terminar sin llamar a la API externa ni volver a escribir el resultado.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import CacheLRU
+from .models import HuellaPedido
+
+CONFIG_IDEMPOTENCIA = {
+    'max_entradas': 100000,
+    'ttl': 3600,
+    **getattr(settings, 'PEDIDOS_IDEMPOTENCIA', {}),
+}
+
+# Índice en memoria hash_entrada -> id del PedidoProcesado. Solo guarda aciertos:
+# las entradas nuevas se consultan en la tabla, que es una búsqueda por clave primaria.
+indice_huellas = CacheLRU(max_entradas=CONFIG_IDEMPOTENCIA['max_entradas'], ttl=CONFIG_IDEMPOTENCIA['ttl'])
+
+
+def calcular_hash_entrada(pedido_data: Dict[str, Any]) -> str:
+    """Hash canónico del payload de entrada (independiente del orden de las claves)."""
+    return hashlib.sha256(json.dumps(pedido_data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def buscar_procesado(hash_entrada: str) -> Optional[int]:
+    """Devuelve el ID del PedidoProcesado generado por este payload, o None si es nuevo."""
+    encontrado, pedido_id = indice_huellas.obtener(hash_entrada)
+    if encontrado:
+        return pedido_id
+    pedido_id = HuellaPedido.objects.filter(pk=hash_entrada).values_list('pedido_id', flat=True).first()
+    if pedido_id is not None:
+        indice_huellas.guardar(hash_entrada, pedido_id)
+    return pedido_id
+
+
+def buscar_procesados(hashes: Iterable[str]) -> Dict[str, int]:
+    """Versión por lotes de ``buscar_procesado``: devuelve solo los hashes ya procesados."""
+    resultado, pendientes = {}, []
+    for hash_entrada in set(hashes):
+        encontrado, pedido_id = indice_huellas.obtener(hash_entrada)
+        if encontrado:
+            resultado[hash_entrada] = pedido_id
+        else:
+            pendientes.append(hash_entrada)
+    if pendientes:
+        for hash_entrada, pedido_id in HuellaPedido.objects.filter(pk__in=pendientes).values_list('pk', 'pedido_id'):
+            indice_huellas.guardar(hash_entrada, pedido_id)
+            resultado[hash_entrada] = pedido_id
+    return resultado
+
+
+def registrar_huellas(huellas: Iterable[Tuple[str, int]]) -> None:
+    """
+    Persiste las huellas de pedidos procesados con éxito.
+
+    Debe llamarse dentro de la misma transacción que guarda el PedidoProcesado. El
+    índice en memoria solo se actualiza cuando esa transacción se confirma: si se
+    deshace, un reintento no debe encontrar una huella de un pedido que no existe.
+    """
+    huellas = dict(huellas)
+    if not huellas:
+        return
+    HuellaPedido.objects.bulk_create(
+        [HuellaPedido(hash_entrada=h, pedido_id=pedido_id) for h, pedido_id in huellas.items()],
+        update_conflicts=True, unique_fields=['hash_entrada'], update_fields=['pedido'],
+    )
+
+    def indexar():
+        for hash_entrada, pedido_id in huellas.items():
+            indice_huellas.guardar(hash_entrada, pedido_id)
+
+    transaction.on_commit(indexar)
@@ -0,0 +1,239 @@
+"""
+Inspección de la cola de Huey para el panel de administración.
+
+Lee directamente las tablas de ``SqliteHuey`` (``task``, ``schedule`` y ``kv``)
+con una conexión de solo lectura. En modo WAL los lectores no bloquean al
+consumidor, y todas las consultas están acotadas:
+
+- Las páginas usan paginación por cursor (keyset) sobre los índices de Huey, de
+  modo que pedir la página N cuesta lo mismo que pedir la primera.
+- Solo se deserializan los mensajes de la página mostrada.
+- Los conteos se detienen en ``LIMITE_CONTEO`` filas.
+
+Las tasas de encolado/desencolado y la antigüedad de la tarea pendiente más
+antigua se estiman a partir de muestras de los ``id`` de la tabla ``task``
+tomadas en cada consulta del panel (los mensajes de Huey no guardan la hora de
+encolado).
+"""
+
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from huey.contrib.djhuey import HUEY
+from huey.storage import SqliteStorage
+from huey.utils import Error
+
+TAMANO_PAGINA = 50
+LIMITE_CONTEO = 100000
+# Filas de ``kv`` revisadas como máximo por página al filtrar resultados o errores.
+LIMITE_ESCANEO_KV = 1000
+VENTANA_TASAS = 300.0  # Segundos de muestras usadas para calcular las tasas.
+
+VISTAS = ('pendientes', 'programadas', 'resultados', 'errores')
+
+# Estados que entiende la plantilla ``admin/huey_tasks.html``.
+ESTADO_PENDIENTE, ESTADO_COMPLETADO, ESTADO_FALLIDO, ESTADO_PROGRAMADO = 0, 2, 3, 4
+
+_muestras: "deque[Tuple[float, int, int]]" = deque(maxlen=500)  # (instante, max_id, pendientes)
+_muestras_lock = threading.Lock()
+
+
+def disponible() -> bool:
+    return isinstance(HUEY.storage, SqliteStorage) and not HUEY.immediate
+
+
+def _conectar() -> sqlite3.Connection:
+    uri = Path(HUEY.storage.filename).resolve().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=1)
+    conn.execute('pragma query_only = 1')
+    return conn
+
+
+def _contar(conn: sqlite3.Connection, tabla: str) -> Tuple[int, bool]:
+    """Cuenta filas de la cola con un tope. Devuelve ``(conteo, truncado)``."""
+    conteo = conn.execute(
+        f'select count(*) from (select 1 from {tabla} where queue = ? limit ?)',
+        (HUEY.storage.name, LIMITE_CONTEO + 1),
+    ).fetchone()[0]
+    return min(conteo, LIMITE_CONTEO), conteo > LIMITE_CONTEO
+
+
+def _desde_timestamp(ts: Optional[float]) -> Optional[datetime]:
+    # Huey guarda ``datetime.timestamp()`` de fechas naive (UTC si HUEY.utc), así que se invierte igual.
+    return datetime.fromtimestamp(ts) if ts is not None else None
+
+
+def _es_id_tarea(clave: str) -> bool:
+    try:
+        uuid.UUID(clave)
+    except ValueError:
+        return False
+    return True
+
+
+def _fila_mensaje(data: bytes, estado: int, timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    try:
+        mensaje = HUEY.serializer.deserialize(data)
+    except Exception as e:
+        return {'id': '-', 'name': '(mensaje ilegible)', 'status': estado, 'retries': '-',
+                'timestamp': timestamp, 'error': repr(e), 'result_data': None}
+    return {
+        'id': mensaje.id, 'name': mensaje.name, 'status': estado, 'retries': mensaje.retries,
+        'timestamp': timestamp or mensaje.eta, 'error': None,
+        'result_data': f'args={mensaje.args!r} kwargs={mensaje.kwargs!r}',
+    }
+
+
+def _pagina_pendientes(conn, cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Tareas pendientes en orden de desencolado (``priority desc, id``)."""
+    prioridad, ultimo_id = (float(x) for x in cursor.split(':')) if cursor else (None, None)
+    cola = HUEY.storage.name
+    filas = []
+    if prioridad is None:
+        filas = conn.execute(
+            'select id, priority, data from task where queue = ? order by priority desc, id limit ?',
+            (cola, TAMANO_PAGINA + 1)).fetchall()
+    else:
+        # Dos consultas con búsqueda por índice en lugar de un OR que obligaría a recorrerlo.
+        filas = conn.execute(
+            'select id, priority, data from task where queue = ? and priority = ? and id > ? order by id limit ?',
+            (cola, prioridad, ultimo_id, TAMANO_PAGINA + 1)).fetchall()
+        if len(filas) <= TAMANO_PAGINA:
+            filas += conn.execute(
+                'select id, priority, data from task where queue = ? and priority < ? '
+                'order by priority desc, id limit ?',
+                (cola, prioridad, TAMANO_PAGINA + 1 - len(filas))).fetchall()
+    siguiente = None
+    if len(filas) > TAMANO_PAGINA:
+        filas = filas[:TAMANO_PAGINA]
+        siguiente = f'{filas[-1][1]}:{filas[-1][0]}'
+    return [_fila_mensaje(data, ESTADO_PENDIENTE) for _, _, data in filas], siguiente
+
+
+def _pagina_programadas(conn, cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Tareas programadas (reintentos con espera, ``eta``) por fecha de ejecución."""
+    marca, ultimo_id = (float(x) for x in cursor.split(':')) if cursor else (None, None)
+    cola = HUEY.storage.name
+    if marca is None:
+        filas = conn.execute(
+            'select id, timestamp, data from schedule where queue = ? order by timestamp, id limit ?',
+            (cola, TAMANO_PAGINA + 1)).fetchall()
+    else:
+        filas = conn.execute(
+            'select id, timestamp, data from schedule where queue = ? and timestamp = ? and id > ? '
+            'order by id limit ?', (cola, marca, ultimo_id, TAMANO_PAGINA + 1)).fetchall()
+        if len(filas) <= TAMANO_PAGINA:
+            filas += conn.execute(
+                'select id, timestamp, data from schedule where queue = ? and timestamp > ? '
+                'order by timestamp, id limit ?', (cola, marca, TAMANO_PAGINA + 1 - len(filas))).fetchall()
+    siguiente = None
+    if len(filas) > TAMANO_PAGINA:
+        filas = filas[:TAMANO_PAGINA]
+        siguiente = f'{filas[-1][1]!r}:{filas[-1][0]}'
+    return [_fila_mensaje(data, ESTADO_PROGRAMADO, _desde_timestamp(ts)) for _, ts, data in filas], siguiente
+
+
+def _pagina_kv(conn, cursor: Optional[str], errores: bool) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Resultados o errores guardados en ``kv``, ordenados por clave (el id de la tarea).
+
+    Distinguir un error de un resultado exige deserializar el valor, así que cada
+    página revisa como máximo ``LIMITE_ESCANEO_KV`` filas y puede devolver menos
+    de ``TAMANO_PAGINA`` elementos; el cursor continúa donde se quedó.
+    """
+    filas = conn.execute(
+        'select key, value from kv where queue = ? and key > ? order by key limit ?',
+        (HUEY.storage.name, cursor or '', LIMITE_ESCANEO_KV)).fetchall()
+    tareas, recorridas = [], 0
+    for clave, valor in filas:
+        recorridas += 1
+        try:
+            dato = HUEY.serializer.deserialize(valor)
+        except Exception:
+            continue
+        if isinstance(dato, Error) != errores:
+            continue
+        if errores:
+            metadata = dato.metadata
+            tareas.append({'id': metadata.get('task_id', clave), 'name': '-', 'status': ESTADO_FALLIDO,
+                           'retries': metadata.get('retries', '-'), 'timestamp': None,
+                           'error': metadata.get('error'), 'result_data': None})
+        elif _es_id_tarea(clave):  # Se omiten locks y marcas de revocación.
+            tareas.append({'id': clave, 'name': '-', 'status': ESTADO_COMPLETADO, 'retries': '-',
+                           'timestamp': None, 'error': None, 'result_data': repr(dato)})
+        if len(tareas) == TAMANO_PAGINA:
+            break
+    terminado = recorridas == len(filas) < LIMITE_ESCANEO_KV
+    return tareas, (None if terminado else filas[recorridas - 1][0])
+
+
+def _estadisticas(conn) -> Dict[str, Any]:
+    # min/max del rowid se resuelven con el árbol de la tabla, sin recorrerla.
+    min_id, max_id = conn.execute('select min(id), max(id) from task').fetchone()
+    pendientes, pendientes_truncado = _contar(conn, 'task')
+    programadas, programadas_truncado = _contar(conn, 'schedule')
+    ahora = time.monotonic()
+
+    with _muestras_lock:
+        # Si la tabla se vació, SQLite puede reutilizar ids: las muestras anteriores ya no sirven.
+        if max_id is None or (_muestras and max_id < _muestras[-1][1]):
+            _muestras.clear()
+        if max_id is not None:
+            _muestras.append((ahora, max_id, pendientes))
+        ventana = [m for m in _muestras if ahora - m[0] <= VENTANA_TASAS]
+        primera_con_minimo = next((m for m in _muestras if min_id is not None and m[1] >= min_id), None)
+        historial_desde = _muestras[0][0] if _muestras else None
+
+    tasa_encolado = tasa_desencolado = None
+    if len(ventana) >= 2 and not pendientes_truncado:
+        (t0, max0, pend0), (t1, max1, pend1) = ventana[0], ventana[-1]
+        if t1 > t0:
+            encoladas = max1 - max0
+            tasa_encolado = round(encoladas / (t1 - t0), 2)
+            tasa_desencolado = round(max(encoladas - (pend1 - pend0), 0) / (t1 - t0), 2)
+
+    antiguedad = None
+    if primera_con_minimo is not None:
+        # La tarea más antigua ya existía en esa muestra: su antigüedad es como mínimo este valor.
+        antiguedad = round(ahora - primera_con_minimo[0], 1)
+
+    return {
+        'pendientes': pendientes, 'pendientes_truncado': pendientes_truncado,
+        'programadas': programadas, 'programadas_truncado': programadas_truncado,
+        'tasa_encolado': tasa_encolado, 'tasa_desencolado': tasa_desencolado,
+        'antiguedad_pendiente': antiguedad,
+        'muestreo_s': round(ahora - historial_desde, 1) if historial_desde is not None else 0,
+    }
+
+
+def inspeccionar(vista: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Devuelve una página de tareas de la vista indicada junto con las estadísticas de la cola.
+
+    Args:
+        vista: Una de ``VISTAS``.
+        cursor: Cursor opaco devuelto en ``siguiente`` por la página anterior.
+    """
+    if vista not in VISTAS:
+        vista = VISTAS[0]
+    paginas = {
+        'pendientes': _pagina_pendientes,
+        'programadas': _pagina_programadas,
+        'resultados': lambda conn, c: _pagina_kv(conn, c, errores=False),
+        'errores': lambda conn, c: _pagina_kv(conn, c, errores=True),
+    }
+    with closing(_conectar()) as conn:
+        estadisticas = _estadisticas(conn)
+        try:
+            tareas, siguiente = paginas[vista](conn, cursor)
+        except ValueError:
+            # Cursor manipulado o de otra vista: se vuelve al principio.
+            tareas, siguiente = paginas[vista](conn, None)
+    return {'vista': vista, 'tareas': tareas, 'siguiente': siguiente, 'estadisticas': estadisticas}
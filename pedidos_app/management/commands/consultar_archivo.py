@@ -0,0 +1,67 @@
+"""
+Comando para consultar el historial y los resultados de Huey ya archivados.
+
+Lee solo las particiones diarias del rango pedido y escribe las filas que cumplen
+los filtros como JSONL en la salida estándar.
+
+Uso:
+    python manage.py consultar_archivo --desde 2026-01-01 --hasta 2026-01-31 --estado ERROR
+    python manage.py consultar_archivo --tipo resultados_huey --desde 2026-01-01 --task-id <id>
+    python manage.py consultar_archivo --desde 2026-01-01 --pedido 1234
+"""
+
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pedidos_app.retencion import TIPO_HISTORIAL, TIPOS_ARCHIVO, leer_archivo
+
+
+def parsear_fecha(valor: str) -> date:
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}': use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Busca entradas en el archivo de TaskHistory o de resultados de Huey y las imprime como JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', choices=TIPOS_ARCHIVO, default=TIPO_HISTORIAL)
+        parser.add_argument('--desde', required=True, help="Primer día a consultar (AAAA-MM-DD).")
+        parser.add_argument('--hasta', default=None, help="Último día a consultar (por defecto, hoy).")
+        parser.add_argument('--task-id', default=None)
+        parser.add_argument('--pedido', type=int, default=None,
+                            help="ID del pedido, también de sus tareas fallidas o sin terminar (solo historial).")
+        parser.add_argument('--estado', default=None, help="Estado de la tarea, p. ej. ERROR (solo historial).")
+        parser.add_argument('--tarea', default=None, help="Nombre de la tarea (solo historial).")
+        parser.add_argument('--limite', type=int, default=None, help="Máximo de filas a imprimir.")
+
+    def handle(self, *args, **options):
+        desde = parsear_fecha(options['desde'])
+        hasta = parsear_fecha(options['hasta']) if options['hasta'] else timezone.now().date()
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        filtros = {
+            'task_id': options['task_id'], 'status': options['estado'], 'task_name': options['tarea'],
+        }
+        filtros = {campo: valor for campo, valor in filtros.items() if valor is not None}
+
+        encontradas = 0
+        for fila in leer_archivo(options['tipo'], desde, hasta):
+            if any(fila.get(campo) != valor for campo, valor in filtros.items()):
+                continue
+            # pedido_id solo existe si la tarea guardó el pedido; las filas archivadas antes de que el historial
+            # guardara id_pedido_original solo tienen ese campo.
+            if options['pedido'] is not None and options['pedido'] != fila.get('id_pedido_original',
+                                                                               fila.get('pedido_id')):
+                continue
+            self.stdout.write(json.dumps(fila, ensure_ascii=False))
+            encontradas += 1
+            if options['limite'] and encontradas >= options['limite']:
+                break
+        self.stderr.write(f"{encontradas} filas encontradas entre {desde} y {hasta}.")
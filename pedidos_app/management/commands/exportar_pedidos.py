@@ -0,0 +1,61 @@
+"""
+Comando para exportar los pedidos procesados a CSV o NDJSON.
+
+Recorre la tabla por bloques con paginación por clave (por pk sin filtros, por
+``(fecha_procesado, pk)`` con filtro de cliente o de fecha) y escribe cada bloque
+según se lee, con memoria constante. Si la ruta de salida termina en
+``.gz`` el archivo se comprime con gzip.
+
+Uso:
+    python manage.py exportar_pedidos --formato ndjson --cliente "ACME Corp" --desde 2026-01-01 --hasta 2026-01-31 --salida enero.ndjson.gz
+    python manage.py exportar_pedidos --desde 2026-01-01 > pedidos.csv
+"""
+
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos_app.exportacion import CONFIG_EXPORTACION, FORMATOS, exportar, parametros_exportacion
+
+
+class Command(BaseCommand):
+    help = "Exporta los pedidos procesados, filtrados por cliente y fecha, como CSV o NDJSON en streaming."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--cliente', default=None)
+        parser.add_argument('--desde', default=None, help="Inicio del rango de fecha_procesado (AAAA-MM-DD o ISO 8601).")
+        parser.add_argument('--hasta', default=None, help="Fin del rango; un día sin hora se incluye entero.")
+        parser.add_argument('--detalle', action='store_true', help="Incluye detalle_completo.")
+        parser.add_argument('--salida', default=None, help="Archivo de salida (.gz para comprimir); por defecto, stdout.")
+        parser.add_argument('--lote', type=int, default=CONFIG_EXPORTACION['tamano_lote'],
+                            help="Pedidos leídos por consulta.")
+
+    def handle(self, *args, **options):
+        if options['lote'] <= 0:
+            raise CommandError("--lote debe ser mayor que cero.")
+        try:
+            parametros = parametros_exportacion(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        ruta = options['salida']
+        if ruta is None:
+            salida = None
+        elif ruta.endswith('.gz'):
+            salida = gzip.open(ruta, 'wt', encoding='utf-8', newline='')
+        else:
+            salida = open(ruta, 'w', encoding='utf-8', newline='')
+
+        fragmentos = 0
+        try:
+            for fragmento in exportar(detalle=options['detalle'], tamano_lote=options['lote'], **parametros):
+                if salida is None:
+                    self.stdout.write(fragmento, ending='')
+                else:
+                    salida.write(fragmento)
+                fragmentos += 1
+        finally:
+            if salida is not None:
+                salida.close()
+        self.stderr.write(f"Exportación terminada: {fragmentos} bloques escritos en {ruta or 'stdout'}.")
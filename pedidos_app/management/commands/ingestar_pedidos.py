@@ -0,0 +1,137 @@
+"""
+Comando para reproducir un archivo JSONL de pedidos a través del pipeline.
+
+Lee el archivo línea a línea (también comprimido con gzip) con memoria constante,
+valida cada pedido y los encola por lotes, frenando la lectura mientras la cola
+de Huey supere el umbral indicado.
+
+Las líneas que no son UTF-8 válido se rechazan como las de JSON inválido. Si el
+archivo comprimido está dañado o truncado, se encolan los pedidos ya validados y
+el comando termina con un error que indica la última línea leída.
+
+Uso:
+    python manage.py ingestar_pedidos pedidos.jsonl.gz --lote 1000 --max-pendientes 20000
+"""
+
+import gzip
+import json
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from huey.contrib.djhuey import HUEY
+
+from pedidos_app.encolado import encolar_pedidos
+from pedidos_app.esquema import ErrorValidacion, validar_pedido
+
+
+def abrir_jsonl(ruta):
+    """
+    Abre un archivo JSONL en modo binario, descomprimiéndolo si es gzip.
+
+    Cada línea se decodifica por separado, de modo que una línea con bytes que no
+    son UTF-8 se rechaza sola en lugar de detener la lectura.
+    """
+    with open(ruta, 'rb') as f:
+        es_gzip = f.read(2) == b'\x1f\x8b'
+    if es_gzip:
+        return gzip.open(ruta, 'rb')
+    return open(ruta, 'rb')
+
+
+class ArchivoDanado(Exception):
+    """Error al leer o descomprimir el archivo de entrada."""
+
+
+def leer_lineas(entrada):
+    """Recorre las líneas de ``entrada`` convirtiendo los errores de lectura en ``ArchivoDanado``."""
+    try:
+        yield from entrada
+    except (OSError, EOFError, zlib.error) as e:
+        raise ArchivoDanado(e) from e
+
+
+class Command(BaseCommand):
+    help = "Encola los pedidos de un archivo JSONL (o JSONL.gz) con lectura en streaming y control de contrapresión."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta al archivo JSONL, opcionalmente comprimido con gzip.")
+        parser.add_argument('--lote', type=int, default=500, help="Pedidos encolados por transacción (por defecto 500).")
+        parser.add_argument('--pedidos-por-tarea', type=int, default=None,
+                            help="Pedidos agrupados en cada tarea; por defecto PEDIDOS_POR_TAREA.")
+        parser.add_argument('--max-pendientes', type=int, default=50000,
+                            help="Pausa la lectura mientras la cola tenga más tareas pendientes que este umbral.")
+        parser.add_argument('--espera', type=float, default=1.0,
+                            help="Segundos de espera entre comprobaciones de la cola al aplicar contrapresión.")
+        parser.add_argument('--progreso', type=int, default=10000,
+                            help="Informa del progreso cada N líneas (0 = sin informes de progreso).")
+        parser.add_argument('--rechazados', default=None, help="Archivo JSONL donde guardar las líneas rechazadas.")
+
+    def handle(self, *args, **options):
+        if options['lote'] <= 0:
+            raise CommandError("--lote debe ser mayor que cero.")
+        if options['progreso'] < 0:
+            raise CommandError("--progreso no puede ser negativo.")
+        try:
+            entrada = abrir_jsonl(options['archivo'])
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir el archivo: {e}")
+
+        rechazados_f = open(options['rechazados'], 'w', encoding='utf-8') if options['rechazados'] else None
+        inicio = time.monotonic()
+        leidas = encolados = rechazados = 0
+        num_linea = 0
+        lote = []
+        try:
+            with entrada:
+                for num_linea, linea in enumerate(leer_lineas(entrada), start=1):
+                    linea = linea.strip()
+                    if not linea:
+                        continue
+                    leidas += 1
+                    if options['progreso'] and leidas % options['progreso'] == 0:
+                        self._informar(leidas, encolados, rechazados, inicio)
+                    try:
+                        # UnicodeDecodeError también es un ValueError: la línea se rechaza como el JSON inválido.
+                        pedido = json.loads(linea.decode('utf-8'))
+                        validar_pedido(pedido)
+                    except ValueError as e:
+                        rechazados += 1
+                        if rechazados_f:
+                            errores = e.errores if isinstance(e, ErrorValidacion) else [{"campo": "", "error": str(e)}]
+                            contenido = linea[:1000].decode('utf-8', errors='replace')
+                            rechazados_f.write(json.dumps(
+                                {"linea": num_linea, "errores": errores, "contenido": contenido}, ensure_ascii=False) + "\n")
+                        continue
+
+                    lote.append(pedido)
+                    if len(lote) >= options['lote']:
+                        encolados += self._encolar(lote, options)
+                        lote = []
+        except ArchivoDanado as e:
+            # gzip dañado o truncado: los pedidos ya validados se encolan igualmente.
+            if lote:
+                encolados += self._encolar(lote, options)
+            raise CommandError(f"Archivo dañado o incompleto tras la línea {num_linea}: {e.__cause__} "
+                               f"({encolados} pedidos encolados, {rechazados} rechazados).")
+        finally:
+            if rechazados_f:
+                rechazados_f.close()
+        if lote:
+            encolados += self._encolar(lote, options)
+
+        self._informar(leidas, encolados, rechazados, inicio)
+        self.stdout.write(self.style.SUCCESS(f"Ingesta completada: {encolados} pedidos encolados, {rechazados} rechazados."))
+
+    def _encolar(self, lote, options):
+        # Contrapresión: no añadir más trabajo mientras los workers no vacíen la cola.
+        while not HUEY.immediate and HUEY.pending_count() > options['max_pendientes']:
+            time.sleep(options['espera'])
+        return encolar_pedidos(lote, tamano_lote=options['lote'], pedidos_por_tarea=options['pedidos_por_tarea'])
+
+    def _informar(self, leidas, encolados, rechazados, inicio):
+        transcurrido = max(time.monotonic() - inicio, 1e-9)
+        self.stdout.write(
+            f"{leidas} líneas leídas | {encolados} encolados | {rechazados} rechazados | "
+            f"{leidas / transcurrido:.0f} líneas/s | {transcurrido:.1f} s"
+        )
@@ -0,0 +1,49 @@
+"""
+Comando para recalcular las ventas diarias por cliente desde la tabla de pedidos.
+
+Sirve para poblar ``VentaDiariaCliente`` la primera vez (pedidos procesados antes
+de que existiera) o para corregir un rango de días. Cada día se recalcula en su
+propia transacción corta, así que puede ejecutarse con los workers en marcha.
+
+Uso:
+    python manage.py reconstruir_ventas
+    python manage.py reconstruir_ventas --desde 2026-01-01 --hasta 2026-01-31
+"""
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos_app.ventas import rango_pedidos, reconstruir_dia
+
+
+def parsear_dia(valor: str) -> date:
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}': use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Recalcula VentaDiariaCliente a partir de PedidoProcesado, día a día."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', default=None, help="Primer día (AAAA-MM-DD); por defecto, el del primer pedido.")
+        parser.add_argument('--hasta', default=None, help="Último día (AAAA-MM-DD); por defecto, el del último pedido.")
+
+    def handle(self, *args, **options):
+        rango = rango_pedidos()
+        if rango is None and not (options['desde'] and options['hasta']):
+            self.stdout.write("No hay pedidos procesados.")
+            return
+        desde = parsear_dia(options['desde']) if options['desde'] else rango[0]
+        hasta = parsear_dia(options['hasta']) if options['hasta'] else rango[1]
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        dia, filas, dias = desde, 0, 0
+        while dia <= hasta:
+            filas += reconstruir_dia(dia)
+            dias += 1
+            dia += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Ventas reconstruidas: {dias} días, {filas} filas (cliente, día)."))
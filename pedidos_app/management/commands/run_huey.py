@@ -0,0 +1,53 @@
+"""
+Consumidor de la cola de Huey, con el modo asyncio del proyecto.
+
+Sustituye al ``run_huey`` de djhuey (pedidos_app va antes en INSTALLED_APPS).
+Con ``HUEY['consumer']['worker_type'] = 'asyncio'`` arranca el
+``ConsumidorAsyncio`` (ajustado con ``PEDIDOS_CONSUMIDOR_ASYNCIO``); con cualquier
+otro tipo, o si se pasa ``-k`` por línea de comandos, delega en el comando original.
+
+Uso:
+    python manage.py run_huey
+"""
+
+import logging
+
+from django.conf import settings
+from django.utils.module_loading import autodiscover_modules
+from huey.consumer_options import ConsumerConfig
+from huey.contrib.djhuey.management.commands.run_huey import Command as ComandoRunHuey
+
+WORKER_ASYNCIO = 'asyncio'
+OPCIONES_ASYNCIO = ('periodic', 'initial_delay', 'backoff', 'max_delay', 'scheduler_interval', 'flush_locks',
+                    'extra_locks')
+
+
+class Command(ComandoRunHuey):
+    help = "Ejecuta el consumidor de la cola (hilos, procesos, greenlets o asyncio según HUEY['consumer'])."
+
+    def handle(self, *args, **options):
+        from huey.contrib.djhuey import HUEY
+
+        consumer_options = dict(settings.HUEY.get('consumer', {})) if isinstance(settings.HUEY, dict) else {}
+        if (options.get('worker_type') or consumer_options.get('worker_type')) != WORKER_ASYNCIO:
+            return super().handle(*args, **options)
+
+        for key, value in options.items():
+            if value is not None and key != 'worker_type':
+                consumer_options[key] = value
+        consumer_options.setdefault('verbose', consumer_options.pop('huey_verbose', None))
+        if not consumer_options.pop('disable_autoload', False):
+            autodiscover_modules("tasks")
+
+        # Se valida con el tipo de worker de Huey más cercano; las demás opciones se comparten.
+        consumer_options['worker_type'] = 'thread'
+        config = ConsumerConfig(**{k: v for k, v in consumer_options.items() if k in ConsumerConfig._fields})
+        config.validate()
+        logger = logging.getLogger('huey')
+        if not logger.handlers:
+            config.setup_logger(logger)
+
+        # Importa las tareas del pipeline: solo se carga en este modo, tras el autodescubrimiento.
+        from pedidos_app.consumidor_asyncio import crear_consumidor
+        consumidor = crear_consumidor(HUEY, **{k: getattr(config, k) for k in OPCIONES_ASYNCIO})
+        consumidor.run()
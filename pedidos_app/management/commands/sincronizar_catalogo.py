@@ -0,0 +1,37 @@
+"""
+Comando para poblar o refrescar a mano la réplica local del catálogo de productos.
+
+Hace lo mismo que la tarea periódica ``sincronizar_catalogo_productos``; es útil
+para cargar la tabla Producto al desplegar, antes de que arranque el worker.
+
+Uso:
+    python manage.py sincronizar_catalogo [--forzar-retirados]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos_app.catalogo import sincronizar_catalogo
+
+
+class Command(BaseCommand):
+    help = "Descarga el listado de productos de la API y actualiza la réplica local (solo las filas que cambiaron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar-retirados', action='store_true',
+                            help="Desactivar los productos ausentes del listado aunque superen "
+                                 "PEDIDOS_CATALOGO['max_fraccion_retirados'].")
+
+    def handle(self, *args, **options):
+        try:
+            resumen = sincronizar_catalogo(forzar_retirados=options['forzar_retirados'])
+        except Exception as e:
+            raise CommandError(f"No se pudo sincronizar el catálogo: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Catálogo sincronizado: {resumen['creados']} creados, {resumen['actualizados']} actualizados, "
+            f"{resumen['desactivados']} desactivados, {resumen['sin_cambios']} sin cambios."
+        ))
+        if resumen['retirados_omitidos']:
+            self.stdout.write(self.style.WARNING(
+                f"{resumen['retirados_omitidos']} productos ausentes del listado no se desactivaron: superan "
+                f"PEDIDOS_CATALOGO['max_fraccion_retirados']. Use --forzar-retirados si el listado es correcto."
+            ))
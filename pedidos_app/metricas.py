@@ -0,0 +1,252 @@
+"""
+Registro de métricas en proceso con exportación en formato de texto de Prometheus.
+
+Cada proceso (servidor web o worker de Huey) mantiene su propio registro. El
+servidor web lo expone en ``pedidos/metricas/`` y el worker puede exponer el suyo
+en un puerto propio (``PEDIDOS_METRICAS['puerto_worker']``, desactivado por
+defecto y solo en 127.0.0.1), ya que las métricas del pipeline se generan en el
+proceso del consumidor.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+CONFIG_METRICAS = {
+    'puerto_worker': None,   # Puerto HTTP donde el worker expone sus métricas (None = desactivado).
+    'host_worker': '127.0.0.1',  # Interfaz del servidor de métricas; '0.0.0.0' para exponerlo fuera de la máquina.
+    **getattr(settings, 'PEDIDOS_METRICAS', {}),
+}
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# La espera en cola llega a minutos durante las ráfagas.
+BUCKETS_ESPERA_COLA = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres: Tuple[str, ...], valores: Tuple[str, ...], extra: str = '') -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class Metrica:
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(etiquetas.get(n, '')) for n in self.etiquetas)
+
+    def exportar(self) -> List[str]:
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}'] + self._muestras()
+
+    def _muestras(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1.0, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def _muestras(self) -> List[str]:
+        with self._lock:
+            return [f'{self.nombre}{_formatear_etiquetas(self.etiquetas, k)} {v}' for k, v in self._valores.items()]
+
+
+class Indicador(Metrica):
+    """Valor instantáneo calculado en el momento de exportar mediante una función."""
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], Dict[Tuple[str, ...], float]],
+                 etiquetas: Iterable[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def _muestras(self) -> List[str]:
+        return [f'{self.nombre}{_formatear_etiquetas(self.etiquetas, k)} {v}' for k, v in self.funcion().items()]
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (), buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.setdefault(clave, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def _muestras(self) -> List[str]:
+        lineas = []
+        with self._lock:
+            for clave, (conteos, suma, total) in self._series.items():
+                acumulado = 0
+                for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                    acumulado += conteo
+                    le = 'le="+Inf"' if limite == float('inf') else f'le="{limite!r}"'
+                    lineas.append(f'{self.nombre}_bucket{_formatear_etiquetas(self.etiquetas, clave, le)} {acumulado}')
+                lineas.append(f'{self.nombre}_sum{_formatear_etiquetas(self.etiquetas, clave)} {suma}')
+                lineas.append(f'{self.nombre}_count{_formatear_etiquetas(self.etiquetas, clave)} {total}')
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas: Dict[str, Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()) -> Contador:
+        return self.registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (), buckets=BUCKETS_SEGUNDOS) -> Histograma:
+        return self.registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def indicador(self, nombre: str, ayuda: str, funcion, etiquetas: Iterable[str] = ()) -> Indicador:
+        return self.registrar(Indicador(nombre, ayuda, funcion, etiquetas))
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return '\n'.join(linea for metrica in metricas for linea in metrica.exportar()) + '\n'
+
+
+registro = RegistroMetricas()
+
+duracion_etapa = registro.histograma(
+    'pedidos_etapa_duracion_segundos', 'Duración de cada etapa del pipeline de pedidos.', ['tarea', 'etapa'])
+llamadas_api = registro.contador(
+    'pedidos_api_llamadas_total', 'Llamadas HTTP a la API de productos por código de estado.', ['status'])
+latencia_api = registro.histograma(
+    'pedidos_api_latencia_segundos', 'Latencia de las llamadas HTTP a la API de productos.')
+tareas_finalizadas = registro.contador(
+    'pedidos_tareas_total', 'Ejecuciones de tareas por estado final y worker.', ['tarea', 'status', 'worker'])
+reintentos = registro.contador(
+    'pedidos_reintentos_total', 'Ejecuciones que corresponden a un reintento de Huey.', ['tarea'])
+espera_cola = registro.histograma(
+    'pedidos_espera_cola_segundos', 'Tiempo entre el encolado de una tarea y su primera ejecución, por carril.',
+    ['tarea', 'carril'], buckets=BUCKETS_ESPERA_COLA)
+
+
+class MedicionTarea:
+    """
+    Recoge las métricas de una ejecución concreta de una tarea.
+
+    Además de alimentar el registro del proceso, genera un resumen compacto que
+    se guarda en ``TaskHistory.metricas``.
+    """
+
+    def __init__(self, tarea: str):
+        self.tarea = tarea
+        self.etapas: Dict[str, float] = {}
+        self.llamadas_api: List[float] = []
+        self.espera_cola: Optional[Tuple[float, str]] = None
+
+    def registrar_espera_cola(self, encolado_en: Optional[float], carril: str) -> None:
+        """Mide la espera desde ``encolado_en`` (timestamp de época) hasta ahora en el carril de la tarea."""
+        if encolado_en is None:
+            return  # Tarea encolada antes de que se registrara el instante de encolado.
+        espera = max(time.time() - encolado_en, 0.0)
+        self.espera_cola = (espera, carril)
+        espera_cola.observar(espera, tarea=self.tarea, carril=carril)
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.etapas[nombre] = self.etapas.get(nombre, 0.0) + duracion
+            duracion_etapa.observar(duracion, tarea=self.tarea, etapa=nombre)
+
+    def registrar_llamada_api(self, duracion: float) -> None:
+        # list.append es atómico, por lo que pueden llamarlo los hilos del pool HTTP.
+        self.llamadas_api.append(duracion)
+
+    def resumen(self) -> Dict[str, object]:
+        resumen = {
+            'etapas_ms': {nombre: round(d * 1000, 2) for nombre, d in self.etapas.items()},
+            'api_llamadas': len(self.llamadas_api),
+            'api_ms': round(sum(self.llamadas_api) * 1000, 2),
+        }
+        if self.espera_cola is not None:
+            resumen['espera_cola_ms'] = round(self.espera_cola[0] * 1000, 2)
+            resumen['carril'] = self.espera_cola[1]
+        return resumen
+
+
+def registrar_llamada_api(duracion: float, status: int, medicion: Optional[MedicionTarea] = None) -> None:
+    llamadas_api.inc(status=status)
+    latencia_api.observar(duracion)
+    if medicion is not None:
+        medicion.registrar_llamada_api(duracion)
+
+
+_servidor_worker = None
+_servidor_lock = threading.Lock()
+
+
+def iniciar_servidor_metricas(puerto: int, host: Optional[str] = None) -> None:
+    """
+    Expone el registro del proceso actual en ``http://<host>:<puerto>/`` (una sola vez por proceso).
+
+    El endpoint no tiene autenticación: por defecto solo escucha en ``host_worker``
+    (127.0.0.1). Si el puerto está ocupado, p. ej. por otro worker de la misma
+    máquina, se registra un aviso y el worker sigue sin servidor de métricas.
+    """
+    global _servidor_worker
+    from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+    class ManejadorSilencioso(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    def aplicacion(environ, start_response):
+        cuerpo = registro.exportar().encode()
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                  ('Content-Length', str(len(cuerpo)))])
+        return [cuerpo]
+
+    with _servidor_lock:
+        if _servidor_worker is not None:
+            return
+        host = host or CONFIG_METRICAS['host_worker']
+        try:
+            _servidor_worker = make_server(host, puerto, aplicacion, handler_class=ManejadorSilencioso)
+        except OSError as e:
+            logging.warning(f"[Metricas] No se pudo abrir el servidor de métricas en {host}:{puerto}: {e}")
+            return
+        threading.Thread(target=_servidor_worker.serve_forever, name='metricas-http', daemon=True).start()
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0004_remove_taskhistory_pedido_id_taskhistory_pedido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskhistory',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0005_taskhistory_start_time_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskhistory',
+            name='status',
+            field=models.CharField(choices=[('STARTED', 'Iniciada'), ('SUCCESS', 'Completada'), ('ERROR', 'Fallida'), ('SKIPPED', 'Omitida')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='HuellaPedido',
+            fields=[
+                ('hash_entrada', models.CharField(help_text='Hash del payload de entrada', max_length=64, primary_key=True, serialize=False)),
+                ('fecha_registro', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='huellas', to='pedidos_app.pedidoprocesado')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0006_huellapedido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskhistory',
+            name='metricas',
+            field=models.JSONField(blank=True, help_text='Duración por etapa y llamadas a la API de la ejecución', null=True),
+        ),
+        migrations.AddField(
+            model_name='taskhistory',
+            name='reintentos',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Número de reintento de Huey (0 = primera ejecución)'),
+        ),
+    ]
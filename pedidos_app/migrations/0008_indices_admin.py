@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0007_taskhistory_reintentos_metricas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedidoprocesado',
+            index=models.Index(fields=['fecha_procesado'], name='pedido_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidoprocesado',
+            index=models.Index(fields=['cliente', 'fecha_procesado'], name='pedido_cliente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['start_time'], name='taskhist_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['status', 'start_time'], name='taskhist_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['task_name', 'start_time'], name='taskhist_name_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['worker_hostname', 'start_time'], name='taskhist_worker_start_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0008_indices_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Producto',
+            fields=[
+                ('id_producto', models.IntegerField(help_text='ID del producto en la API', primary_key=True, serialize=False)),
+                ('titulo', models.CharField(max_length=255)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('datos', models.JSONField(help_text='Respuesta completa de la API para el producto')),
+                ('hash_datos', models.CharField(help_text='Hash de los datos para detectar cambios', max_length=64)),
+                ('activo', models.BooleanField(default=True, help_text='False si el producto ya no aparece en el catálogo')),
+                ('fecha_actualizacion', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
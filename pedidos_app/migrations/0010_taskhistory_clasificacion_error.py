@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0009_producto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskhistory',
+            name='clasificacion_error',
+            field=models.CharField(blank=True, choices=[('permanente', 'Permanente'), ('transitorio', 'Transitorio')], help_text='Permanente: no se reintenta. Transitorio: se reintenta con espera exponencial.', max_length=12, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0010_taskhistory_clasificacion_error'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiariaCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cliente', models.CharField(max_length=255)),
+                ('dia', models.DateField()),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('descuento', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_final', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'venta diaria por cliente',
+                'verbose_name_plural': 'ventas diarias por cliente',
+                'indexes': [models.Index(fields=['dia'], name='venta_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cliente', 'dia'), name='venta_cliente_dia_unica')],
+            },
+        ),
+    ]
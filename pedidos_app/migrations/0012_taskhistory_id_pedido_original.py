@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:46
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def rellenar_id_pedido(apps, schema_editor):
+    # El historial anterior solo conoce el pedido de las tareas que lo guardaron.
+    TaskHistory = apps.get_model('pedidos_app', 'TaskHistory')
+    TaskHistory.objects.filter(pedido__isnull=False).update(id_pedido_original=F('pedido_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0011_ventadiariacliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskhistory',
+            name='id_pedido_original',
+            field=models.IntegerField(blank=True, help_text='ID del pedido de entrada que procesó la tarea (también si falló y no hay PedidoProcesado)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='taskhistory',
+            index=models.Index(fields=['id_pedido_original', 'start_time'], name='taskhist_pedido_start_idx'),
+        ),
+        migrations.RunPython(rellenar_id_pedido, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos_app', '0012_taskhistory_id_pedido_original'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedidoprocesado',
+            name='detalle_completo',
+            field=models.JSONField(help_text='JSON enriquecido'),
+        ),
+        migrations.AlterField(
+            model_name='pedidoprocesado',
+            name='hash_pedido',
+            field=models.CharField(help_text='Hash procesado', max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pedidoprocesado',
+            name='id_pedido_original',
+            field=models.IntegerField(help_text='ID pedido de entrada', primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class PedidoProcesado(models.Model):
     id_pedido_original = models.IntegerField(primary_key=True, help_text="ID pedido de entrada")
@@ -10,6 +11,13 @@ class PedidoProcesado(models.Model):
     total_final = models.DecimalField(max_digits=10, decimal_places=2)
     fecha_procesado = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Índices para los filtros y la navegación por fechas del admin.
+        indexes = [
+            models.Index(fields=['fecha_procesado'], name='pedido_fecha_idx'),
+            models.Index(fields=['cliente', 'fecha_procesado'], name='pedido_cliente_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido {self.id_pedido_original} - {self.cliente}"
 
@@ -18,14 +26,27 @@ class TaskHistory(models.Model):
         STARTED = 'STARTED', 'Iniciada'
         SUCCESS = 'SUCCESS', 'Completada'
         ERROR = 'ERROR', 'Fallida'
+        SKIPPED = 'SKIPPED', 'Omitida'
 
     task_id = models.CharField(max_length=36, primary_key=True)
     task_name = models.CharField(max_length=255)
     status = models.CharField(max_length=10, choices=Status.choices)
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
     worker_hostname = models.CharField(max_length=255, null=True, blank=True, help_text="Hostname del worker que ejecutó la tarea")
+    reintentos = models.PositiveSmallIntegerField(default=0, help_text="Número de reintento de Huey (0 = primera ejecución)")
+    metricas = models.JSONField(null=True, blank=True, help_text="Duración por etapa y llamadas a la API de la ejecución")
+    clasificacion_error = models.CharField(
+        max_length=12, null=True, blank=True,
+        choices=[('permanente', 'Permanente'), ('transitorio', 'Transitorio')],
+        help_text="Permanente: no se reintenta. Transitorio: se reintenta con espera exponencial.",
+    )
+
+    id_pedido_original = models.IntegerField(
+        null=True, blank=True,
+        help_text="ID del pedido de entrada que procesó la tarea (también si falló y no hay PedidoProcesado)",
+    )
 
     pedido = models.ForeignKey(
                                 PedidoProcesado,
@@ -34,5 +55,83 @@ class TaskHistory(models.Model):
                                 blank=True,
                                 related_name="task_history"
                                 )
+
+    class Meta:
+        # Cada filtro del admin se combina con el orden por fecha de inicio.
+        indexes = [
+            models.Index(fields=['start_time'], name='taskhist_start_idx'),
+            models.Index(fields=['status', 'start_time'], name='taskhist_status_start_idx'),
+            models.Index(fields=['task_name', 'start_time'], name='taskhist_name_start_idx'),
+            models.Index(fields=['worker_hostname', 'start_time'], name='taskhist_worker_start_idx'),
+            # Última ejecución de un pedido para la consulta de estado.
+            models.Index(fields=['id_pedido_original', 'start_time'], name='taskhist_pedido_start_idx'),
+        ]
+
     def __str__(self):
         return f"{self.task_name} ({self.task_id}) - {self.status}"
+
+
+class HuellaPedido(models.Model):
+    """
+    Índice persistente de payloads de entrada ya procesados.
+
+    Permite descartar pedidos duplicados o reenviados antes del enriquecimiento,
+    sin repetir las llamadas a la API externa ni la escritura del resultado.
+    """
+    hash_entrada = models.CharField(max_length=64, primary_key=True, help_text="Hash del payload de entrada")
+    pedido = models.ForeignKey(PedidoProcesado, on_delete=models.CASCADE, related_name="huellas")
+    fecha_registro = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.hash_entrada[:12]}... -> Pedido {self.pedido_id}"
+
+
+class Producto(models.Model):
+    """
+    Réplica local del catálogo de la API de productos.
+
+    La refresca periódicamente la tarea ``sincronizar_catalogo_productos`` y el
+    pipeline enriquece los pedidos a partir de ella, sin llamar a la API externa.
+    """
+    id_producto = models.IntegerField(primary_key=True, help_text="ID del producto en la API")
+    titulo = models.CharField(max_length=255)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    datos = models.JSONField(help_text="Respuesta completa de la API para el producto")
+    hash_datos = models.CharField(max_length=64, help_text="Hash de los datos para detectar cambios")
+    activo = models.BooleanField(default=True, help_text="False si el producto ya no aparece en el catálogo")
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Producto {self.id_producto} - {self.titulo}"
+
+
+class VentaDiariaCliente(models.Model):
+    """
+    Ventas agregadas por cliente y día (según ``PedidoProcesado.fecha_procesado``).
+
+    El pipeline la mantiene con deltas en la misma transacción que guarda los
+    pedidos (ver ``ventas``), así que las consultas de facturación leen unas pocas
+    filas en lugar de agregar toda la tabla de pedidos. El comando
+    ``reconstruir_ventas`` la recalcula desde cero para un rango de días.
+    """
+    cliente = models.CharField(max_length=255)
+    dia = models.DateField()
+    pedidos = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    descuento = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_final = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "venta diaria por cliente"
+        verbose_name_plural = "ventas diarias por cliente"
+        constraints = [
+            models.UniqueConstraint(fields=['cliente', 'dia'], name='venta_cliente_dia_unica'),
+        ]
+        # Las consultas sin cliente recorren un rango de días.
+        indexes = [
+            models.Index(fields=['dia'], name='venta_dia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cliente} {self.dia}: {self.pedidos} pedidos, {self.total_final}"
@@ -0,0 +1,114 @@
+"""
+Carriles de prioridad y reparto justo entre clientes en la cola de pedidos.
+
+La cola de Huey en SQLite entrega las tareas por ``priority`` descendente y, a
+igual prioridad, por orden de llegada. Cada tarea de pedido se encola con una
+prioridad ``carril + 1 / (2 + turno / peso)``:
+
+- El carril (parte entera) sale del campo opcional ``prioridad`` del pedido o,
+  si no lo trae, de su tamaño: los pedidos con más de ``max_lineas_normal``
+  líneas van al carril ``baja``. Un carril superior siempre se sirve antes.
+- El turno (parte decimal) es el número de pedidos encolados recientemente por
+  el mismo cliente en este proceso, un contador que decae con una semivida de
+  ``semivida_turno`` segundos. Dentro de un carril, el pedido n-ésimo de cada
+  cliente va antes que el (n+1)-ésimo de cualquier otro: una carga masiva de un
+  cliente se intercala por turnos con los pedidos de los demás en lugar de
+  retrasarlos a todos. ``pesos`` da más turnos por ronda a un cliente.
+
+Las tareas periódicas se declaran con ``PRIORIDAD_PERIODICAS``, por encima del
+carril más alto, para que nunca esperen detrás de los pedidos.
+
+El reparto se decide al encolar: los workers no aplazan ni reordenan tareas, así
+que ningún worker queda ocioso mientras haya trabajo y no cuesta escrituras
+adicionales en huey.db.
+"""
+
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+
+CONFIG_PRIORIDAD = {
+    'carriles': {'alta': 2, 'normal': 1, 'baja': 0},  # Nombre del carril -> prioridad base en Huey.
+    'max_lineas_normal': 20,            # Los pedidos con más líneas van al carril 'baja' (sin prioridad explícita).
+    'semivida_turno': 60.0,             # Segundos en que el turno de un cliente se reduce a la mitad.
+    'pesos': {},                        # Cliente -> peso (turnos por ronda); 1 por defecto.
+    'activa': True,                     # False: todas las tareas con la prioridad por defecto (FIFO).
+    **getattr(settings, 'PEDIDOS_PRIORIDAD', {}),
+}
+
+# Las tareas periódicas (catálogo, estado de la API, retención, mantenimiento) van por encima de
+# todos los carriles: son pocas y, sin prioridad, esperarían detrás de todo un atasco de pedidos,
+# justo cuando más falta hacen.
+PRIORIDAD_PERIODICAS = max(CONFIG_PRIORIDAD['carriles'].values()) + 1
+
+CARRIL_NORMAL = 'normal'
+CARRIL_BAJA = 'baja'
+SIN_CARRIL = 'sin_carril'
+
+
+def carril_pedido(pedido_data: Dict[str, Any]) -> str:
+    """Carril de un pedido: su campo ``prioridad`` o, si no lo tiene, el que corresponde a su tamaño."""
+    carril = pedido_data.get('prioridad')
+    if carril in CONFIG_PRIORIDAD['carriles']:
+        return carril
+    return CARRIL_BAJA if len(pedido_data.get('productos') or ()) > CONFIG_PRIORIDAD['max_lineas_normal'] else CARRIL_NORMAL
+
+
+def carril_de_prioridad(prioridad: Optional[float]) -> str:
+    """Nombre del carril al que pertenece la prioridad de una tarea (``sin_carril`` si se encoló sin ella)."""
+    if prioridad is None:
+        return SIN_CARRIL
+    base = math.floor(prioridad)
+    return next((carril for carril, valor in CONFIG_PRIORIDAD['carriles'].items() if valor == base), SIN_CARRIL)
+
+
+class TurnosClientes:
+    """
+    Contadores por cliente de los pedidos encolados recientemente, con decaimiento exponencial.
+
+    Es seguro entre hilos; cada proceso que encola (servidor web, comandos) tiene los suyos.
+    """
+
+    def __init__(self, semivida: float, pesos: Dict[str, float]):
+        self.semivida = semivida
+        self.pesos = pesos
+        self._turnos: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def siguiente(self, cliente: str) -> float:
+        """Devuelve el turno del siguiente pedido del cliente (0 para el primero) y lo cuenta."""
+        ahora = time.monotonic()
+        with self._lock:
+            valor, instante = self._turnos.get(cliente, (0.0, ahora))
+            valor *= 0.5 ** ((ahora - instante) / self.semivida)
+            self._turnos[cliente] = (valor + 1, ahora)
+            if len(self._turnos) > 10000:
+                self._purgar(ahora)
+        return valor / self.pesos.get(cliente, 1)
+
+    def _purgar(self, ahora: float) -> None:
+        # Los clientes cuyo turno ya decayó a casi cero no se distinguen de uno nuevo.
+        for cliente, (valor, instante) in list(self._turnos.items()):
+            if valor * 0.5 ** ((ahora - instante) / self.semivida) < 0.01:
+                del self._turnos[cliente]
+
+
+turnos_clientes = TurnosClientes(CONFIG_PRIORIDAD['semivida_turno'], CONFIG_PRIORIDAD['pesos'])
+
+
+def prioridad_pedido(pedido_data: Dict[str, Any]) -> Optional[float]:
+    """Prioridad de Huey para la tarea de un pedido (None si los carriles están desactivados)."""
+    if not CONFIG_PRIORIDAD['activa']:
+        return None
+    base = CONFIG_PRIORIDAD['carriles'][carril_pedido(pedido_data)]
+    # La parte decimal queda en (0, 0.5]: nunca alcanza la base del carril siguiente.
+    return base + 1 / (2 + turnos_clientes.siguiente(str(pedido_data.get('cliente'))))
+
+
+def prioridad_lote(pedidos: Iterable[Dict[str, Any]]) -> Optional[float]:
+    """Prioridad de un micro-lote: la del pedido más prioritario que contiene."""
+    prioridades = [prioridad_pedido(pedido_data) for pedido_data in pedidos]
+    return max(prioridades) if prioridades and None not in prioridades else None
@@ -0,0 +1,295 @@
+"""
+Protección del lado cliente para la API externa de productos.
+
+Todas las llamadas del worker pasan por una única ``GuardaAPI`` compartida entre
+hilos que combina tres mecanismos:
+
+- ``TokenBucket``: limita la tasa de peticiones por segundo (con ráfagas acotadas).
+- ``LimiteAdaptativo``: limita las peticiones simultáneas con un esquema AIMD; el
+  límite crece de uno en uno mientras la latencia se mantiene bajo el objetivo y
+  se reduce a la mitad ante errores o respuestas lentas.
+- ``CircuitBreaker``: tras varios fallos consecutivos deja de llamar a la API
+  durante ``tiempo_apertura`` segundos y después deja pasar una única petición de
+  prueba antes de volver a cerrarse.
+
+Cuando la guarda rechaza una llamada lanza ``APINoDisponible`` y la tarea se
+aplaza con ``RetryTask`` en lugar de bloquear un hilo del worker.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict
+
+from django.conf import settings
+
+from .metricas import registro
+
+CONFIG_RESILIENCIA = {
+    'tasa_por_segundo': 50.0,    # Peticiones por segundo sostenidas hacia la API.
+    'rafaga': 100,               # Peticiones que se pueden emitir de golpe tras un periodo de inactividad.
+    'concurrencia_min': 1,
+    'concurrencia_inicial': 4,
+    # Por defecto, el tamaño del pool de conexiones de la API.
+    'concurrencia_max': getattr(settings, 'PEDIDOS_API_PRODUCTOS', {}).get('max_concurrencia', 8),
+    'latencia_objetivo': 1.0,    # Segundos; por encima se considera que la API está saturada.
+    'espera_max': 5.0,           # Segundos máximos esperando turno antes de aplazar la tarea.
+    'umbral_fallos': 5,          # Fallos consecutivos que abren el circuito.
+    'tiempo_apertura': 30.0,     # Segundos que el circuito permanece abierto.
+    **getattr(settings, 'PEDIDOS_RESILIENCIA_API', {}),
+}
+
+# Segundos entre intentos de la guarda asíncrona mientras espera turno.
+INTERVALO_SONDEO = 0.01
+
+# Clave del almacenamiento de Huey donde cada worker publica el estado de su guarda.
+CLAVE_ESTADO_API = 'pedidos:estado_guarda_api'
+
+
+class APINoDisponible(Exception):
+    """La guarda no permite llamar a la API en este momento."""
+
+    def __init__(self, mensaje: str, reintentar_en: float):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class CircuitoAbierto(APINoDisponible):
+    pass
+
+
+class LimiteExcedido(APINoDisponible):
+    pass
+
+
+class TokenBucket:
+    """Limitador de tasa por cubo de fichas, seguro para hilos."""
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+        self.esperas = 0
+
+    def _reponer(self, ahora: float) -> None:
+        self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.tasa)
+        self._ultima = ahora
+
+    def adquirir(self, timeout: float) -> bool:
+        """Toma una ficha esperando como máximo ``timeout`` segundos. Devuelve False si no lo logra."""
+        limite = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._reponer(ahora)
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.tasa
+                self.esperas += 1
+            if ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reponer(time.monotonic())
+            return {'fichas': round(self._fichas, 2), 'tasa_por_segundo': self.tasa, 'esperas': self.esperas}
+
+
+class LimiteAdaptativo:
+    """Límite de concurrencia AIMD (incremento aditivo, decremento multiplicativo)."""
+
+    def __init__(self, minimo: int, inicial: int, maximo: int, latencia_objetivo: float):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_objetivo = latencia_objetivo
+        self.limite = float(min(max(inicial, minimo), maximo))
+        self.en_vuelo = 0
+        self._cond = threading.Condition()
+        self._ultimo_recorte = 0.0
+        self.recortes = 0
+
+    def adquirir(self, timeout: float) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.en_vuelo < int(self.limite), timeout=timeout):
+                return False
+            self.en_vuelo += 1
+            return True
+
+    def liberar(self, latencia: float, exito: bool) -> None:
+        with self._cond:
+            self.en_vuelo -= 1
+            ahora = time.monotonic()
+            if exito and latencia <= self.latencia_objetivo:
+                # +1 por cada "ventana" completa de peticiones correctas.
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            elif ahora - self._ultimo_recorte >= self.latencia_objetivo:
+                # Un único recorte por episodio: las peticiones que ya estaban en vuelo no lo repiten.
+                self.limite = max(self.minimo, self.limite / 2)
+                self._ultimo_recorte = ahora
+                self.recortes += 1
+            self._cond.notify_all()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'limite': int(self.limite), 'en_vuelo': self.en_vuelo, 'recortes': self.recortes}
+
+
+class CircuitBreaker:
+    """Circuito de tres estados: cerrado, abierto y semiabierto (una petición de prueba)."""
+
+    CERRADO, ABIERTO, SEMIABIERTO = 'cerrado', 'abierto', 'semiabierto'
+
+    def __init__(self, umbral_fallos: int, tiempo_apertura: float):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self._abierto_hasta = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def permitir(self) -> None:
+        """Lanza ``CircuitoAbierto`` si la llamada no debe realizarse."""
+        with self._lock:
+            if self.estado == self.CERRADO:
+                return
+            ahora = time.monotonic()
+            if self.estado == self.ABIERTO and ahora >= self._abierto_hasta:
+                self.estado = self.SEMIABIERTO
+            if self.estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return
+            self.rechazadas += 1
+            reintentar_en = max(self._abierto_hasta - ahora, 1.0)
+        raise CircuitoAbierto(f"Circuito de la API de productos {self.estado}.", reintentar_en)
+
+    def cancelar(self) -> None:
+        """Libera la petición de prueba cuando finalmente no se llegó a realizar."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def registrar(self, exito: bool) -> None:
+        with self._lock:
+            self._prueba_en_curso = False
+            if exito:
+                self.estado = self.CERRADO
+                self.fallos_consecutivos = 0
+                return
+            self.fallos_consecutivos += 1
+            if self.estado == self.SEMIABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+                if self.estado != self.ABIERTO:
+                    self.aperturas += 1
+                self.estado = self.ABIERTO
+                self._abierto_hasta = time.monotonic() + self.tiempo_apertura
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'estado': self.estado, 'fallos_consecutivos': self.fallos_consecutivos,
+                'aperturas': self.aperturas, 'rechazadas': self.rechazadas,
+                'abierto_durante_s': round(max(self._abierto_hasta - time.monotonic(), 0.0), 1)
+                if self.estado == self.ABIERTO else 0.0,
+            }
+
+
+class GuardaAPI:
+    """Aplica circuito, tasa y concurrencia a cada llamada a la API."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.espera_max = config['espera_max']
+        self.circuito = CircuitBreaker(config['umbral_fallos'], config['tiempo_apertura'])
+        self.tasa = TokenBucket(config['tasa_por_segundo'], config['rafaga'])
+        self.concurrencia = LimiteAdaptativo(
+            config['concurrencia_min'], config['concurrencia_inicial'], config['concurrencia_max'],
+            config['latencia_objetivo'],
+        )
+
+    @contextmanager
+    def llamada(self):
+        """
+        Envuelve una petición a la API.
+
+        El bloque debe asignar ``resultado['exito']`` cuando la respuesta sea válida
+        (p. ej. un 404 es una respuesta correcta; un 5xx no). Una excepción cuenta
+        como fallo.
+        """
+        self.circuito.permitir()
+        if not self.tasa.adquirir(self.espera_max):
+            self.circuito.cancelar()
+            raise LimiteExcedido("Límite de peticiones por segundo alcanzado.", self.espera_max)
+        if not self.concurrencia.adquirir(self.espera_max):
+            self.circuito.cancelar()
+            raise LimiteExcedido("Límite de peticiones simultáneas alcanzado.", self.espera_max)
+        resultado = {'exito': False}
+        inicio = time.monotonic()
+        try:
+            yield resultado
+        finally:
+            self.concurrencia.liberar(time.monotonic() - inicio, resultado['exito'])
+            self.circuito.registrar(resultado['exito'])
+
+    @asynccontextmanager
+    async def llamada_async(self):
+        """
+        Equivalente a ``llamada`` para el bucle de eventos del consumidor asyncio.
+
+        Espera su turno con ``asyncio.sleep`` en lugar de bloquear el hilo, de modo
+        que las peticiones en espera no detienen al resto de tareas del bucle.
+        """
+        self.circuito.permitir()
+        limite = time.monotonic() + self.espera_max
+        for limitador, mensaje in ((self.tasa, "Límite de peticiones por segundo alcanzado."),
+                                   (self.concurrencia, "Límite de peticiones simultáneas alcanzado.")):
+            while not limitador.adquirir(0):
+                if time.monotonic() >= limite:
+                    self.circuito.cancelar()
+                    raise LimiteExcedido(mensaje, self.espera_max)
+                await asyncio.sleep(INTERVALO_SONDEO)
+        resultado = {'exito': False}
+        inicio = time.monotonic()
+        try:
+            yield resultado
+        finally:
+            self.concurrencia.liberar(time.monotonic() - inicio, resultado['exito'])
+            self.circuito.registrar(resultado['exito'])
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            'circuito': self.circuito.estadisticas(),
+            'tasa': self.tasa.estadisticas(),
+            'concurrencia': self.concurrencia.estadisticas(),
+        }
+
+
+guarda_api = GuardaAPI(CONFIG_RESILIENCIA)
+
+
+def calcular_aplazamiento(error: APINoDisponible) -> float:
+    """Segundos hasta reintentar una tarea rechazada, con jitter para no volver todas a la vez."""
+    return error.reintentar_en + random.uniform(0, error.reintentar_en)
+
+_ESTADOS_CIRCUITO = {CircuitBreaker.CERRADO: 0, CircuitBreaker.SEMIABIERTO: 1, CircuitBreaker.ABIERTO: 2}
+
+
+def _indicadores_guarda():
+    estadisticas = guarda_api.estadisticas()
+    valores = {('circuito_estado',): _ESTADOS_CIRCUITO[estadisticas['circuito']['estado']]}
+    for grupo, campos in estadisticas.items():
+        for campo, valor in campos.items():
+            if isinstance(valor, (int, float)):
+                valores[(f'{grupo}_{campo}',)] = valor
+    return valores
+
+
+registro.indicador(
+    'pedidos_api_guarda', 'Estado del circuito (0 cerrado, 1 semiabierto, 2 abierto) y del limitador de la API.',
+    _indicadores_guarda, ['campo'],
+)
@@ -0,0 +1,249 @@
+"""
+Retención, archivo y compactación de los datos de auditoría.
+
+``TaskHistory`` recibe al menos una fila por tarea y los resultados y errores de
+Huey se acumulan en la tabla ``kv`` de huey.db. Una tarea periódica mueve las
+filas más antiguas que el plazo configurado a archivos JSONL comprimidos con gzip
+y particionados por día, y después las borra:
+
+- Se trabaja en lotes pequeños (``tamano_lote``): cada lote se escribe en el
+  archivo y luego se borra en una transacción propia, con una pausa entre lotes,
+  así que el bloqueo de escritura de SQLite se libera enseguida para los workers.
+- Los archivos se abren en modo append; cada lote añade un miembro gzip nuevo. Si
+  el proceso se detiene entre escribir y borrar, el siguiente pase vuelve a
+  archivar esas filas y la consulta del archivo descarta los duplicados.
+- Los valores de ``kv`` no guardan fecha. Cada pase anota el mayor ``rowid`` de la
+  tabla junto con la hora (``insert or replace`` asigna siempre un rowid nuevo), y
+  se archivan las claves con un rowid anterior a la marca más reciente que ya
+  superó el plazo.
+
+Tras borrar, el espacio libre se devuelve al sistema con ``incremental_vacuum``; la
+primera compactación de una base que no tiene ``auto_vacuum=INCREMENTAL`` la
+activa con un ``VACUUM`` completo.
+"""
+
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from huey.contrib.djhuey import HUEY
+from huey.storage import SqliteStorage
+from huey.utils import Error
+
+from .models import TaskHistory
+
+CONFIG_RETENCION = {
+    'dias_historial': 30,               # Antigüedad a partir de la cual TaskHistory se archiva.
+    'dias_resultados_huey': 7,          # Antigüedad a partir de la cual los resultados de Huey se archivan.
+    'directorio': Path(settings.BASE_DIR) / 'archivo',
+    'tamano_lote': 500,                 # Filas por lote (una transacción de borrado por lote).
+    'max_lotes': 200,                   # Lotes por ejecución de la tarea periódica.
+    'pausa_entre_lotes': 0.05,          # Segundos sin bloqueo entre lotes para los workers.
+    'paginas_vacuum': 2000,             # Páginas liberadas por cada paso de incremental_vacuum.
+    'vacuum_completo': True,            # Permite el VACUUM completo que activa auto_vacuum=INCREMENTAL.
+    **getattr(settings, 'PEDIDOS_RETENCION', {}),
+}
+
+TIPO_HISTORIAL = 'historial'
+TIPO_RESULTADOS = 'resultados_huey'
+TIPOS_ARCHIVO = (TIPO_HISTORIAL, TIPO_RESULTADOS)
+
+# Clave de kv donde se guardan las marcas ``[(timestamp, max_rowid), ...]`` de los resultados de Huey.
+CLAVE_MARCAS_KV = 'pedidos:marcas_retencion'
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def ruta_particion(tipo: str, dia: date) -> Path:
+    return Path(CONFIG_RETENCION['directorio']) / tipo / f'{dia:%Y}' / f'{tipo}-{dia:%Y-%m-%d}.jsonl.gz'
+
+
+def _escribir_particiones(tipo: str, filas: List[Dict[str, Any]], dia_de: Callable[[Dict[str, Any]], date]) -> None:
+    """Añade las filas a sus particiones diarias y las lleva a disco antes de que se borren de la base."""
+    por_dia: Dict[date, List[Dict[str, Any]]] = {}
+    for fila in filas:
+        por_dia.setdefault(dia_de(fila), []).append(fila)
+    for dia, filas_dia in por_dia.items():
+        ruta = ruta_particion(tipo, dia)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        with open(ruta, 'ab') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                for fila in filas_dia:
+                    gz.write(json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def archivar_historial(max_lotes: Optional[int] = None) -> int:
+    """
+    Archiva y borra las entradas de TaskHistory anteriores a ``dias_historial``.
+
+    Returns:
+        El número de filas archivadas.
+    """
+    corte = timezone.now() - timedelta(days=CONFIG_RETENCION['dias_historial'])
+    campos = [f.attname for f in TaskHistory._meta.concrete_fields]
+    archivadas = 0
+    for _ in range(max_lotes or CONFIG_RETENCION['max_lotes']):
+        # Recorre el índice de start_time; las filas ya borradas no vuelven a aparecer.
+        filas = list(TaskHistory.objects.filter(start_time__lt=corte).order_by('start_time', 'task_id')
+                     .values(*campos)[:CONFIG_RETENCION['tamano_lote']])
+        if not filas:
+            break
+        _escribir_particiones(TIPO_HISTORIAL, filas, lambda fila: fila['start_time'].date())
+        with transaction.atomic():
+            TaskHistory.objects.filter(pk__in=[fila['task_id'] for fila in filas], start_time__lt=corte).delete()
+        archivadas += len(filas)
+        if len(filas) < CONFIG_RETENCION['tamano_lote']:
+            break
+        time.sleep(CONFIG_RETENCION['pausa_entre_lotes'])
+    return archivadas
+
+
+def _marca_vencida(storage: SqliteStorage) -> Optional[Tuple[float, int]]:
+    """
+    Anota la marca ``(timestamp, max_rowid)`` de este pase y devuelve la más reciente que ya superó el plazo.
+
+    Toda clave de kv con un rowid menor o igual que el de esa marca se escribió por última vez antes de su timestamp.
+    """
+    ahora = time.time()
+    limite = ahora - CONFIG_RETENCION['dias_resultados_huey'] * 86400
+    marcas = HUEY.get(CLAVE_MARCAS_KV, peek=True) or []
+    vencida = next((marca for marca in reversed(marcas) if marca[0] <= limite), None)
+    max_rowid = storage.sql('select max(rowid) from kv where queue = ?', (storage.name,), results=True)[0][0]
+    # Solo hace falta conservar la última marca vencida y las que aún no lo están.
+    marcas = ([vencida] if vencida else []) + [marca for marca in marcas if marca[0] > limite]
+    if max_rowid is not None:
+        marcas.append((ahora, max_rowid))
+    HUEY.put(CLAVE_MARCAS_KV, marcas)
+    return vencida
+
+
+def _fila_resultado(clave: str, valor: bytes, guardado_antes_de: datetime) -> Dict[str, Any]:
+    fila = {'task_id': clave, 'guardado_antes_de': guardado_antes_de}
+    try:
+        dato = HUEY.serializer.deserialize(valor)
+    except Exception as e:
+        return {**fila, 'ilegible': repr(e)}
+    if isinstance(dato, Error):
+        return {**fila, 'fallida': True, **dato.metadata}
+    return {**fila, 'fallida': False, 'resultado': repr(dato)}
+
+
+def archivar_resultados_huey(max_lotes: Optional[int] = None) -> int:
+    """
+    Archiva y borra los resultados y errores de tareas guardados en huey.db hace más de ``dias_resultados_huey``.
+
+    Solo se consideran las claves con forma de id de tarea (36 caracteres): los locks,
+    marcas de revocación y claves del proyecto no se tocan.
+
+    Returns:
+        El número de resultados archivados.
+    """
+    storage = HUEY.storage
+    if not isinstance(storage, SqliteStorage) or HUEY.immediate:
+        return 0
+    vencida = _marca_vencida(storage)
+    if vencida is None:
+        return 0
+    guardado_antes_de, rowid_corte = datetime.fromtimestamp(vencida[0], tz=dt_timezone.utc), vencida[1]
+    archivados, ultimo_rowid = 0, 0
+    for _ in range(max_lotes or CONFIG_RETENCION['max_lotes']):
+        filas = storage.sql(
+            'select rowid, key, value from kv where queue = ? and rowid > ? and rowid <= ? and length(key) = 36 '
+            'order by rowid limit ?',
+            (storage.name, ultimo_rowid, rowid_corte, CONFIG_RETENCION['tamano_lote']), results=True)
+        if not filas:
+            break
+        _escribir_particiones(TIPO_RESULTADOS, [_fila_resultado(clave, valor, guardado_antes_de)
+                                                for _, clave, valor in filas],
+                              lambda fila: fila['guardado_antes_de'].date())
+        ultimo_rowid = filas[-1][0]
+        rowids = [rowid for rowid, _, _ in filas]
+        storage.sql(f'delete from kv where rowid in ({",".join("?" * len(rowids))})', rowids, commit=True)
+        archivados += len(filas)
+        if len(filas) < CONFIG_RETENCION['tamano_lote']:
+            break
+        time.sleep(CONFIG_RETENCION['pausa_entre_lotes'])
+    return archivados
+
+
+def _compactar(ejecutar: Callable[[str], list], completo: bool) -> str:
+    """
+    Libera las páginas vacías de una base SQLite.
+
+    ``ejecutar`` recibe una sentencia y devuelve sus filas (todas deben leerse para
+    que ``incremental_vacuum`` complete su trabajo).
+
+    Returns:
+        ``incremental``, ``vacuum`` (se activó el modo incremental) u ``omitida``.
+    """
+    if ejecutar('PRAGMA auto_vacuum')[0][0] != AUTO_VACUUM_INCREMENTAL:
+        if not (completo and CONFIG_RETENCION['vacuum_completo']):
+            return 'omitida'
+        # Cambiar auto_vacuum en una base existente requiere reconstruirla una vez.
+        ejecutar('PRAGMA auto_vacuum = INCREMENTAL')
+        ejecutar('VACUUM')
+        return 'vacuum'
+    while ejecutar('PRAGMA freelist_count')[0][0]:
+        ejecutar(f"PRAGMA incremental_vacuum({int(CONFIG_RETENCION['paginas_vacuum'])})")
+        if not completo:
+            break
+        time.sleep(CONFIG_RETENCION['pausa_entre_lotes'])
+    return 'incremental'
+
+
+def compactar_bases_datos(completo: bool = False) -> Dict[str, str]:
+    """
+    Compacta db.sqlite3 y huey.db.
+
+    Args:
+        completo: Libera todas las páginas vacías (y, si hace falta, ejecuta el
+            ``VACUUM`` que activa el modo incremental). Si es False solo libera un
+            paso de ``paginas_vacuum`` páginas por base.
+    """
+    resultado = {}
+    if connection.vendor == 'sqlite':
+        def ejecutar_app(sql):
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                return cursor.fetchall()
+        resultado['app'] = _compactar(ejecutar_app, completo)
+    if isinstance(HUEY.storage, SqliteStorage) and not HUEY.immediate:
+        resultado['huey'] = _compactar(lambda sql: HUEY.storage.sql(sql, results=True), completo)
+    return resultado
+
+
+def aplicar_retencion() -> Dict[str, Any]:
+    """Pase completo de la tarea periódica: archiva ambas fuentes y libera un paso de páginas."""
+    resumen = {'historial': archivar_historial(), 'resultados_huey': archivar_resultados_huey()}
+    resumen['compactacion'] = compactar_bases_datos(completo=False)
+    return resumen
+
+
+def leer_archivo(tipo: str, desde: date, hasta: date) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre las filas archivadas de las particiones entre ``desde`` y ``hasta`` (incluidas).
+
+    Las filas repetidas (archivadas dos veces por un pase interrumpido) se devuelven una sola vez.
+    """
+    vistos = set()
+    sufijo = '.jsonl.gz'
+    for ruta in sorted((Path(CONFIG_RETENCION['directorio']) / tipo).glob(f'*/{tipo}-*{sufijo}')):
+        dia = date.fromisoformat(ruta.name[len(tipo) + 1:-len(sufijo)])
+        if not desde <= dia <= hasta:
+            continue
+        with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+            for linea in f:
+                fila = json.loads(linea)
+                if fila['task_id'] not in vistos:
+                    vistos.add(fila['task_id'])
+                    yield fila
@@ -0,0 +1,100 @@
+"""
+Serializador compacto para los mensajes y resultados de la cola de Huey.
+
+El serializador por defecto guarda cada ``Message`` como un pickle de la
+namedtuple completa (con la referencia a su clase, el id de la tarea como texto y
+todos los campos vacíos), y los pedidos grandes se escriben sin comprimir en
+huey.db. ``SerializadorCompacto`` usa un formato binario propio:
+
+    cabecera (3 bytes) + indicadores (1 byte) + pickle
+
+- Los mensajes se guardan como tuplas sin los campos vacíos del final y con el
+  id de la tarea en sus 16 bytes de UUID; al leerlos se reconstruye el ``Message``.
+- Si el pickle supera ``umbral_compresion`` bytes se comprime con zlib.
+- Los datos sin cabecera se leen con el formato anterior (pickle sin más), de
+  modo que las tareas y resultados encolados antes del cambio siguen siendo legibles.
+
+Como se configura en ``HUEY['serializer']``, todos los lectores de la cola (el
+consumidor, el inspector del admin, la retención) lo usan sin cambios.
+
+Este módulo no depende de Django para poder importarse desde settings.py.
+"""
+
+import pickle
+import uuid
+import zlib
+
+from huey.registry import Message
+from huey.serializer import Serializer
+
+CABECERA = b'\x00pz'
+COMPRIMIDO = 0x01
+MENSAJE = 0x02
+
+
+def _id_compacto(task_id):
+    """Devuelve el UUID en 16 bytes si el id es un UUID canónico (el formato de Huey)."""
+    try:
+        valor = uuid.UUID(task_id)
+    except (TypeError, ValueError, AttributeError):
+        return task_id
+    return valor.bytes if str(valor) == task_id else task_id
+
+
+def _compactar_mensaje(mensaje: Message) -> tuple:
+    campos = list(mensaje)
+    campos[0] = _id_compacto(campos[0])
+    for i in (8, 9):  # on_complete / on_error son a su vez mensajes.
+        if isinstance(campos[i], Message):
+            campos[i] = _compactar_mensaje(campos[i])
+    while campos and campos[-1] is None:
+        campos.pop()
+    return tuple(campos)
+
+
+def _expandir_mensaje(campos: tuple) -> Message:
+    campos = list(campos)
+    if isinstance(campos[0], bytes):
+        campos[0] = str(uuid.UUID(bytes=campos[0]))
+    for i in (8, 9):
+        if i < len(campos) and isinstance(campos[i], tuple):
+            campos[i] = _expandir_mensaje(campos[i])
+    return Message(*campos)
+
+
+class SerializadorCompacto(Serializer):
+    """
+    Serializador de Huey con mensajes compactos y compresión zlib por encima de un umbral.
+
+    Args:
+        umbral_compresion: Bytes del pickle a partir de los cuales se comprime.
+        nivel_compresion: Nivel de zlib (1 = más rápido, 9 = más pequeño).
+    """
+
+    def __init__(self, umbral_compresion: int = 256, nivel_compresion: int = 6, **kwargs):
+        super().__init__(**kwargs)
+        self.umbral_compresion = umbral_compresion
+        self.nivel_compresion = nivel_compresion
+
+    def serialize(self, data) -> bytes:
+        indicadores = 0
+        if isinstance(data, Message):
+            data = _compactar_mensaje(data)
+            indicadores |= MENSAJE
+        cuerpo = pickle.dumps(data, self.pickle_protocol)
+        if len(cuerpo) > self.umbral_compresion:
+            comprimido = zlib.compress(cuerpo, self.nivel_compresion)
+            if len(comprimido) < len(cuerpo):
+                cuerpo = comprimido
+                indicadores |= COMPRIMIDO
+        return CABECERA + bytes((indicadores,)) + cuerpo
+
+    def deserialize(self, data: bytes):
+        if not data.startswith(CABECERA):
+            return super().deserialize(data)  # Formato anterior al serializador compacto.
+        indicadores = data[len(CABECERA)]
+        cuerpo = data[len(CABECERA) + 1:]
+        if indicadores & COMPRIMIDO:
+            cuerpo = zlib.decompress(cuerpo)
+        valor = pickle.loads(cuerpo)
+        return _expandir_mensaje(valor) if indicadores & MENSAJE else valor
@@ -8,117 +8,388 @@ a través de un worker de Huey, asegurando la ejecucion asincrona de las tareas.
 import hashlib
 import json
 import logging
-import requests
 import socket
-from typing import Dict, Any
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from django.db import connection, transaction
 from django.utils import timezone
 
-from huey.contrib.djhuey import task
+from huey import crontab
+from huey.contrib.djhuey import HUEY, on_shutdown, on_startup, periodic_task, task
+from huey.exceptions import RetryTask
+from .auditoria import escritor_auditoria, finalizar_historial, guardar_historial, iniciar_historial
+from .cache import cache_productos
+from .esquema import id_pedido_valido, validar_pedido
+from .errores import CONFIG_REINTENTOS, PERMANENTE, TRANSITORIO, ErrorPermanente, aplicar_politica_reintento
+from .catalogo import obtener_productos_catalogo, sincronizar_catalogo
+from .metricas import CONFIG_METRICAS, MedicionTarea, iniciar_servidor_metricas, reintentos, tareas_finalizadas
+from .idempotencia import buscar_procesado, buscar_procesados, calcular_hash_entrada, registrar_huellas
 from .models import PedidoProcesado, TaskHistory
+from .prioridad import PRIORIDAD_PERIODICAS, carril_de_prioridad
+from .resiliencia import CLAVE_ESTADO_API, APINoDisponible, calcular_aplazamiento, guarda_api
+from .retencion import aplicar_retencion, compactar_bases_datos
+from .ventas import actualizar_ventas, leer_anteriores
 
 # Define constantes a nivel de módulo para una fácil configuración y legibilidad.
-API_BASE_URL = "https://fakestoreapi.com"
 UMBRAL_DESCUENTO = 500.0
 PORCENTAJE_DESCUENTO = 0.10
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-@task(retries=2, retry_delay=10, context=True)
-def procesar_pedido_completo(pedido_data: Dict[str, Any], task=None):
+def extraer_product_ids(pedido_data: Dict[str, Any]) -> List[Optional[str]]:
+    """Obtiene el ID numérico de la API para cada línea del pedido (None si el SKU no tiene dígitos)."""
+    ids = []
+    for producto in pedido_data["productos"]:
+        sku = producto.get("sku")
+        ids.append("".join(filter(str.isdigit, sku)) if sku else None)
+    return ids
+
+
+def enriquecer_productos(pedido_data: Dict[str, Any], catalogo: Dict[str, Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Construye las líneas enriquecidas de un pedido a partir del catálogo ya consultado (Etapa B).
+
+    Raises:
+        ErrorPermanente: Si ningún producto del pedido pudo enriquecerse.
+    """
+    enriched_products = []
+    for producto, product_id in zip(pedido_data["productos"], extraer_product_ids(pedido_data)):
+        if not product_id: continue
+
+        api_data = catalogo.get(product_id)
+        if api_data:
+            enriched_products.append({
+                "sku": producto.get("sku"), "cantidad": producto["cantidad"],
+                "title": api_data.get("title"), "precio_unitario_api": float(api_data.get("price")),
+            })
+
+    if not enriched_products:
+        raise ErrorPermanente("No se pudo enriquecer ningún producto válido para el pedido.")
+    return enriched_products
+
+
+def calcular_totales(enriched_products: List[Dict[str, Any]]) -> Tuple[float, float, float]:
+    """Calcula subtotal, descuento y total final de un pedido enriquecido (Etapa C)."""
+    subtotal = sum(p["cantidad"] * p["precio_unitario_api"] for p in enriched_products)
+    descuento = subtotal * PORCENTAJE_DESCUENTO if subtotal > UMBRAL_DESCUENTO else 0.0
+    return subtotal, descuento, subtotal - descuento
+
+
+def calcular_hash(pedido_data: Dict[str, Any], enriched_products: List[Dict[str, Any]]) -> str:
+    """Genera un hash para verificar la integridad del procesamiento."""
+    hash_str = json.dumps({"pedido": pedido_data, "enriquecido": enriched_products}, sort_keys=True)
+    return hashlib.sha256(hash_str.encode()).hexdigest()
+
+
+@periodic_task(crontab(minute='*/5'), priority=PRIORIDAD_PERIODICAS)
+def reportar_cache_productos():
+    """Registra periódicamente los contadores de la caché de productos del worker."""
+    logging.info(f"[Cache productos] {cache_productos.estadisticas()}")
+
+
+@periodic_task(crontab(minute='*/15'), priority=PRIORIDAD_PERIODICAS)
+def sincronizar_catalogo_productos():
+    """Refresca la réplica local del catálogo (tabla Producto) desde el listado de la API."""
+    resumen = sincronizar_catalogo()
+    logging.info(f"[Catalogo] Sincronización completada: {resumen}")
+
+
+@periodic_task(crontab(minute='*'), priority=PRIORIDAD_PERIODICAS)
+def publicar_estado_api():
+    """
+    Publica el estado de la guarda de la API de este worker en el almacenamiento de Huey.
+
+    Así el servidor web puede mostrarlo (vista ``estado_api``) aunque la guarda viva
+    en el proceso del worker.
+    """
+    estado = {**guarda_api.estadisticas(), 'actualizado': timezone.now().isoformat()}
+    estados = HUEY.get(CLAVE_ESTADO_API, peek=True) or {}
+    estados[socket.gethostname()] = estado
+    HUEY.put(CLAVE_ESTADO_API, estados)
+    if estado['circuito']['estado'] != 'cerrado':
+        logging.warning(f"[API productos] Circuito {estado['circuito']['estado']}: {estado}")
+
+
+@periodic_task(crontab(minute='17', hour='3'), priority=PRIORIDAD_PERIODICAS)
+def actualizar_estadisticas_db():
+    """
+    Refresca las estadísticas de SQLite que usa el planificador de consultas.
+
+    El admin también las usa para estimar el tamaño de las tablas sin COUNT(*).
+    ``analysis_limit`` acota el trabajo de ANALYZE aunque las tablas sean enormes.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA analysis_limit=1000")
+            cursor.execute("ANALYZE")
+    logging.info("[Mantenimiento] Estadísticas de la base de datos actualizadas.")
+
+
+@periodic_task(crontab(minute='40'), priority=PRIORIDAD_PERIODICAS)
+def archivar_datos_antiguos():
+    """
+    Mueve a los archivos JSONL del directorio de retención el historial y los resultados de Huey antiguos.
+
+    Cada ejecución procesa como mucho ``max_lotes`` lotes; lo que quede se archiva en la siguiente hora.
+    """
+    resumen = aplicar_retencion()
+    logging.info(f"[Retencion] {resumen}")
+
+
+@periodic_task(crontab(minute='30', hour='4', day_of_week='0'), priority=PRIORIDAD_PERIODICAS)
+def compactar_bases_datos_semanal():
+    """Devuelve al sistema todas las páginas libres de db.sqlite3 y huey.db (y activa el modo incremental si falta)."""
+    resumen = compactar_bases_datos(completo=True)
+    logging.info(f"[Retencion] Compactación semanal: {resumen}")
+
+
+@on_startup()
+def exponer_metricas_worker():
+    """Publica el registro de métricas del worker en su propio puerto, si está configurado."""
+    if CONFIG_METRICAS['puerto_worker']:
+        iniciar_servidor_metricas(CONFIG_METRICAS['puerto_worker'])
+
+
+@on_shutdown()
+def volcar_auditoria_pendiente():
+    """Escribe las entradas del historial que sigan en el buffer al detener el worker."""
+    escritor_auditoria.detener()
+
+
+@task(retries=CONFIG_REINTENTOS['max_reintentos'], retry_delay=CONFIG_REINTENTOS['espera_base'], context=True)
+def procesar_pedido_completo(pedido_data: Dict[str, Any], encolado_en: Optional[float] = None, task=None):
     """
     Orquesta el flujo completo de procesamiento de un pedido de forma asíncrona.
 
     Esta tarea es idempotente y resiliente, gestionando su propio historial de
-    ejecución y manejando reintentos en caso de fallos transitorios.
+    ejecución y manejando reintentos en caso de fallos transitorios. Los errores
+    permanentes (datos inválidos) terminan la tarea sin reintentos.
 
     Args:
         pedido_data: Payload del pedido a procesar.
+        encolado_en (float, optional): Timestamp del encolado, para medir la espera en cola por carril.
         task (huey.api.Task, optional): Instancia de la tarea inyectada por Huey
                                         para acceder a metadatos de ejecución.
     """
     order_id = pedido_data.get('id')
     
-    # Crea un nuevo registro en el historial de tareas caso de reintentos actualiza los datos para garantizar unicidad.
-    history_entry, created = TaskHistory.objects.update_or_create(
-        task_id=task.id,
-        defaults={
-            'task_name': task.name,
-            'status': TaskHistory.Status.STARTED,
-            'worker_hostname': socket.gethostname()
-        }
-    )
-
-    # Si es un reintento, resetea el estado para reflejar la nueva ejecución.
-    if not created:
-        history_entry.status = TaskHistory.Status.STARTED
-        history_entry.error_message = None
-        history_entry.start_time = timezone.now()
-        history_entry.end_time = None
-        history_entry.save()
+    # Crea el registro en el historial; en caso de reintento lo resetea para reflejar la nueva ejecución.
+    history_entry = iniciar_historial(task, id_pedido_valido(order_id))
+    medicion = MedicionTarea(task.name)
+    if history_entry.reintentos:
+        reintentos.inc(tarea=task.name)
+    else:
+        medicion.registrar_espera_cola(encolado_en, carril_de_prioridad(task.priority))
 
     pedido_procesado_obj = None
     try:
         # --- ETAPA A: VALIDACIÓN DE LA ESTRUCTURA DEL PEDIDO ---
-        if not all(key in pedido_data for key in ["id", "cliente", "productos"]):
-            raise ValueError("Payload del pedido incompleto: faltan claves principales.")
-        if not isinstance(pedido_data["productos"], list) or not pedido_data["productos"]:
-            raise ValueError("La lista de productos está vacía o no es válida.")
-
-        # --- ETAPA B: ENRIQUECIMIENTO DE DATOS VÍA API EXTERNA ---
-        enriched_products = []
-        for producto in pedido_data["productos"]:
-            sku = producto.get("sku")
-            product_id = "".join(filter(str.isdigit, sku)) if sku else None
-            if not product_id: continue
-
-            response = requests.get(f"{API_BASE_URL}/products/{product_id}", timeout=10)
-            
-            if response.status_code == 200 and response.text and response.json():
-                api_data = response.json()
-                enriched_products.append({
-                    "sku": sku, "cantidad": producto["cantidad"],
-                    "title": api_data.get("title"), "precio_unitario_api": float(api_data.get("price")),
-                })
-        
-        if not enriched_products:
-            raise ValueError("No se pudo enriquecer ningún producto válido para el pedido.")
+        with medicion.etapa('validacion'):
+            validar_pedido(pedido_data)
+
+            # Atajo de idempotencia: si este mismo payload ya se procesó, se enlaza el resultado existente.
+            hash_entrada = calcular_hash_entrada(pedido_data)
+            pedido_existente_id = buscar_procesado(hash_entrada)
+        if pedido_existente_id is not None:
+            history_entry.pedido_id = pedido_existente_id
+            history_entry.status = TaskHistory.Status.SKIPPED
+            return
+
+        # --- ETAPA B: ENRIQUECIMIENTO DE DATOS DESDE LA RÉPLICA DEL CATÁLOGO ---
+        # Los SKUs repetidos se consultan una sola vez; los que no están en la réplica se piden a la API.
+        with medicion.etapa('enriquecimiento'):
+            catalogo = obtener_productos_catalogo((pid for pid in extraer_product_ids(pedido_data) if pid), medicion)
+            enriched_products = enriquecer_productos(pedido_data, catalogo)
         
         # --- ETAPA C: APLICACIÓN DE LÓGICA DE NEGOCIO ---
-        subtotal = sum(p["cantidad"] * p["precio_unitario_api"] for p in enriched_products)
-        descuento = subtotal * PORCENTAJE_DESCUENTO if subtotal > UMBRAL_DESCUENTO else 0.0
-        total_final = subtotal - descuento
-        
-        # Genera un hash para verificar la integridad del procesamiento.
-        hash_str = json.dumps({"pedido": pedido_data, "enriquecido": enriched_products}, sort_keys=True)
-        pedido_hash = hashlib.sha256(hash_str.encode()).hexdigest()
+        with medicion.etapa('negocio'):
+            subtotal, descuento, total_final = calcular_totales(enriched_products)
+            pedido_hash = calcular_hash(pedido_data, enriched_products)
 
         # --- ETAPA D: PERSISTENCIA DEL RESULTADO ---
-        pedido_procesado_obj, _ = PedidoProcesado.objects.update_or_create(
-            id_pedido_original=order_id,
-            defaults={
-                'hash_pedido': pedido_hash, 'cliente': pedido_data["cliente"],
-                'detalle_completo': enriched_products, 'subtotal': round(subtotal, 2),
-                'descuento': round(descuento, 2), 'total_final': round(total_final, 2),
-            }
-        )
-        
+        # Las ventas diarias se corrigen en la misma transacción con la diferencia respecto a la versión anterior.
+        with medicion.etapa('persistencia'), transaction.atomic():
+            anteriores = leer_anteriores([order_id])
+            guardado, _ = PedidoProcesado.objects.update_or_create(
+                id_pedido_original=order_id,
+                defaults={
+                    'hash_pedido': pedido_hash, 'cliente': pedido_data["cliente"],
+                    'detalle_completo': enriched_products, 'subtotal': round(subtotal, 2),
+                    'descuento': round(descuento, 2), 'total_final': round(total_final, 2),
+                }
+            )
+            registrar_huellas([(hash_entrada, order_id)])
+            actualizar_ventas(anteriores, [guardado])
+        # Solo se enlaza con el historial una vez confirmada la transacción: si se deshizo, el pedido no existe.
+        pedido_procesado_obj = guardado
+
         # Marca la auditoría como exitosa.
         history_entry.status = TaskHistory.Status.SUCCESS
 
+    except APINoDisponible as e:
+        # La API está protegida por la guarda: se aplaza la tarea sin consumir uno de sus reintentos.
+        history_entry.status = TaskHistory.Status.ERROR
+        history_entry.error_message = f"Aplazada: {e}"[:500]
+        history_entry.clasificacion_error = TRANSITORIO
+        raise RetryTask(str(e), delay=calcular_aplazamiento(e)) from e
+
     except Exception as e:
         # Captura cualquier error durante el flujo para registrarlo.
+        pedido_procesado_obj = None
         history_entry.status = TaskHistory.Status.ERROR
         history_entry.error_message = str(e)[:500]
+        # Decide si Huey reintenta (con espera exponencial) o si el error es definitivo.
+        history_entry.clasificacion_error = aplicar_politica_reintento(task, e)
         raise e # Relanza la excepción para que Huey gestione los reintentos.
 
     finally:
         # Este bloque se ejecuta siempre, asegurando que el log se actualice.
-        history_entry.end_time = timezone.now()
-        
         # Si el pedido se procesó, se enlaza con el historial para una trazabilidad completa.
         if pedido_procesado_obj:
             history_entry.pedido = pedido_procesado_obj
 
-        history_entry.save()
-        logging.info(f"[Pedido {order_id}] Registro de historial actualizado a estado: {history_entry.status}")
\ No newline at end of file
+        history_entry.metricas = medicion.resumen()
+        finalizar_historial(history_entry)
+        tareas_finalizadas.inc(tarea=task.name, status=history_entry.status, worker=history_entry.worker_hostname)
+        logging.info(f"[Pedido {order_id}] Registro de historial actualizado a estado: {history_entry.status}")
+
+
+@task(retries=CONFIG_REINTENTOS['max_reintentos'], retry_delay=CONFIG_REINTENTOS['espera_base'], context=True)
+def procesar_pedidos_lote(pedidos: List[Dict[str, Any]], encolado_en: Optional[float] = None, task=None):
+    """
+    Procesa un micro-lote de pedidos en una sola tarea.
+
+    Las consultas al catálogo se comparten entre todos los pedidos del lote y los
+    resultados se persisten con upserts masivos en una única transacción, de modo
+    que el lote entero cuesta un par de escrituras en SQLite en lugar de varias
+    por pedido. Cada pedido conserva su propio registro en el historial.
+
+    Un pedido con datos inválidos se registra como fallido sin afectar al resto;
+    un error transitorio del catálogo marca todo el lote como fallido y se relanza
+    para que Huey reintente el lote completo. Si la guarda de la API rechaza las
+    consultas, el lote se aplaza sin consumir reintentos.
+
+    Args:
+        pedidos: Lista de payloads de pedidos a procesar.
+        encolado_en (float, optional): Timestamp del encolado, para medir la espera en cola por carril.
+        task (huey.api.Task, optional): Instancia de la tarea inyectada por Huey.
+    """
+    hostname = socket.gethostname()
+    start_time = timezone.now()
+    # Cada pedido obtiene un ID de historial estable derivado del ID de la tarea, para que los reintentos lo actualicen.
+    task_ns = uuid.UUID(task.id)
+    historial = {}
+    medicion = MedicionTarea(task.name)
+    numero_reintento = max(task.default_retries - task.retries, 0)
+    if numero_reintento:
+        reintentos.inc(tarea=task.name)
+    else:
+        medicion.registrar_espera_cola(encolado_en, carril_de_prioridad(task.priority))
+
+    def registrar(pedido_data, status, error_message=None, pedido_id=None, clasificacion=None):
+        order_id = pedido_data.get('id') if isinstance(pedido_data, dict) else None
+        history_id = str(uuid.uuid5(task_ns, str(order_id if order_id is not None else len(historial))))
+        historial[history_id] = TaskHistory(
+            task_id=history_id, task_name=task.name, status=status, worker_hostname=hostname,
+            start_time=start_time, end_time=timezone.now(), reintentos=numero_reintento,
+            error_message=error_message[:500] if error_message else None, pedido_id=pedido_id,
+            clasificacion_error=clasificacion, id_pedido_original=id_pedido_valido(order_id),
+        )
+
+    def guardar():
+        # Las métricas son del lote completo; se copian en cada pedido junto con el tamaño del lote.
+        metricas = {**medicion.resumen(), 'lote': len(pedidos)}
+        for entrada in historial.values():
+            entrada.metricas = metricas
+        guardar_historial(historial.values())
+
+    def contar():
+        # Solo con el historial definitivo ya escrito: un volcado deshecho por la Etapa D no cuenta.
+        for entrada in historial.values():
+            tareas_finalizadas.inc(tarea=task.name, status=entrada.status, worker=hostname)
+
+    # --- ETAPA A: VALIDACIÓN DE CADA PEDIDO ---
+    with medicion.etapa('validacion'):
+        validos = []
+        for pedido_data in pedidos:
+            try:
+                validar_pedido(pedido_data)
+                validos.append(pedido_data)
+            except ValueError as e:
+                registrar(pedido_data, TaskHistory.Status.ERROR, str(e), clasificacion=PERMANENTE)
+
+        # Atajo de idempotencia: los payloads ya procesados se enlazan a su resultado sin enriquecerlos.
+        hashes_entrada = {id(pedido_data): calcular_hash_entrada(pedido_data) for pedido_data in validos}
+        ya_procesados = buscar_procesados(hashes_entrada.values())
+        nuevos = []
+        for pedido_data in validos:
+            pedido_existente_id = ya_procesados.get(hashes_entrada[id(pedido_data)])
+            if pedido_existente_id is not None:
+                registrar(pedido_data, TaskHistory.Status.SKIPPED, pedido_id=pedido_existente_id)
+            else:
+                nuevos.append(pedido_data)
+        validos = nuevos
+
+    # --- ETAPA B: ENRIQUECIMIENTO COMPARTIDO POR TODO EL LOTE ---
+    try:
+        with medicion.etapa('enriquecimiento'):
+            catalogo = obtener_productos_catalogo(
+                (pid for pedido_data in validos for pid in extraer_product_ids(pedido_data) if pid), medicion)
+    except Exception as e:
+        aplazada = isinstance(e, APINoDisponible)
+        clasificacion = TRANSITORIO if aplazada else aplicar_politica_reintento(task, e)
+        for pedido_data in validos:
+            registrar(pedido_data, TaskHistory.Status.ERROR, f"Aplazada: {e}" if aplazada else str(e),
+                      clasificacion=clasificacion)
+        guardar()
+        contar()
+        if aplazada:
+            raise RetryTask(str(e), delay=calcular_aplazamiento(e)) from e
+        raise e # Relanza la excepción para que Huey reintente el lote.
+
+    # --- ETAPA C: LÓGICA DE NEGOCIO POR PEDIDO ---
+    with medicion.etapa('negocio'):
+        procesados, huellas = {}, []
+        for pedido_data in validos:
+            try:
+                enriched_products = enriquecer_productos(pedido_data, catalogo)
+            except ValueError as e:
+                registrar(pedido_data, TaskHistory.Status.ERROR, str(e), clasificacion=PERMANENTE)
+                continue
+            subtotal, descuento, total_final = calcular_totales(enriched_products)
+            procesados[pedido_data["id"]] = PedidoProcesado(
+                id_pedido_original=pedido_data["id"], hash_pedido=calcular_hash(pedido_data, enriched_products),
+                cliente=pedido_data["cliente"], detalle_completo=enriched_products, subtotal=round(subtotal, 2),
+                descuento=round(descuento, 2), total_final=round(total_final, 2),
+            )
+            huellas.append((hashes_entrada[id(pedido_data)], pedido_data["id"]))
+            registrar(pedido_data, TaskHistory.Status.SUCCESS, pedido_id=pedido_data["id"])
+
+    # --- ETAPA D: PERSISTENCIA MASIVA EN UNA SOLA TRANSACCIÓN ---
+    try:
+        with medicion.etapa('persistencia'), transaction.atomic():
+            anteriores = leer_anteriores(procesados.keys())
+            PedidoProcesado.objects.bulk_create(
+                procesados.values(), update_conflicts=True, unique_fields=['id_pedido_original'],
+                update_fields=['hash_pedido', 'cliente', 'detalle_completo', 'subtotal', 'descuento', 'total_final'],
+            )
+            registrar_huellas(huellas)
+            actualizar_ventas(anteriores, procesados.values())
+            guardar()
+    except Exception as e:
+        clasificacion = aplicar_politica_reintento(task, e)
+        # La transacción se deshizo completa, historial incluido: los pedidos que iban a guardarse pasan a ERROR
+        # y el historial del lote (con los fallidos y omitidos de la Etapa A) se escribe fuera de ella.
+        for entrada in historial.values():
+            if entrada.status == TaskHistory.Status.SUCCESS:
+                entrada.status = TaskHistory.Status.ERROR
+                entrada.error_message = str(e)[:500]
+                entrada.clasificacion_error = clasificacion
+                entrada.pedido_id = None
+        guardar()
+        contar()
+        raise e # Huey reintenta el lote si el error es transitorio.
+    contar()
+
+    logging.info(f"[Lote {task.id}] {len(procesados)} pedidos procesados, {len(historial) - len(procesados)} fallidos u omitidos.")
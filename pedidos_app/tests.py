@@ -0,0 +1,1032 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from huey.contrib.djhuey import HUEY
+from huey.registry import Message
+from huey.serializer import Serializer
+from huey.storage import SqliteStorage
+from huey.utils import Error
+
+from .auditoria import CONFIG_AUDITORIA, EscritorAuditoria, finalizar_historial, iniciar_historial
+from .cache import CacheLRU
+from .catalogo import sincronizar_catalogo
+from .consumidor_asyncio import FACTOR_EN_VUELO, ConsumidorAsyncio
+from .encolado import crear_tarea
+from .errores import (CONFIG_REINTENTOS, PERMANENTE, TRANSITORIO, ErrorPermanente, ErrorTransitorio,
+                      aplicar_politica_reintento, clasificar_error)
+from .esquema import CONFIG_ESQUEMA, MAX_ID_PEDIDO, ErrorValidacion, esquema_pedido, validar_pedido
+from .estado_pedidos import CONFIG_ESTADO_PEDIDOS, cache_estados
+from .exportacion import CAMPOS, exportar, filtrar_pedidos, iterar_lotes, parametros_exportacion
+from .idempotencia import calcular_hash_entrada, indice_huellas
+from . import api_productos, auditoria, inspector_huey, metricas
+from .management.commands.ingestar_pedidos import Command as IngestarPedidos
+from .models import PedidoProcesado, Producto, TaskHistory, VentaDiariaCliente
+from .prioridad import CONFIG_PRIORIDAD, PRIORIDAD_PERIODICAS, TurnosClientes, prioridad_pedido
+from .resiliencia import CircuitBreaker, CircuitoAbierto, LimiteAdaptativo
+from .retencion import CONFIG_RETENCION, TIPO_HISTORIAL, archivar_historial, leer_archivo, ruta_particion
+from .serializacion import CABECERA, COMPRIMIDO, SerializadorCompacto
+from .tasks import (archivar_datos_antiguos, procesar_pedido_completo, procesar_pedidos_lote,
+                    sincronizar_catalogo_productos)
+from .ventas import actualizar_ventas, consultar_ventas, dia_venta, leer_anteriores, reconstruir_dia
+
+
+def _pedido(cliente='ACME', lineas=1, **extra):
+    productos = [{'sku': f'SKU-{i}', 'cantidad': 1} for i in range(lineas)]
+    return {'id': 1, 'cliente': cliente, 'productos': productos, **extra}
+
+
+class PrioridadTests(SimpleTestCase):
+    """Carriles, turnos por cliente y prioridad de las tareas periódicas."""
+
+    def test_carril_explicito_y_por_tamano(self):
+        alta = prioridad_pedido(_pedido('A', prioridad='alta'))
+        normal = prioridad_pedido(_pedido('B'))
+        baja = prioridad_pedido(_pedido('C', lineas=CONFIG_PRIORIDAD['max_lineas_normal'] + 1))
+        self.assertGreater(alta, normal)
+        self.assertGreater(normal, baja)
+
+    def test_turno_no_alcanza_el_carril_siguiente(self):
+        base = CONFIG_PRIORIDAD['carriles']['normal']
+        for _ in range(50):
+            valor = prioridad_pedido(_pedido('masivo'))
+            self.assertGreater(valor, base)
+            self.assertLessEqual(valor, base + 0.5)
+
+    def test_turnos_intercalan_clientes(self):
+        turnos = TurnosClientes(semivida=3600, pesos={})
+        masivo = [turnos.siguiente('masivo') for _ in range(3)]
+        self.assertEqual(turnos.siguiente('otro'), 0)
+        self.assertLess(masivo[0], masivo[1])
+        self.assertLess(masivo[1], masivo[2])
+
+    def test_periodicas_por_encima_de_todos_los_carriles(self):
+        self.assertGreater(PRIORIDAD_PERIODICAS, max(CONFIG_PRIORIDAD['carriles'].values()) + 0.5)
+        self.assertEqual(sincronizar_catalogo_productos.s().priority, PRIORIDAD_PERIODICAS)
+
+    def test_periodica_se_desencola_antes_que_los_pedidos(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            storage = SqliteStorage(name='prueba', filename=os.path.join(directorio, 'cola.db'))
+            for i in range(20):
+                tarea = crear_tarea(_pedido('masivo', prioridad='alta' if i % 2 else None))
+                storage.enqueue(HUEY.serialize_task(tarea), tarea.priority)
+            for periodica in (sincronizar_catalogo_productos, archivar_datos_antiguos):
+                tarea = periodica.s()
+                storage.enqueue(HUEY.serialize_task(tarea), tarea.priority)
+
+            primeras = [HUEY.deserialize_task(storage.dequeue()).name for _ in range(2)]
+            storage.close()
+        self.assertEqual(primeras, [sincronizar_catalogo_productos.s().name, archivar_datos_antiguos.s().name])
+
+
+class LoteTests(TestCase):
+    """Historial de ``procesar_pedidos_lote`` cuando falla la persistencia."""
+
+    def setUp(self):
+        sincronizar_catalogo([{'id': 1, 'title': 'Producto 1', 'price': 10}])
+
+    def ejecutar(self, pedidos):
+        tarea = procesar_pedidos_lote.s(pedidos)
+        procesar_pedidos_lote.func(pedidos, task=tarea)
+
+    def test_fallo_en_persistencia_deja_historial_de_todo_el_lote(self):
+        pedidos = [
+            {'id': 501, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 2}]},
+            {'id': 502, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 0}]},
+        ]
+        with mock.patch('pedidos_app.tasks.actualizar_ventas', side_effect=IntegrityError('fallo')):
+            with self.assertRaises(IntegrityError):
+                self.ejecutar(pedidos)
+
+        self.assertFalse(PedidoProcesado.objects.exists())
+        historial = {h.id_pedido_original: h for h in TaskHistory.objects.all()}
+        self.assertEqual(set(historial), {501, 502})
+        self.assertEqual(historial[501].status, TaskHistory.Status.ERROR)
+        self.assertEqual(historial[501].clasificacion_error, 'permanente')
+        self.assertIsNone(historial[501].pedido_id)
+        self.assertEqual(historial[502].status, TaskHistory.Status.ERROR)
+        self.assertIn('cantidad', historial[502].error_message)
+
+    def test_cada_pedido_cuenta_una_vez(self):
+        pedidos = [
+            {'id': 501, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 2}]},
+            {'id': 502, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 0}]},
+        ]
+        # Falla la escritura del historial dentro de la transacción; la del camino de error sí se hace.
+        escrituras = iter([OperationalError('database is locked'), None])
+
+        def guardar_historial(entradas):
+            error = next(escrituras)
+            if error:
+                raise error
+            auditoria.guardar_historial(entradas)
+
+        with mock.patch('pedidos_app.tasks.tareas_finalizadas') as contador:
+            with mock.patch('pedidos_app.tasks.guardar_historial', side_effect=guardar_historial):
+                with self.assertRaises(OperationalError):
+                    self.ejecutar(pedidos)
+            self.assertEqual([c.kwargs['status'] for c in contador.inc.call_args_list], ['ERROR', 'ERROR'])
+
+            contador.reset_mock()
+            self.ejecutar(pedidos)
+            self.assertEqual(sorted(c.kwargs['status'] for c in contador.inc.call_args_list), ['ERROR', 'SUCCESS'])
+
+
+class ReintentoPersistenciaTests(TestCase):
+    """Un error transitorio en la Etapa D no debe dejar rastro que impida el reintento."""
+
+    pedido = {'id': 601, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 2}]}
+
+    def setUp(self):
+        sincronizar_catalogo([{'id': 1, 'title': 'Producto 1', 'price': 10}])
+        indice_huellas.limpiar()
+        self.addCleanup(indice_huellas.limpiar)
+
+    def ejecutar(self, tarea, func, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            func(*args, task=tarea)
+
+    def comprobar_reintento(self, tarea, func, *args):
+        # La transacción se deshizo: ni pedido, ni ventas, ni huella en memoria.
+        with mock.patch('pedidos_app.tasks.actualizar_ventas', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.ejecutar(tarea, func, *args)
+        historial = TaskHistory.objects.get(id_pedido_original=601)
+        self.assertEqual((historial.status, historial.clasificacion_error, historial.pedido_id),
+                         (TaskHistory.Status.ERROR, 'transitorio', None))
+        self.assertFalse(PedidoProcesado.objects.exists())
+        self.assertFalse(VentaDiariaCliente.objects.exists())
+        self.assertFalse(indice_huellas.contiene(calcular_hash_entrada(self.pedido)))
+
+        self.ejecutar(tarea, func, *args)
+        historial = TaskHistory.objects.get(id_pedido_original=601)
+        self.assertEqual((historial.status, historial.pedido_id), (TaskHistory.Status.SUCCESS, 601))
+        self.assertEqual(VentaDiariaCliente.objects.get(cliente='ACME').pedidos, 1)
+        self.assertTrue(indice_huellas.contiene(calcular_hash_entrada(self.pedido)))
+
+    def test_pedido_individual(self):
+        tarea = procesar_pedido_completo.s(self.pedido)
+        self.comprobar_reintento(tarea, procesar_pedido_completo.func, self.pedido)
+
+    def test_lote(self):
+        tarea = procesar_pedidos_lote.s([self.pedido])
+        self.comprobar_reintento(tarea, procesar_pedidos_lote.func, [self.pedido])
+
+
+class ConsumidorAsyncioTests(SimpleTestCase):
+    """Límite de tareas desencoladas y precarga de la API con httpx como dependencia opcional."""
+
+    def test_tareas_desencoladas_acotadas_por_hilos_orm(self):
+        consumidor = ConsumidorAsyncio(HUEY, hilos_orm=3, precarga_api=False)
+        self.assertEqual(consumidor.max_en_vuelo, FACTOR_EN_VUELO * 3)
+
+    def test_sin_httpx_se_desactiva_la_precarga_por_defecto(self):
+        with mock.patch('pedidos_app.consumidor_asyncio._httpx_disponible', return_value=False):
+            consumidor = ConsumidorAsyncio(HUEY, precarga_api=None)
+        self.assertFalse(consumidor.precarga_api)
+
+    def test_precarga_explicita_sin_httpx_falla(self):
+        with mock.patch('pedidos_app.consumidor_asyncio._httpx_disponible', return_value=False):
+            with self.assertRaises(ImproperlyConfigured):
+                ConsumidorAsyncio(HUEY, precarga_api=True)
+
+
+class EstadoPedidosTests(TestCase):
+    """Consulta de estado: estados, ETag/304 y caché de los estados finales."""
+
+    def setUp(self):
+        cache_estados.limpiar()
+        self.inicio = timezone.now() - timedelta(minutes=5)
+        PedidoProcesado.objects.create(id_pedido_original=7, hash_pedido='h7', cliente='ACME', detalle_completo=[],
+                                       subtotal=10, descuento=0, total_final=10)
+        self.historial(7, TaskHistory.Status.SUCCESS, self.inicio)
+
+    def historial(self, pedido_id, status, inicio, **campos):
+        return TaskHistory.objects.create(task_id=f'{pedido_id}-{inicio.timestamp()}', task_name='prueba',
+                                          status=status, start_time=inicio, id_pedido_original=pedido_id, **campos)
+
+    def test_estados(self):
+        self.historial(8, TaskHistory.Status.ERROR, self.inicio, clasificacion_error='transitorio', reintentos=1,
+                       error_message='timeout')
+        self.historial(9, TaskHistory.Status.ERROR, self.inicio, clasificacion_error='permanente',
+                       error_message='SKU inexistente')
+        self.historial(10, TaskHistory.Status.STARTED, self.inicio)
+        respuesta = self.client.get('/pedidos/estado/', {'ids': '7,8,9,10,11'})
+        estados = {e['id']: e for e in respuesta.json()['pedidos']}
+        self.assertEqual([e['estado'] for e in estados.values()],
+                         ['procesado', 'reintentando', 'fallido', 'en_proceso', 'sin_registro'])
+        self.assertEqual(estados[7]['total_final'], '10.00')
+        self.assertEqual(estados[9]['ultimo_error']['mensaje'], 'SKU inexistente')
+
+    def test_etag_y_304(self):
+        respuesta = self.client.get('/pedidos/estado/7/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Cache-Control'], 'no-cache')
+        etag = respuesta['ETag']
+        repetida = self.client.get('/pedidos/estado/7/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b'')
+        self.assertEqual(self.client.get('/pedidos/estado/7/', HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+    def test_estado_final_recien_comprobado_sale_de_la_cache(self):
+        self.client.get('/pedidos/estado/7/')
+        with self.assertNumQueries(0):
+            self.client.get('/pedidos/estado/7/')
+
+    def test_estado_final_en_cache_se_renueva_con_una_ejecucion_posterior(self):
+        with mock.patch.dict(CONFIG_ESTADO_PEDIDOS, ttl_pendiente=0):
+            self.assertEqual(self.client.get('/pedidos/estado/7/').json()['estado'], 'procesado')
+            with self.assertNumQueries(1):
+                self.client.get('/pedidos/estado/7/')
+            # Otro proceso (el worker) reprocesa el pedido: la caché de este proceso no se invalida.
+            self.historial(7, TaskHistory.Status.STARTED, timezone.now())
+            self.assertEqual(self.client.get('/pedidos/estado/7/').json()['estado'], 'en_proceso')
+
+    def test_ids_invalidos(self):
+        self.assertEqual(self.client.get('/pedidos/estado/', {'ids': 'a,b'}).status_code, 400)
+        self.assertEqual(self.client.get('/pedidos/estado/').status_code, 400)
+        self.assertEqual(self.client.get('/pedidos/estado/', {'ids': ','.join(map(str, range(1, 102)))}).status_code, 400)
+
+
+class TaskHistoryAdminTests(TestCase):
+    """Búsqueda y filtros de los listados grandes del admin."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+
+    def test_busqueda_encuentra_tareas_fallidas_sin_pedido(self):
+        TaskHistory.objects.create(task_id='tarea-sin-pedido', task_name='prueba', status=TaskHistory.Status.ERROR,
+                                   id_pedido_original=4242, error_message='SKU inexistente')
+        respuesta = self.client.get('/admin/pedidos_app/taskhistory/', {'q': '4242'})
+        self.assertContains(respuesta, 'tarea-sin-pedido')
+
+    def test_listados_sin_distinct_sobre_tablas_grandes(self):
+        tablas = (PedidoProcesado._meta.db_table, TaskHistory._meta.db_table)
+        for url in ('/admin/pedidos_app/pedidoprocesado/', '/admin/pedidos_app/taskhistory/'):
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            distintas = [c['sql'] for c in consultas if 'DISTINCT' in c['sql'] and any(t in c['sql'] for t in tablas)]
+            self.assertEqual(distintas, [], url)
+
+    def test_filtros_de_historial_y_pedidos(self):
+        for i, (tarea, worker) in enumerate([('procesar_pedidos_lote', 'w1'), ('procesar_pedido_completo', 'w2')]):
+            TaskHistory.objects.create(task_id=f'tarea-{i}', task_name=tarea, status=TaskHistory.Status.SUCCESS,
+                                       worker_hostname=worker)
+        respuesta = self.client.get('/admin/pedidos_app/taskhistory/', {'task_name': 'procesar_pedidos_lote'})
+        self.assertContains(respuesta, 'tarea-0')
+        self.assertNotContains(respuesta, 'tarea-1')
+        respuesta = self.client.get('/admin/pedidos_app/taskhistory/', {'worker_hostname': 'w2'})
+        self.assertContains(respuesta, 'tarea-1')
+        self.assertNotContains(respuesta, 'tarea-0')
+
+        VentaDiariaCliente.objects.create(cliente='Globex', dia=timezone.localdate(), pedidos=1)
+        respuesta = self.client.get('/admin/pedidos_app/pedidoprocesado/')
+        self.assertContains(respuesta, '?cliente=Globex')
+
+
+class CatalogoTests(TestCase):
+    """Sincronización de la réplica del catálogo."""
+
+    def setUp(self):
+        self.listado = [{'id': i, 'title': f'Producto {i}', 'price': i} for i in range(1, 11)]
+        sincronizar_catalogo(self.listado)
+
+    def activos(self):
+        return Producto.objects.filter(activo=True).count()
+
+    def test_solo_escribe_cambios_y_desactiva_ausentes(self):
+        listado = self.listado[:9]
+        listado[0] = {**listado[0], 'price': 99}
+        resumen = sincronizar_catalogo(listado)
+        self.assertEqual((resumen['actualizados'], resumen['desactivados'], resumen['sin_cambios']), (1, 1, 8))
+        self.assertEqual(self.activos(), 9)
+
+    def test_listado_vacio_no_desactiva(self):
+        with self.assertLogs(level='WARNING'):
+            resumen = sincronizar_catalogo([])
+        self.assertEqual((resumen['desactivados'], resumen['retirados_omitidos']), (0, 10))
+        self.assertEqual(self.activos(), 10)
+
+    def test_listado_truncado_no_desactiva_salvo_forzado(self):
+        with self.assertLogs(level='WARNING'):
+            resumen = sincronizar_catalogo(self.listado[:5])
+        self.assertEqual(resumen['retirados_omitidos'], 5)
+        self.assertEqual(self.activos(), 10)
+        resumen = sincronizar_catalogo(self.listado[:5], forzar_retirados=True)
+        self.assertEqual(resumen['desactivados'], 5)
+        self.assertEqual(self.activos(), 5)
+
+
+class ServidorMetricasTests(SimpleTestCase):
+    """Servidor de métricas del worker."""
+
+    def tearDown(self):
+        if metricas._servidor_worker is not None:
+            metricas._servidor_worker.shutdown()
+            metricas._servidor_worker.server_close()
+            metricas._servidor_worker = None
+
+    def test_escucha_solo_en_local_por_defecto(self):
+        metricas.iniciar_servidor_metricas(0)
+        self.assertEqual(metricas._servidor_worker.server_address[0], '127.0.0.1')
+
+    def test_puerto_ocupado_no_detiene_el_worker(self):
+        with mock.patch('wsgiref.simple_server.make_server', side_effect=OSError('Address already in use')):
+            with self.assertLogs(level='WARNING'):
+                metricas.iniciar_servidor_metricas(9108)
+        self.assertIsNone(metricas._servidor_worker)
+
+
+class IngestarPedidosTests(SimpleTestCase):
+    """Comando ``ingestar_pedidos``: líneas inválidas y archivos dañados."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        self.encolados = []
+        encolar = mock.patch.object(IngestarPedidos, '_encolar',
+                                    side_effect=lambda lote, options: self.encolados.extend(lote) or len(lote))
+        encolar.start()
+        self.addCleanup(encolar.stop)
+
+    def lineas(self, n):
+        return [json.dumps({'id': i, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 1}]}).encode()
+                for i in range(1, n + 1)]
+
+    def test_lineas_no_utf8_se_rechazan_y_progreso_cero(self):
+        ruta = os.path.join(self.directorio, 'pedidos.jsonl')
+        rechazados = os.path.join(self.directorio, 'rechazados.jsonl')
+        with open(ruta, 'wb') as f:
+            f.write(b'\n'.join(self.lineas(2) + [b'{"cliente": "\xff\xfe"}', b'{no es json']) + b'\n')
+        call_command('ingestar_pedidos', ruta, progreso=0, rechazados=rechazados, stdout=io.StringIO())
+        self.assertEqual([p['id'] for p in self.encolados], [1, 2])
+        with open(rechazados, encoding='utf-8') as f:
+            self.assertEqual([json.loads(linea)['linea'] for linea in f], [3, 4])
+
+    def test_gzip_truncado_encola_lo_leido_y_falla(self):
+        ruta = os.path.join(self.directorio, 'pedidos.jsonl.gz')
+        with gzip.open(ruta, 'wb') as f:
+            f.write(b'\n'.join(self.lineas(5000)) + b'\n')
+        with open(ruta, 'r+b') as f:
+            f.truncate(os.path.getsize(ruta) // 2)
+        with self.assertRaisesMessage(CommandError, 'Archivo dañado o incompleto'):
+            call_command('ingestar_pedidos', ruta, stdout=io.StringIO())
+        self.assertGreater(len(self.encolados), 0)
+        self.assertEqual([p['id'] for p in self.encolados], list(range(1, len(self.encolados) + 1)))
+
+    def test_progreso_negativo(self):
+        with self.assertRaises(CommandError):
+            call_command('ingestar_pedidos', 'no-importa.jsonl', progreso=-1)
+
+
+class ObtenerProductosTests(SimpleTestCase):
+    """Consultas concurrentes a la API de productos."""
+
+    def test_error_cancela_las_consultas_pendientes(self):
+        liberar, iniciadas = threading.Event(), []
+
+        def consultar(product_id, medicion):
+            iniciadas.append(product_id)
+            if product_id == '900000':
+                raise ErrorTransitorio('fallo')
+            liberar.wait(5)
+            return {'id': product_id}
+
+        hilos = api_productos._executor._max_workers
+        ids = [str(900000 + i) for i in range(hilos * 3)]
+        with mock.patch('pedidos_app.api_productos._consultar_api', side_effect=consultar):
+            with self.assertRaises(ErrorTransitorio):
+                api_productos.obtener_productos(ids)
+            liberar.set()
+            # El pool atiende en orden: cuando termina esta tarea, ninguna consulta anterior queda por empezar.
+            api_productos._executor.submit(lambda: None).result()
+        # Como mucho una por hilo, más la que tome el hilo que falló antes de la cancelación.
+        self.assertLessEqual(len(iniciadas), hilos + 1)
+
+
+class ReintentosTests(SimpleTestCase):
+    """Clasificación de errores y ajuste de los reintentos de Huey."""
+
+    def test_clasificar_error(self):
+        for error in (ErrorTransitorio(), requests.ConnectionError(), OperationalError('database is locked'),
+                      TimeoutError(), ConnectionResetError(), RuntimeError()):
+            self.assertEqual(clasificar_error(error), TRANSITORIO, error)
+        for error in (ErrorPermanente(), IntegrityError(), ValueError(), TypeError(), KeyError('sku')):
+            self.assertEqual(clasificar_error(error), PERMANENTE, error)
+
+    def test_json_invalido_de_la_api_es_transitorio(self):
+        # requests.JSONDecodeError también es un ValueError: una página de error del proxy no es culpa del pedido.
+        self.assertEqual(clasificar_error(requests.JSONDecodeError('x', '<html>', 0)), TRANSITORIO)
+
+    def test_permanente_anula_los_reintentos(self):
+        task = SimpleNamespace(id='t', retries=3, default_retries=5, retry_delay=0)
+        self.assertEqual(aplicar_politica_reintento(task, ErrorPermanente('sin sku')), PERMANENTE)
+        self.assertEqual(task.retries, 0)
+
+    def test_transitorio_espera_exponencial_con_tope(self):
+        base, tope = CONFIG_REINTENTOS['espera_base'], CONFIG_REINTENTOS['espera_maxima']
+        for restantes, intento in ((5, 0), (3, 2), (1, 4)):
+            task = SimpleNamespace(id='t', retries=restantes, default_retries=5, retry_delay=0)
+            self.assertEqual(aplicar_politica_reintento(task, ErrorTransitorio()), TRANSITORIO)
+            espera = min(tope, base * 2 ** intento)
+            self.assertEqual(task.retries, restantes)
+            self.assertTrue(espera / 2 <= task.retry_delay <= espera, task.retry_delay)
+
+    def test_transitorio_sin_reintentos_no_toca_la_espera(self):
+        task = SimpleNamespace(id='t', retries=0, default_retries=5, retry_delay=0)
+        self.assertEqual(aplicar_politica_reintento(task, ErrorTransitorio()), TRANSITORIO)
+        self.assertEqual(task.retry_delay, 0)
+
+
+class ResilienciaTests(SimpleTestCase):
+    """Transiciones del circuito y del límite de concurrencia de la guarda de la API."""
+
+    def test_circuito_se_abre_tras_el_umbral(self):
+        circuito = CircuitBreaker(umbral_fallos=3, tiempo_apertura=60)
+        for _ in range(2):
+            circuito.permitir()
+            circuito.registrar(False)
+        self.assertEqual(circuito.estado, CircuitBreaker.CERRADO)
+        circuito.registrar(True)  # Un éxito reinicia la cuenta de fallos consecutivos.
+        for _ in range(3):
+            circuito.registrar(False)
+        self.assertEqual(circuito.estado, CircuitBreaker.ABIERTO)
+        with self.assertRaises(CircuitoAbierto) as contexto:
+            circuito.permitir()
+        self.assertGreater(contexto.exception.reintentar_en, 59)
+        self.assertEqual((circuito.aperturas, circuito.rechazadas), (1, 1))
+
+    def test_semiabierto_deja_pasar_una_sola_prueba(self):
+        circuito = CircuitBreaker(umbral_fallos=1, tiempo_apertura=0)
+        circuito.registrar(False)
+        circuito.permitir()
+        self.assertEqual(circuito.estado, CircuitBreaker.SEMIABIERTO)
+        with self.assertRaises(CircuitoAbierto):
+            circuito.permitir()
+        circuito.registrar(True)
+        self.assertEqual(circuito.estado, CircuitBreaker.CERRADO)
+        circuito.permitir()
+
+    def test_prueba_fallida_reabre_y_cancelada_se_libera(self):
+        circuito = CircuitBreaker(umbral_fallos=1, tiempo_apertura=0)
+        circuito.registrar(False)
+        circuito.permitir()
+        circuito.cancelar()
+        circuito.permitir()  # La prueba cancelada no bloquea a la siguiente.
+        circuito.registrar(False)
+        self.assertEqual(circuito.estado, CircuitBreaker.ABIERTO)
+        self.assertEqual(circuito.aperturas, 2)
+
+    def test_limite_crece_con_exitos_y_se_reduce_a_la_mitad(self):
+        limite = LimiteAdaptativo(minimo=1, inicial=4, maximo=8, latencia_objetivo=1.0)
+        for _ in range(4):
+            self.assertTrue(limite.adquirir(0))
+        self.assertFalse(limite.adquirir(0))
+        for _ in range(4):
+            limite.liberar(0.1, True)
+        self.assertEqual(limite.estadisticas(), {'limite': 4, 'en_vuelo': 0, 'recortes': 0})
+        limite.adquirir(0)
+        limite.liberar(0.1, True)  # Una ventana completa de éxitos suma una plaza.
+        self.assertEqual(limite.estadisticas(), {'limite': 5, 'en_vuelo': 0, 'recortes': 0})
+
+        limite.adquirir(0)
+        limite.liberar(2.0, True)  # Lenta: cuenta como saturación aunque haya respondido.
+        self.assertEqual(int(limite.limite), 2)
+        limite.adquirir(0)
+        limite.liberar(0.1, False)  # Mismo episodio: no se vuelve a recortar.
+        self.assertEqual((int(limite.limite), limite.recortes), (2, 1))
+
+    def test_limite_respeta_minimo_y_maximo(self):
+        limite = LimiteAdaptativo(minimo=2, inicial=10, maximo=3, latencia_objetivo=0)
+        self.assertEqual(limite.limite, 3)
+        for _ in range(3):
+            limite.adquirir(0)
+            limite._ultimo_recorte = 0.0
+            limite.liberar(1.0, False)
+        self.assertEqual(limite.limite, 2)
+
+
+class SerializadorCompactoTests(SimpleTestCase):
+    """Formato compacto de la cola y lectura de los datos escritos con el formato anterior."""
+
+    def setUp(self):
+        self.serializador = SerializadorCompacto(umbral_compresion=256)
+
+    def _mensaje(self, **campos):
+        valores = dict.fromkeys(Message._fields)
+        valores.update(id=str(uuid.uuid4()), name='pedidos_app.tasks.procesar_pedido_task', retries=5,
+                       retry_delay=0, priority=10, args=(_pedido(),), kwargs={})
+        valores.update(campos)
+        return Message(**valores)
+
+    def test_mensaje_ida_y_vuelta(self):
+        encadenado = self._mensaje()
+        mensaje = self._mensaje(on_complete=encadenado)
+        datos = self.serializador.serialize(mensaje)
+        self.assertTrue(datos.startswith(CABECERA))
+        self.assertEqual(self.serializador.deserialize(datos), mensaje)
+        self.assertLess(len(datos), len(Serializer().serialize(mensaje)))
+
+    def test_id_no_uuid_se_conserva(self):
+        mensaje = self._mensaje(id='lote-1')
+        self.assertEqual(self.serializador.deserialize(self.serializador.serialize(mensaje)), mensaje)
+
+    def test_comprime_por_encima_del_umbral(self):
+        pequeno, grande = {'ok': True}, {'lineas': ['SKU1'] * 1000}
+        self.assertFalse(self.serializador.serialize(pequeno)[len(CABECERA)] & COMPRIMIDO)
+        datos = self.serializador.serialize(grande)
+        self.assertTrue(datos[len(CABECERA)] & COMPRIMIDO)
+        self.assertEqual(self.serializador.deserialize(datos), grande)
+
+    def test_lee_el_formato_anterior(self):
+        mensaje = self._mensaje(on_error=self._mensaje())
+        for valor in (mensaje, {'resultado': 1}, None):
+            self.assertEqual(self.serializador.deserialize(Serializer().serialize(valor)), valor)
+
+
+class EsquemaPedidoTests(SimpleTestCase):
+    """Errores estructurados por campo del esquema de pedidos."""
+
+    def _campos(self, pedido):
+        return [error['campo'] for error in esquema_pedido.errores(pedido)]
+
+    def test_pedido_valido(self):
+        validar_pedido({'id': 1, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 2}],
+                        'prioridad': 'alta'})
+
+    def test_no_es_un_objeto(self):
+        self.assertEqual(self._campos(['no', 'dict']), [''])
+
+    def test_campos_obligatorios(self):
+        with self.assertRaises(ErrorValidacion) as contexto:
+            validar_pedido({})
+        self.assertEqual([e['campo'] for e in contexto.exception.errores], ['id', 'cliente', 'productos'])
+        self.assertIn('id: Campo obligatorio.', str(contexto.exception))
+
+    def test_id_fuera_de_rango_o_no_entero(self):
+        for valor in (0, MAX_ID_PEDIDO + 1, '7', True, 1.0):
+            self.assertEqual(self._campos({'id': valor, 'cliente': 'A', 'productos': [{'sku': 'A1', 'cantidad': 1}]}),
+                             ['id'], valor)
+
+    def test_cliente(self):
+        for valor in ('  ', 5, 'x' * (CONFIG_ESQUEMA['max_longitud_cliente'] + 1)):
+            self.assertEqual(self._campos({'id': 1, 'cliente': valor, 'productos': [{'sku': 'A1', 'cantidad': 1}]}),
+                             ['cliente'])
+
+    def test_errores_por_linea(self):
+        pedido = {'id': 1, 'cliente': 'A', 'prioridad': 'urgente', 'productos': [
+            {'sku': 'A1', 'cantidad': 1}, 'SKU2', {'sku': '12', 'cantidad': 0},
+            {'sku': 'B2', 'cantidad': CONFIG_ESQUEMA['max_cantidad'] + 1},
+        ]}
+        self.assertEqual(self._campos(pedido), ['productos[1]', 'productos[2].sku', 'productos[2].cantidad',
+                                                'productos[3].cantidad', 'prioridad'])
+
+    def test_lista_de_productos(self):
+        demasiados = [{'sku': 'A1', 'cantidad': 1}] * (CONFIG_ESQUEMA['max_productos'] + 1)
+        for productos in ([], {'sku': 'A1'}, demasiados):
+            self.assertEqual(self._campos({'id': 1, 'cliente': 'A', 'productos': productos}), ['productos'])
+
+
+class VentasTests(TestCase):
+    """Deltas de las ventas diarias al guardar, reprocesar o cambiar de cliente un pedido."""
+
+    def _guardar(self, pedido_id, cliente, subtotal, descuento=0.0, error=None):
+        # Igual que la Etapa D: versión anterior, upsert y delta en la misma transacción.
+        with transaction.atomic():
+            anteriores = leer_anteriores([pedido_id])
+            pedido, _ = PedidoProcesado.objects.update_or_create(
+                id_pedido_original=pedido_id,
+                defaults={'hash_pedido': f'hash-{pedido_id}-{cliente}-{subtotal}', 'cliente': cliente,
+                          'detalle_completo': [], 'subtotal': subtotal, 'descuento': descuento,
+                          'total_final': round(subtotal - descuento, 2)},
+            )
+            filas = actualizar_ventas(anteriores, [pedido])
+            if error:
+                raise error
+            return filas
+
+    def _ventas(self):
+        hoy = dia_venta(timezone.now())
+        return {fila['cliente']: (fila['pedidos'], fila['subtotal'], fila['total_final'])
+                for fila in consultar_ventas(hoy, hoy)}
+
+    def test_suma_pedidos_nuevos(self):
+        self._guardar(1, 'ACME', 0.1)
+        self._guardar(2, 'ACME', 0.2)
+        self.assertEqual(self._ventas(), {'ACME': (2, Decimal('0.30'), Decimal('0.30'))})
+
+    def test_reprocesar_corrige_sin_contar_dos_veces(self):
+        self._guardar(1, 'ACME', 10.0)
+        self._guardar(2, 'ACME', 5.0)
+        self._guardar(1, 'ACME', 12.5, descuento=2.5)
+        self.assertEqual(self._ventas(), {'ACME': (2, Decimal('17.50'), Decimal('15.00'))})
+        self.assertEqual(self._guardar(1, 'ACME', 12.5, descuento=2.5), 0)  # Sin cambios no escribe nada.
+
+    def test_cambio_de_cliente_mueve_el_pedido(self):
+        self._guardar(1, 'ACME', 10.0)
+        self._guardar(2, 'Globex', 4.0)
+        self.assertEqual(self._guardar(1, 'Globex', 10.0), 2)
+        self.assertEqual(self._ventas(), {'Globex': (2, Decimal('14.00'), Decimal('14.00'))})
+        self.assertFalse(VentaDiariaCliente.objects.filter(cliente='ACME').exists())
+
+    def test_reproceso_deshecho_se_aplica_una_vez_al_reintentar(self):
+        self._guardar(1, 'ACME', 10.0)
+        # Falla lo que sigue a las ventas en la Etapa D (p. ej. el COMMIT): el delta se deshace con el pedido.
+        with self.assertRaises(OperationalError):
+            self._guardar(1, 'Globex', 12.0, error=OperationalError('database is locked'))
+        self.assertEqual(self._ventas(), {'ACME': (1, Decimal('10.00'), Decimal('10.00'))})
+        self._guardar(1, 'Globex', 12.0)
+        self.assertEqual(self._ventas(), {'Globex': (1, Decimal('12.00'), Decimal('12.00'))})
+
+    def test_coincide_con_la_reconstruccion(self):
+        for pedido_id, cliente, subtotal in ((1, 'A', 1.1), (2, 'B', 2.2), (1, 'B', 3.3), (3, 'A', 4.4)):
+            self._guardar(pedido_id, cliente, subtotal)
+        incremental = self._ventas()
+        reconstruir_dia(dia_venta(timezone.now()))
+        self.assertEqual(self._ventas(), incremental)
+
+
+class RetencionTests(TestCase):
+    """Archivo por lotes de TaskHistory y consulta del archivo."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = mock.patch.dict(CONFIG_RETENCION, directorio=directorio.name, tamano_lote=2,
+                                        pausa_entre_lotes=0)
+        configuracion.start()
+        self.addCleanup(configuracion.stop)
+
+        ahora = timezone.now()
+        self.viejo = ahora - timedelta(days=CONFIG_RETENCION['dias_historial'] + 5)
+        for i, (dias, status) in enumerate([(0, 'SUCCESS'), (0, 'ERROR'), (1, 'SUCCESS'), (1, 'ERROR'), (2, 'ERROR')]):
+            TaskHistory.objects.create(task_id=f'viejo-{i}', task_name='procesar_pedido_task', status=status,
+                                       start_time=self.viejo - timedelta(days=dias), id_pedido_original=700 + i % 2)
+        TaskHistory.objects.create(task_id='reciente', task_name='procesar_pedido_task', status='ERROR',
+                                   start_time=ahora)
+
+    def _consultar(self, *argumentos):
+        salida = io.StringIO()
+        call_command('consultar_archivo', '--desde', (self.viejo - timedelta(days=2)).date().isoformat(),
+                     *argumentos, stdout=salida, stderr=io.StringIO())
+        return [json.loads(linea)['task_id'] for linea in salida.getvalue().splitlines()]
+
+    def test_archiva_por_lotes_hasta_max_lotes(self):
+        self.assertEqual(archivar_historial(max_lotes=2), 4)
+        self.assertEqual(TaskHistory.objects.count(), 2)
+        self.assertEqual(archivar_historial(), 1)
+        self.assertEqual(list(TaskHistory.objects.values_list('task_id', flat=True)), ['reciente'])
+        self.assertTrue(ruta_particion(TIPO_HISTORIAL, self.viejo.date()).exists())
+
+    def test_pase_interrumpido_no_duplica_filas(self):
+        archivar_historial()
+        # Simula un pase que escribió un lote pero no llegó a borrarlo: se vuelve a archivar.
+        TaskHistory.objects.create(task_id='viejo-0', task_name='procesar_pedido_task', status='SUCCESS',
+                                   start_time=self.viejo)
+        archivar_historial()
+        desde = (self.viejo - timedelta(days=2)).date()
+        ids = [fila['task_id'] for fila in leer_archivo(TIPO_HISTORIAL, desde, self.viejo.date())]
+        self.assertEqual(sorted(ids), [f'viejo-{i}' for i in range(5)])
+
+    def test_consultar_archivo_filtra(self):
+        archivar_historial()
+        self.assertEqual(sorted(self._consultar()), [f'viejo-{i}' for i in range(5)])
+        self.assertEqual(sorted(self._consultar('--estado', 'ERROR')), ['viejo-1', 'viejo-3', 'viejo-4'])
+        self.assertEqual(self._consultar('--task-id', 'viejo-2'), ['viejo-2'])
+        # Las tareas fallidas no tienen pedido_id, pero sí el ID del pedido que procesaban.
+        self.assertEqual(sorted(self._consultar('--pedido', '701')), ['viejo-1', 'viejo-3'])
+        self.assertEqual(len(self._consultar('--limite', '2')), 2)
+        self.assertEqual(sorted(self._consultar('--hasta', (self.viejo - timedelta(days=1)).date().isoformat())),
+                         ['viejo-2', 'viejo-3', 'viejo-4'])
+        with self.assertRaises(CommandError):
+            self._consultar('--hasta', '2000-01-01')
+
+
+class ExportacionTests(TestCase):
+    """Paginación por clave de la exportación y formatos de salida."""
+
+    def setUp(self):
+        self.t0 = timezone.make_aware(datetime(2026, 3, 10, 12, 0))
+        # pk 1-3 comparten instante; las pk altas son anteriores para que el orden por fecha no coincida con el de pk.
+        fechas = {1: self.t0, 2: self.t0, 3: self.t0, 4: self.t0 + timedelta(hours=1),
+                  5: self.t0 - timedelta(days=1), 6: self.t0 - timedelta(days=1), 7: self.t0 + timedelta(days=1)}
+        for pk, fecha in fechas.items():
+            PedidoProcesado.objects.create(
+                id_pedido_original=pk, hash_pedido=f'hash-{pk}', cliente='ACME' if pk % 2 else 'Globex, S.A.',
+                detalle_completo=[{'sku': f'SKU{pk}', 'cantidad': 1}], subtotal='10.10', descuento='0.00',
+                total_final='10.10')
+            PedidoProcesado.objects.filter(pk=pk).update(fecha_procesado=fecha)
+
+    def _pks(self, pedidos, **opciones):
+        lotes = list(iterar_lotes(pedidos, CAMPOS, tamano_lote=2, **opciones))
+        self.assertTrue(all(len(lote) <= 2 for lote in lotes))
+        return [fila[0] for lote in lotes for fila in lote]
+
+    def test_cursor_por_pk_sin_huecos_ni_repetidos(self):
+        self.assertEqual(self._pks(filtrar_pedidos()), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_cursor_por_fecha_con_instantes_repetidos(self):
+        # Con lotes de 2, el corte cae dentro del grupo de tres pedidos con la misma fecha.
+        self.assertEqual(self._pks(filtrar_pedidos(desde=self.t0 - timedelta(days=7)), por_fecha=True),
+                         [5, 6, 1, 2, 3, 4, 7])
+
+    def test_filtro_de_fechas(self):
+        # desde incluye los pedidos de ese mismo instante; hasta es exclusivo.
+        pedidos = filtrar_pedidos(desde=self.t0, hasta=self.t0 + timedelta(hours=1))
+        self.assertEqual(self._pks(pedidos, por_fecha=True), [1, 2, 3])
+        parametros = parametros_exportacion({'desde': '2026-03-10', 'hasta': '2026-03-10', 'cliente': 'ACME'})
+        pedidos = filtrar_pedidos(parametros['cliente'], parametros['desde'], parametros['hasta'])
+        self.assertEqual(self._pks(pedidos, por_fecha=True), [1, 3])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(parametros_exportacion({})['formato'], 'csv')
+        for datos in ({'formato': 'xml'}, {'desde': '10/03/2026'},
+                      {'desde': '2026-03-10', 'hasta': '2026-03-09'}):
+            with self.assertRaises(ValueError):
+                parametros_exportacion(datos)
+
+    def test_csv(self):
+        texto = ''.join(exportar('csv', cliente='Globex, S.A.', detalle=True, tamano_lote=2))
+        filas = list(csv.reader(io.StringIO(texto)))
+        self.assertEqual(filas[0], CAMPOS + ['detalle_completo'])
+        self.assertEqual([fila[0] for fila in filas[1:]], ['6', '2', '4'])
+        self.assertEqual(filas[1][1], 'Globex, S.A.')
+        self.assertEqual(filas[1][3], '10.10')
+        self.assertEqual(json.loads(filas[1][-1]), [{'sku': 'SKU6', 'cantidad': 1}])
+
+    def test_ndjson(self):
+        filas = [json.loads(linea) for linea in ''.join(exportar('ndjson', tamano_lote=3)).splitlines()]
+        self.assertEqual([fila['id_pedido_original'] for fila in filas], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(filas[0]['subtotal'], '10.10')
+        self.assertEqual(filas[0]['fecha_procesado'], self.t0.isoformat())
+        self.assertNotIn('detalle_completo', filas[0])
+
+
+@mock.patch('pedidos_app.views.encolar_pedidos')
+class RecibirPedidosLoteTests(SimpleTestCase):
+    """Validación y rechazo parcial en la carga masiva de pedidos."""
+
+    def enviar(self, cuerpo):
+        if not isinstance(cuerpo, (str, bytes)):
+            cuerpo = json.dumps(cuerpo)
+        return self.client.post('/pedidos/lote/', cuerpo, content_type='application/json')
+
+    def test_acepta_los_validos_y_rechaza_el_resto(self, encolar):
+        respuesta = self.enviar([
+            {'id': 1, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 1}]},
+            {'id': 2, 'cliente': '', 'productos': [{'sku': '12', 'cantidad': 1}]},
+            'no es un pedido',
+            {'id': 3, 'cliente': 'ACME', 'productos': [{'sku': 'SKU3', 'cantidad': 2}]},
+        ])
+        self.assertEqual(respuesta.status_code, 202)
+        datos = respuesta.json()
+        self.assertEqual(datos['aceptados'], [1, 3])
+        self.assertEqual([r['id'] for r in datos['rechazados']], [2, None])
+        self.assertEqual([e['campo'] for e in datos['rechazados'][0]['errores']], ['cliente', 'productos[0].sku'])
+        self.assertEqual([p['id'] for p in encolar.call_args.args[0]], [1, 3])
+
+    def test_id_repetido_en_el_lote(self, encolar):
+        pedido = {'id': 7, 'cliente': 'ACME', 'productos': [{'sku': 'SKU1', 'cantidad': 1}]}
+        datos = self.enviar([pedido, {**pedido, 'cliente': 'Otro'}]).json()
+        self.assertEqual(datos['aceptados'], [7])
+        self.assertEqual(datos['rechazados'][0]['errores'], [{'campo': 'id', 'error': "ID de pedido repetido dentro del lote."}])
+        self.assertEqual(len(encolar.call_args.args[0]), 1)
+
+    def test_todos_rechazados_no_es_202(self, encolar):
+        respuesta = self.enviar([{'id': 0}])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['aceptados'], [])
+
+    def test_json_invalido(self, encolar):
+        for cuerpo in ('{"id": 1', b'\xff\xfe', {'id': 1}):
+            respuesta = self.enviar(cuerpo)
+            self.assertEqual(respuesta.status_code, 400, cuerpo)
+        encolar.assert_not_called()
+
+    def test_lote_demasiado_grande(self, encolar):
+        with mock.patch('pedidos_app.views.MAX_PEDIDOS_POR_LOTE', 2):
+            self.assertEqual(self.enviar([{}, {}, {}]).status_code, 413)
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100):
+            self.assertEqual(self.enviar([{'id': i} for i in range(50)]).status_code, 413)
+        encolar.assert_not_called()
+
+
+class CacheLRUTests(SimpleTestCase):
+    """Expiración, desalojo LRU y entradas negativas de ``CacheLRU`` con un reloj controlado."""
+
+    def setUp(self):
+        self.ahora = 1000.0
+        reloj = mock.patch('pedidos_app.cache.time.monotonic', side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+        self.cache = CacheLRU(max_entradas=3, ttl=10, ttl_negativo=2)
+
+    def test_expira_al_cumplir_el_ttl(self):
+        self.cache.guardar('a', 1)
+        self.ahora += 9.9
+        self.assertEqual(self.cache.obtener('a'), (True, 1))
+        self.ahora += 0.1
+        self.assertEqual(self.cache.obtener('a'), (False, None))
+        self.assertEqual(self.cache.estadisticas()['expirados'], 1)
+        self.assertEqual(self.cache.estadisticas()['entradas'], 0)
+
+    def test_entrada_negativa_con_su_propio_ttl(self):
+        self.cache.guardar('inexistente', None)
+        self.cache.guardar('corto', 'x', ttl=1)
+        self.assertEqual(self.cache.obtener('inexistente'), (True, None))
+        self.assertFalse(self.cache.contiene('nunca-guardado'))
+        self.ahora += 2
+        self.assertEqual(self.cache.obtener('inexistente'), (False, None))
+        self.assertFalse(self.cache.contiene('corto'))
+        estadisticas = self.cache.estadisticas()
+        self.assertEqual((estadisticas['aciertos_negativos'], estadisticas['aciertos']), (1, 0))
+
+    def test_desaloja_el_menos_usado(self):
+        for clave in 'abc':
+            self.cache.guardar(clave, clave)
+        self.cache.obtener('a')        # 'b' pasa a ser la menos usada.
+        self.assertTrue(self.cache.contiene('b'))  # contiene() no altera el orden.
+        self.cache.guardar('d', 'd')
+        self.assertFalse(self.cache.contiene('b'))
+        self.cache.guardar('c', 'c2')  # Reescribir una clave también la renueva.
+        self.cache.guardar('e', 'e')
+        self.assertEqual([c for c in 'abcde' if self.cache.contiene(c)], ['c', 'd', 'e'])
+        self.assertEqual(self.cache.estadisticas()['desalojos'], 2)
+
+    def test_reescribir_renueva_el_ttl(self):
+        self.cache.guardar('a', 1)
+        self.ahora += 8
+        self.cache.guardar('a', 2)
+        self.ahora += 8
+        self.assertEqual(self.cache.obtener('a'), (True, 2))
+
+    def test_tamano_invalido(self):
+        with self.assertRaises(ValueError):
+            CacheLRU(max_entradas=0)
+
+
+class EscritorAuditoriaTests(SimpleTestCase):
+    """Disparadores de volcado del modo buffer (la escritura en sí se sustituye por un registro de lotes)."""
+
+    def setUp(self):
+        self.lotes, self.volcado = [], threading.Event()
+
+        def guardar(entradas):
+            self.lotes.append(sorted(entrada.task_id for entrada in entradas))
+            self.volcado.set()
+
+        escritura = mock.patch('pedidos_app.auditoria.guardar_historial', side_effect=guardar)
+        escritura.start()
+        self.addCleanup(escritura.stop)
+
+    def _registrar(self, escritor, *ids):
+        for task_id in ids:
+            escritor.registrar(TaskHistory(task_id=task_id, task_name='t', status=TaskHistory.Status.STARTED))
+
+    def test_volcado_al_llenar_el_lote(self):
+        escritor = EscritorAuditoria(max_buffer=100, tamano_flush=3, intervalo_flush=60)
+        self.addCleanup(escritor.detener)
+        self._registrar(escritor, 'a', 'b')
+        self.assertFalse(self.volcado.wait(0.2))
+        self._registrar(escritor, 'c')
+        self.assertTrue(self.volcado.wait(5))
+        self.assertEqual(self.lotes, [['a', 'b', 'c']])
+
+    def test_volcado_periodico(self):
+        escritor = EscritorAuditoria(max_buffer=100, tamano_flush=100, intervalo_flush=0.05)
+        self.addCleanup(escritor.detener)
+        self._registrar(escritor, 'a')
+        self.assertTrue(self.volcado.wait(5))
+        self.assertEqual(self.lotes, [['a']])
+
+    def test_detener_vuelca_lo_pendiente(self):
+        escritor = EscritorAuditoria(max_buffer=100, tamano_flush=100, intervalo_flush=60)
+        self._registrar(escritor, 'a', 'b', 'a')
+        escritor.detener()
+        self.assertEqual(self.lotes, [['a', 'b']])
+        self.assertFalse(escritor._hilo.is_alive())
+
+    def test_error_al_volcar_conserva_las_entradas(self):
+        escritor = EscritorAuditoria(max_buffer=100, tamano_flush=100, intervalo_flush=60)
+        with mock.patch.object(escritor, '_iniciar_hilo'):
+            self._registrar(escritor, 'a')
+            with mock.patch('pedidos_app.auditoria.guardar_historial', side_effect=OperationalError('locked')), \
+                    self.assertLogs(level='ERROR'):
+                self.assertEqual(escritor.flush(), 0)
+            self.assertEqual(escritor.flush(), 1)
+        self.assertEqual(self.lotes, [['a']])
+
+
+class AuditoriaBufferTests(TestCase):
+    """En modo buffer, el inicio y el final de cada tarea acaban en una sola fila escrita por lotes."""
+
+    def test_menos_de_una_escritura_por_tarea(self):
+        escritor = EscritorAuditoria(max_buffer=1000, tamano_flush=1000, intervalo_flush=60)
+        with mock.patch.dict(CONFIG_AUDITORIA, modo='buffer'), \
+                mock.patch('pedidos_app.auditoria.escritor_auditoria', escritor), \
+                mock.patch.object(escritor, '_iniciar_hilo'):
+            with self.assertNumQueries(0):
+                for i in range(50):
+                    tarea = SimpleNamespace(id=f'tarea-{i}', name='procesar_pedido_completo', retries=5,
+                                            default_retries=5)
+                    entrada = iniciar_historial(tarea, id_pedido_original=i + 1)
+                    entrada.status = TaskHistory.Status.SUCCESS
+                    finalizar_historial(entrada)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(escritor.flush(), 50)
+        self.assertLessEqual(len(consultas), 2)
+        self.assertEqual(TaskHistory.objects.count(), 50)
+        self.assertEqual(set(TaskHistory.objects.values_list('status', flat=True)), {TaskHistory.Status.SUCCESS})
+        self.assertFalse(TaskHistory.objects.filter(end_time__isnull=True).exists())
+
+
+class InspectorHueyTests(SimpleTestCase):
+    """Páginas por cursor del inspector de la cola sobre una base de Huey temporal."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.storage = SqliteStorage(name='prueba', filename=os.path.join(directorio.name, 'cola.db'))
+        self.addCleanup(self.storage.close)
+        cola = SimpleNamespace(storage=self.storage, serializer=HUEY.serializer, immediate=False)
+        for parche in (mock.patch.object(inspector_huey, 'HUEY', cola),
+                       mock.patch.object(inspector_huey, 'TAMANO_PAGINA', 3),
+                       mock.patch.object(inspector_huey, 'LIMITE_ESCANEO_KV', 4)):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _mensaje(self, nombre):
+        valores = dict.fromkeys(Message._fields)
+        valores.update(id=str(uuid.uuid4()), name=nombre, retries=0, args=(), kwargs={})
+        return HUEY.serializer.serialize(Message(**valores))
+
+    def _recorrer(self, vista, maximo=20):
+        nombres, cursor, paginas = [], None, 0
+        while True:
+            pagina = inspector_huey.inspeccionar(vista, cursor)
+            self.assertLessEqual(len(pagina['tareas']), 3)
+            nombres += [tarea['name'] if vista in ('pendientes', 'programadas') else tarea['id']
+                        for tarea in pagina['tareas']]
+            cursor, paginas = pagina['siguiente'], paginas + 1
+            if cursor is None or paginas >= maximo:
+                return nombres, paginas
+
+    def test_pendientes_en_orden_de_desencolado_con_prioridades_repetidas(self):
+        for nombre, prioridad in [('p5-a', 5), ('p5-b', 5), ('p0-a', 0), ('p5-c', 5), ('p10', 10), ('p5-d', 5),
+                                  ('p0-b', 0)]:
+            self.storage.enqueue(self._mensaje(nombre), prioridad)
+        nombres, paginas = self._recorrer('pendientes')
+        self.assertEqual(nombres, ['p10', 'p5-a', 'p5-b', 'p5-c', 'p5-d', 'p0-a', 'p0-b'])
+        self.assertEqual(paginas, 3)
+
+    def test_programadas_con_instantes_repetidos(self):
+        for nombre, marca in [('t100-a', 100.0), ('t200-a', 200.0), ('t100-b', 100.0), ('t100-c', 100.0),
+                              ('t200-b', 200.0), ('t150', 150.5)]:
+            self.storage.sql('insert into schedule (queue, data, timestamp) values (?, ?, ?)',
+                             (self.storage.name, self._mensaje(nombre), marca), commit=True)
+        nombres, _ = self._recorrer('programadas')
+        self.assertEqual(nombres, ['t100-a', 't100-b', 't100-c', 't150', 't200-a', 't200-b'])
+
+    def test_kv_acota_el_escaneo_y_continua_con_el_cursor(self):
+        claves = sorted(str(uuid.uuid4()) for _ in range(10))
+        errores = claves[5:8]
+        for clave in claves:
+            valor = Error({'task_id': clave, 'error': 'fallo', 'retries': 0}) if clave in errores else {'ok': 1}
+            self.storage.put_data(clave, HUEY.serializer.serialize(valor))
+        self.storage.put_data('lock.procesar', HUEY.serializer.serialize('1'))
+
+        # Las cinco primeras claves son resultados: la primera página se detiene en el tope sin ningún error.
+        primera = inspector_huey.inspeccionar('errores')
+        self.assertEqual((primera['tareas'], primera['siguiente']), ([], claves[3]))
+        self.assertEqual(self._recorrer('errores')[0], errores)
+        resultados = self._recorrer('resultados')[0]
+        self.assertEqual(resultados, [c for c in claves if c not in errores])
+
+    def test_cursor_manipulado_vuelve_al_principio(self):
+        for i in range(4):
+            self.storage.enqueue(self._mensaje(f't{i}'), 0)
+        for vista in ('pendientes', 'programadas'):
+            pagina = inspector_huey.inspeccionar(vista, 'no-es-un-cursor')
+            self.assertEqual(pagina['vista'], vista)
+        pagina = inspector_huey.inspeccionar('pendientes', 'x:y')
+        self.assertEqual([tarea['name'] for tarea in pagina['tareas']], ['t0', 't1', 't2'])
+        self.assertEqual(inspector_huey.inspeccionar('desconocida')['vista'], 'pendientes')
+        self.assertEqual(pagina['estadisticas']['pendientes'], 4)
@@ -1,6 +1,14 @@
 from django.urls import path
-from .views import iniciar_procesamiento
+from .views import (estado_api, estado_pedido, estado_pedidos, exportar_pedidos, iniciar_procesamiento, metricas,
+                    recibir_pedidos_lote, ventas_diarias)
 
 urlpatterns = [
     path('iniciar/', iniciar_procesamiento, name='iniciar_procesamiento'),
+    path('lote/', recibir_pedidos_lote, name='recibir_pedidos_lote'),
+    path('metricas/', metricas, name='metricas'),
+    path('estado-api/', estado_api, name='estado_api'),
+    path('exportar/', exportar_pedidos, name='exportar_pedidos'),
+    path('ventas/', ventas_diarias, name='ventas_diarias'),
+    path('estado/', estado_pedidos, name='estado_pedidos'),
+    path('estado/<int:pedido_id>/', estado_pedido, name='estado_pedido'),
 ]
\ No newline at end of file
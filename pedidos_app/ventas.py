@@ -0,0 +1,153 @@
+"""
+Mantenimiento incremental de las ventas diarias por cliente (``VentaDiariaCliente``).
+
+En la Etapa D, dentro de la misma transacción que el upsert de los pedidos:
+
+1. ``leer_anteriores`` lee la versión ya guardada de los pedidos que se van a escribir.
+2. Tras el upsert, ``actualizar_ventas`` resta la versión anterior de cada pedido
+   de su (cliente, día) y suma la nueva. Un pedido reprocesado corrige sus
+   importes en lugar de contarse dos veces, y si cambia de cliente pasa de una
+   fila a otra.
+
+Las filas afectadas se leen, se recalculan con ``Decimal`` y se escriben con un
+único upsert. Como la transacción toma el bloqueo de escritura al empezar
+(modo IMMEDIATE), ningún otro worker puede modificarlas entre la lectura y la escritura.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import PedidoProcesado, VentaDiariaCliente
+
+CENTIMO = Decimal('0.01')
+CAMPOS_IMPORTE = ('subtotal', 'descuento', 'total_final')
+
+
+def _importe(valor) -> Decimal:
+    # Los importes del pipeline son floats ya redondeados; str evita arrastrar su representación binaria.
+    return Decimal(str(valor)).quantize(CENTIMO)
+
+
+def dia_venta(fecha_procesado: datetime) -> date:
+    """Día al que se imputa un pedido, en la zona horaria del proyecto."""
+    return timezone.localdate(fecha_procesado)
+
+
+def leer_anteriores(ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Versión guardada (cliente, fecha e importes) de los pedidos que ya existen entre ``ids``."""
+    return {
+        fila['id_pedido_original']: fila
+        for fila in PedidoProcesado.objects.filter(pk__in=list(ids)).values(
+            'id_pedido_original', 'cliente', 'fecha_procesado', *CAMPOS_IMPORTE)
+    }
+
+
+def actualizar_ventas(anteriores: Dict[int, Dict[str, Any]], pedidos: Iterable[PedidoProcesado]) -> int:
+    """
+    Aplica a ``VentaDiariaCliente`` la diferencia entre la versión anterior y la nueva de ``pedidos``.
+
+    Debe llamarse dentro de la transacción que guarda los pedidos, con lo que devolvió
+    ``leer_anteriores`` antes del upsert.
+
+    Returns:
+        El número de filas (cliente, día) modificadas.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0), Decimal(0), Decimal(0)])
+
+    def acumular(clave, signo, importes):
+        delta = deltas[clave]
+        delta[0] += signo
+        for i, valor in enumerate(importes, start=1):
+            delta[i] += signo * _importe(valor)
+
+    for pedido in pedidos:
+        anterior = anteriores.get(pedido.pk)
+        if anterior is not None:
+            # El upsert no cambia fecha_procesado: el pedido sigue imputado a su día original.
+            dia = dia_venta(anterior['fecha_procesado'])
+            acumular((anterior['cliente'], dia), -1, [anterior[campo] for campo in CAMPOS_IMPORTE])
+        else:
+            dia = dia_venta(pedido.fecha_procesado)
+        acumular((pedido.cliente, dia), 1, [getattr(pedido, campo) for campo in CAMPOS_IMPORTE])
+
+    # Reprocesar un pedido sin cambios no escribe nada.
+    deltas = {clave: delta for clave, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return 0
+
+    existentes = {
+        (venta.cliente, venta.dia): venta
+        for venta in VentaDiariaCliente.objects.filter(
+            cliente__in={cliente for cliente, _ in deltas}, dia__in={dia for _, dia in deltas})
+    }
+    actualizadas, vacias = [], []
+    for (cliente, dia), (pedidos_delta, *importes_delta) in deltas.items():
+        venta = existentes.get((cliente, dia)) or VentaDiariaCliente(cliente=cliente, dia=dia)
+        venta.pedidos += pedidos_delta
+        for campo, delta in zip(CAMPOS_IMPORTE, importes_delta):
+            setattr(venta, campo, Decimal(getattr(venta, campo)) + delta)
+        if venta.pedidos <= 0:
+            if venta.pk is not None:
+                vacias.append(venta.pk)
+            continue
+        venta.fecha_actualizacion = timezone.now()
+        actualizadas.append(venta)
+
+    if actualizadas:
+        VentaDiariaCliente.objects.bulk_create(
+            actualizadas, update_conflicts=True, unique_fields=['cliente', 'dia'],
+            update_fields=['pedidos', *CAMPOS_IMPORTE, 'fecha_actualizacion'],
+        )
+    if vacias:
+        VentaDiariaCliente.objects.filter(pk__in=vacias).delete()
+    return len(actualizadas) + len(vacias)
+
+
+def _inicio_dia(dia: date) -> datetime:
+    return timezone.make_aware(datetime.combine(dia, dt_time.min))
+
+
+def reconstruir_dia(dia: date) -> int:
+    """
+    Recalcula desde ``PedidoProcesado`` las ventas de un día, en una transacción propia.
+
+    Returns:
+        El número de filas (clientes) del día.
+    """
+    with transaction.atomic():
+        agregados = (PedidoProcesado.objects
+                     .filter(fecha_procesado__gte=_inicio_dia(dia), fecha_procesado__lt=_inicio_dia(dia + timedelta(days=1)))
+                     .values('cliente')
+                     .annotate(n=Count('pk'), s_subtotal=Sum('subtotal'), s_descuento=Sum('descuento'),
+                               s_total_final=Sum('total_final')))
+        ventas = [
+            VentaDiariaCliente(cliente=fila['cliente'], dia=dia, pedidos=fila['n'],
+                               **{campo: _importe(fila[f's_{campo}']) for campo in CAMPOS_IMPORTE})
+            for fila in agregados
+        ]
+        VentaDiariaCliente.objects.filter(dia=dia).delete()
+        VentaDiariaCliente.objects.bulk_create(ventas)
+    return len(ventas)
+
+
+def rango_pedidos() -> Optional[tuple]:
+    """Primer y último día con pedidos procesados (None si no hay pedidos)."""
+    primero = PedidoProcesado.objects.order_by('fecha_procesado').values_list('fecha_procesado', flat=True).first()
+    ultimo = PedidoProcesado.objects.order_by('-fecha_procesado').values_list('fecha_procesado', flat=True).first()
+    if primero is None:
+        return None
+    return dia_venta(primero), dia_venta(ultimo)
+
+
+def consultar_ventas(desde: date, hasta: date, cliente: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Filas de ventas entre ``desde`` y ``hasta`` (incluidos), opcionalmente de un cliente."""
+    ventas = VentaDiariaCliente.objects.filter(dia__gte=desde, dia__lte=hasta)
+    if cliente:
+        ventas = ventas.filter(cliente=cliente)
+    return list(ventas.order_by('dia', 'cliente').values('cliente', 'dia', 'pedidos', *CAMPOS_IMPORTE))
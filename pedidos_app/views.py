@@ -4,8 +4,24 @@ En este caso, incluye una vista para simular la creación y encolado
 de nuevos pedidos para ser procesados por el sistema de tareas asíncronas.
 """
 
-from django.http import JsonResponse
-from .tasks import procesar_pedido_completo
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import RequestDataTooBig
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from huey.contrib.djhuey import HUEY
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from .encolado import encolar_pedido, encolar_pedidos
+from .estado_pedidos import CONFIG_ESTADO_PEDIDOS, consultar_estados, etag_estados
+from .exportacion import FORMATOS, exportar, nombre_archivo, parametros_exportacion
+from .metricas import registro
+from .resiliencia import CLAVE_ESTADO_API
+from .esquema import ErrorValidacion, validar_pedido
+from .ventas import CAMPOS_IMPORTE, consultar_ventas
+from datetime import date, timedelta
+import json
 import random
 import time
 
@@ -16,6 +32,11 @@ CLIENTES_POSIBLES = ["ACME Corp", "Stark Industries", "Wayne Enterprises", "Cybe
 SKUS_VALIDOS = ["P001", "P002", "P003", "P004", "P008", "P015", "P020"]
 SKUS_INVALIDOS = ["P999", "P888", "INVALID_SKU"]
 
+# Número máximo de pedidos aceptados en una sola petición de carga masiva.
+MAX_PEDIDOS_POR_LOTE = getattr(settings, 'PEDIDOS_MAX_POR_LOTE', 10000)
+# Días máximos por consulta de ventas diarias (por defecto se devuelven los últimos 30).
+MAX_DIAS_VENTAS = getattr(settings, 'PEDIDOS_MAX_DIAS_VENTAS', 366)
+
 
 def iniciar_procesamiento(request):
     """
@@ -24,17 +45,19 @@ def iniciar_procesamiento(request):
     Esta vista actúa como un generador de pedidos. Cada vez que se accede a su URL,
     genera una tanda de pedidos con datos aleatorios y los envía a la cola de Huey.
     Algunos pedidos se crean intencionalmente con datos inválidos para demostrar
-    el manejo de errores del worker.
+    el manejo de errores: los que no cumplen el esquema se rechazan antes de
+    encolarse y los SKUs inexistentes fallan en el worker.
 
     Args:
         request: El objeto HttpRequest de Django.
 
     Returns:
-        JsonResponse: Una respuesta JSON que confirma la cantidad de tareas encoladas
-                      y los IDs de los pedidos generados.
+        JsonResponse: Una respuesta JSON que confirma la cantidad de tareas encoladas,
+                      los IDs de los pedidos encolados y los rechazados con sus errores.
     """
     pedidos_a_generar = 10
     pedidos_encolados = []
+    pedidos_rechazados = []
 
     for i in range(pedidos_a_generar):
         # Para asegurar que cada pedido sea único en cada ejecución, generamos un ID
@@ -55,7 +78,7 @@ def iniciar_procesamiento(request):
             productos.append({"sku": sku, "cantidad": cantidad})
         
         # Forzamos la creación de un pedido inválido (sin productos) cada 5 iteraciones.
-        # Esto sirve para probar la etapa de validación inicial dentro de la tarea.
+        # Esto sirve para probar la validación del esquema antes de encolar.
         if i % 5 == 0:
             productos = []
 
@@ -66,18 +89,213 @@ def iniciar_procesamiento(request):
             "productos": productos
         }
         
+        # --- Validar contra el esquema ---
+        # Un pedido inválido se rechaza aquí mismo: no llega a escribirse en la cola.
+        try:
+            validar_pedido(pedido)
+        except ErrorValidacion as e:
+            pedidos_rechazados.append({"id": pedido_id, "errores": e.errores})
+            continue
+
         # --- Encolar la Tarea ---
-        # Aquí es donde encola las tareas de manera asíncrona. Al llamar a la función decorada
-        # con @task, no la ejecutamos directamente. En su lugar, Huey la serializa
-        # y la pone en la cola (la base de datos huey.db) para que un worker
-        # la procese en segundo plano. La vista no espera y responde al usuario al instante.
-        procesar_pedido_completo(pedido)
+        # Aquí es donde encola las tareas de manera asíncrona. La tarea procesar_pedido_completo
+        # no se ejecuta directamente: Huey la serializa con la prioridad de su carril y la pone
+        # en la cola (la base de datos huey.db) para que un worker la procese en segundo plano.
+        # La vista no espera y responde al usuario al instante.
+        encolar_pedido(pedido)
         pedidos_encolados.append(pedido_id)
 
     # Devolvemos una respuesta inmediata al usuario, confirmando que los pedidos
     # han sido recibidos y están siendo procesados.
     return JsonResponse({
         "status": "ok", 
-        "message": f"{len(pedidos_encolados)} pedidos dinámicos han sido encolados.",
-        "ids_encolados": pedidos_encolados
-    })
\ No newline at end of file
+        "message": f"{len(pedidos_encolados)} pedidos dinámicos han sido encolados, {len(pedidos_rechazados)} rechazados.",
+        "ids_encolados": pedidos_encolados,
+        "rechazados": pedidos_rechazados,
+    })
+
+
+@csrf_exempt
+@require_POST
+def recibir_pedidos_lote(request):
+    """
+    Recibe una lista JSON de pedidos y los encola por lotes.
+
+    Todos los pedidos se validan contra el esquema en una sola pasada antes de
+    escribir en la cola; los inválidos o con ID repetido dentro de la petición se
+    rechazan sin afectar al resto, con un error por cada campo inválido.
+
+    Args:
+        request: El objeto HttpRequest de Django con un array JSON en el cuerpo.
+
+    Returns:
+        JsonResponse: Los IDs aceptados y los rechazados junto con sus errores.
+    """
+    try:
+        pedidos = json.loads(request.body)
+    except RequestDataTooBig:
+        # Cuerpo mayor que DATA_UPLOAD_MAX_MEMORY_SIZE: el cliente debe partir el lote, no corregirlo.
+        return JsonResponse({
+            "status": "error",
+            "message": f"El cuerpo supera el máximo de {settings.DATA_UPLOAD_MAX_MEMORY_SIZE} bytes.",
+        }, status=413)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({"status": "error", "message": "El cuerpo no es un JSON válido."}, status=400)
+    if not isinstance(pedidos, list):
+        return JsonResponse({"status": "error", "message": "Se esperaba un array JSON de pedidos."}, status=400)
+    if len(pedidos) > MAX_PEDIDOS_POR_LOTE:
+        return JsonResponse({
+            "status": "error",
+            "message": f"El lote supera el máximo de {MAX_PEDIDOS_POR_LOTE} pedidos.",
+        }, status=413)
+
+    aceptados, rechazados, validos = [], [], []
+    ids_vistos = set()
+    for pedido in pedidos:
+        pedido_id = pedido.get("id") if isinstance(pedido, dict) else None
+        try:
+            validar_pedido(pedido)
+            if pedido_id in ids_vistos:
+                raise ErrorValidacion([{"campo": "id", "error": "ID de pedido repetido dentro del lote."}])
+        except ErrorValidacion as e:
+            rechazados.append({"id": pedido_id, "error": str(e), "errores": e.errores})
+            continue
+        ids_vistos.add(pedido_id)
+        validos.append(pedido)
+        aceptados.append(pedido_id)
+
+    encolar_pedidos(validos)
+
+    return JsonResponse({
+        "status": "ok",
+        "message": f"{len(aceptados)} pedidos encolados, {len(rechazados)} rechazados.",
+        "aceptados": aceptados,
+        "rechazados": rechazados,
+    }, status=202 if aceptados else 200)
+
+
+def metricas(request):
+    """
+    Expone el registro de métricas del proceso en formato de texto de Prometheus.
+
+    Las métricas del pipeline (etapas, API, estados) se generan en el worker; este
+    endpoint publica las del proceso web y el worker publica las suyas en
+    ``PEDIDOS_METRICAS['puerto_worker']``.
+    """
+    return HttpResponse(registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def estado_api(request):
+    """
+    Devuelve en JSON el estado del circuito y de los limitadores de la API de productos.
+
+    Cada worker publica el estado de su guarda cada minuto (tarea ``publicar_estado_api``);
+    la respuesta contiene una entrada por host. En tiempo real, el mismo estado está
+    en las métricas del worker (``pedidos_api_guarda``).
+    """
+    return JsonResponse({'workers': HUEY.get(CLAVE_ESTADO_API, peek=True) or {}})
+
+
+@staff_member_required
+@require_GET
+def exportar_pedidos(request):
+    """
+    Descarga los pedidos procesados en CSV o NDJSON, en streaming.
+
+    Parámetros (query string, todos opcionales): ``formato`` (csv o ndjson),
+    ``cliente``, ``desde`` y ``hasta`` (AAAA-MM-DD o fecha y hora ISO 8601; un día
+    como ``hasta`` se incluye entero) y ``detalle=1`` para añadir ``detalle_completo``.
+
+    La respuesta se genera por bloques con paginación por clave, así que
+    el proceso web mantiene memoria constante con cualquier volumen.
+    """
+    try:
+        parametros = parametros_exportacion(request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    detalle = request.GET.get('detalle') in ('1', 'true', 'si')
+
+    response = StreamingHttpResponse(exportar(detalle=detalle, **parametros),
+                                     content_type=FORMATOS[parametros['formato']])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{nombre_archivo(parametros["formato"], parametros["cliente"])}"')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@staff_member_required
+@require_GET
+def ventas_diarias(request):
+    """
+    Devuelve en JSON las ventas por cliente y día de ``VentaDiariaCliente``, con sus totales.
+
+    Parámetros (query string, opcionales): ``desde`` y ``hasta`` (AAAA-MM-DD, ambos
+    incluidos; por defecto los últimos 30 días) y ``cliente``. Lee solo la tabla de
+    ventas agregadas, nunca la de pedidos.
+    """
+    try:
+        hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else timezone.localdate()
+        desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else hasta - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Fechas inválidas: use el formato AAAA-MM-DD."}, status=400)
+    if hasta < desde:
+        return JsonResponse({"status": "error", "message": "'hasta' no puede ser anterior a 'desde'."}, status=400)
+    if (hasta - desde).days >= MAX_DIAS_VENTAS:
+        return JsonResponse({"status": "error", "message": f"El rango supera los {MAX_DIAS_VENTAS} días."}, status=400)
+
+    cliente = request.GET.get('cliente') or None
+    filas = consultar_ventas(desde, hasta, cliente)
+    totales = {'pedidos': sum(fila['pedidos'] for fila in filas)}
+    totales.update({campo: sum((fila[campo] for fila in filas), start=0) for campo in CAMPOS_IMPORTE})
+    return JsonResponse({"desde": desde, "hasta": hasta, "cliente": cliente, "ventas": filas, "totales": totales})
+
+
+def _respuesta_estados(request, datos, entradas):
+    """JsonResponse con ETag fuerte, o 304 si el cliente ya tiene esa versión."""
+    etag = etag_estados(entradas)
+    recibidos = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in recibidos or '*' in recibidos:
+        response = HttpResponse(status=304)
+    else:
+        response = JsonResponse(datos())
+    response['ETag'] = etag
+    # Los clientes pueden guardar la respuesta, pero deben revalidarla en cada sondeo.
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+def estado_pedido(request, pedido_id):
+    """
+    Devuelve en JSON el estado de un pedido: ``sin_registro``, ``en_proceso``,
+    ``reintentando``, ``procesado`` (con sus importes) o ``fallido`` (con el último error).
+
+    Pensado para sondeos frecuentes: el estado sale de una caché del proceso y la
+    respuesta lleva un ETag, de modo que con ``If-None-Match`` un estado sin cambios
+    se responde con un 304 vacío.
+    """
+    entrada = consultar_estados([pedido_id])[pedido_id]
+    return _respuesta_estados(request, lambda: entrada[0], [entrada])
+
+
+@require_GET
+def estado_pedidos(request):
+    """
+    Devuelve en JSON el estado de varios pedidos (``?ids=1,2,3``), en el orden pedido.
+
+    Los que no están en la caché se resuelven con una consulta por tabla para
+    todos ellos. El ETag cubre la respuesta entera.
+    """
+    try:
+        ids = [int(valor) for valor in request.GET.get('ids', '').split(',') if valor.strip()]
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "'ids' debe ser una lista de enteros separados por comas."},
+                            status=400)
+    max_ids = CONFIG_ESTADO_PEDIDOS['max_ids']
+    if not ids:
+        return JsonResponse({"status": "error", "message": "Indique los pedidos en 'ids'."}, status=400)
+    if len(ids) > max_ids:
+        return JsonResponse({"status": "error", "message": f"Como máximo {max_ids} pedidos por consulta."}, status=400)
+
+    entradas = list(consultar_estados(ids).values())
+    return _respuesta_estados(request, lambda: {'pedidos': [estado for estado, _ in entradas]}, entradas)
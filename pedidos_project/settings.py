@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from pedidos_app.serializacion import SerializadorCompacto
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -76,10 +78,32 @@ WSGI_APPLICATION = 'pedidos_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Perfil de concurrencia de SQLite: el servidor web y los hilos del worker escriben a la vez.
+# - WAL: los lectores no bloquean al escritor ni al revés; synchronous=NORMAL es seguro en WAL
+#   (solo se pueden perder las últimas transacciones ante un corte de energía, no corromper).
+# - transaction_mode IMMEDIATE: las transacciones toman el bloqueo de escritura al empezar.
+#   Con el modo DEFERRED por defecto, una transacción que lee y luego escribe (update_or_create)
+#   falla al instante con "database is locked" si otra escribe entre medias, sin respetar el
+#   timeout. Así las escrituras concurrentes esperan su turno hasta 'timeout' segundos.
+# - CONN_MAX_AGE: el servidor web reutiliza la conexión (y con ella la caché de páginas);
+#   los hilos del worker ya mantienen su conexión abierta mientras viven.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'   # 256 MB
+                'PRAGMA cache_size=-32000;'     # 32 MB
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
     }
 }
 
@@ -90,11 +114,171 @@ HUEY = {
     'name': 'procesador-pedidos-db',
     'filename': BASE_DIR / 'huey.db',
     'immediate': False,
+    # Parámetros de SqliteStorage: WAL, espera de hasta 'timeout' segundos por el bloqueo
+    # y sin fsync (la cola tolera perder las últimas tareas ante un corte de energía).
+    'journal_mode': 'wal',
+    'timeout': 20,
+    'cache_mb': 16,
+    'fsync': False,
+    # Mensajes compactos y comprimidos con zlib por encima de 256 bytes; sigue leyendo el formato anterior.
+    'serializer': SerializadorCompacto(umbral_compresion=256),
+    # worker_type 'asyncio' activa el consumidor asyncio del proyecto (ver PEDIDOS_CONSUMIDOR_ASYNCIO);
+    # en ese modo 'workers' no se usa.
     'consumer': {
         'workers': 4,
+        'worker_type': 'thread',
     },
 }
 
+# --- Consumidor asyncio ---
+# max_en_vuelo: tareas desencoladas a la vez (None = 4 × hilos_orm). Solo viven en memoria: si el proceso
+# muere sin detenerse ordenadamente se pierden, así que no conviene subirlo mucho por encima de hilos_orm.
+# hilos_orm: hilos que ejecutan las tareas (ORM y SQLite);
+# precarga_api: adelantar con httpx (dependencia opcional) las consultas a la API de los pedidos;
+# None la activa solo si httpx está instalado, True exige httpx.
+PEDIDOS_CONSUMIDOR_ASYNCIO = {
+    'max_en_vuelo': None,
+    'hilos_orm': 8,
+    'precarga_api': None,
+}
+
+# --- Encolado ---
+# Pedidos agrupados por tarea al encolar en bloque: 1 = una tarea por pedido,
+# N > 1 = micro-lotes procesados por procesar_pedidos_lote con persistencia masiva.
+PEDIDOS_POR_TAREA = 1
+
+# --- Carriles de prioridad y turnos por cliente ---
+# Cada tarea se encola con la prioridad base de su carril (enteros; el campo 'prioridad' del pedido
+# o, si falta, 'baja' por encima de max_lineas_normal líneas) más un desempate por cliente: los
+# pedidos recientes de un mismo cliente (semivida en segundos) van después de los de los demás.
+PEDIDOS_PRIORIDAD = {
+    'carriles': {'alta': 2, 'normal': 1, 'baja': 0},
+    'max_lineas_normal': 20,
+    'semivida_turno': 60.0,
+    'pesos': {},
+    'activa': True,
+}
+
+# --- API externa de productos ---
+# timeout: segundos por petición; plazo_pedido: segundos máximos para enriquecer un pedido;
+# max_concurrencia: peticiones simultáneas del worker (y tamaño del pool de conexiones).
+PEDIDOS_API_PRODUCTOS = {
+    'base_url': "https://fakestoreapi.com",
+    'timeout': 10,
+    'plazo_pedido': 20,
+    'max_concurrencia': 8,
+}
+
+# --- Esquema de los pedidos de entrada ---
+# Se valida antes de encolar (vistas, carga masiva, ingesta) y otra vez en el worker.
+PEDIDOS_ESQUEMA = {
+    'patron_sku': r'^[A-Za-z]{1,10}[0-9]{1,9}$',
+    'max_productos': 100,
+    'max_cantidad': 10000,
+    'max_longitud_cliente': 255,
+}
+
+# --- Política de reintentos ---
+# Los errores permanentes (datos inválidos) no se reintentan; los transitorios (red, 5xx,
+# bloqueos de SQLite) se reintentan hasta max_reintentos veces con espera exponencial con
+# jitter: espera_base, 2*espera_base, 4*espera_base... hasta espera_maxima segundos.
+PEDIDOS_REINTENTOS = {
+    'max_reintentos': 5,
+    'espera_base': 2.0,
+    'espera_maxima': 300.0,
+}
+
+# --- Réplica local del catálogo ---
+# El pipeline enriquece desde la tabla Producto (refrescada cada 15 minutos); con
+# respaldo_api los SKUs que no estén en ella se consultan en vivo a la API. Un listado vacío o que
+# retiraría más de max_fraccion_retirados de los productos activos no desactiva ninguno.
+PEDIDOS_CATALOGO = {
+    'respaldo_api': True,
+    'max_fraccion_retirados': 0.2,
+}
+
+# --- Guarda de la API de productos ---
+# Limita la tasa y la concurrencia (adaptativa según la latencia) y abre el circuito tras
+# 'umbral_fallos' errores consecutivos; con el circuito abierto las tareas se aplazan.
+PEDIDOS_RESILIENCIA_API = {
+    'tasa_por_segundo': 50.0,
+    'rafaga': 100,
+    'concurrencia_min': 1,
+    'concurrencia_inicial': 4,
+    'concurrencia_max': 8,
+    'latencia_objetivo': 1.0,
+    'espera_max': 5.0,
+    'umbral_fallos': 5,
+    'tiempo_apertura': 30.0,
+}
+
+# --- Auditoría de tareas (TaskHistory) ---
+# 'sincrono' escribe cada transición al momento; 'buffer' las acumula en memoria
+# y las vuelca por lotes desde un hilo en segundo plano (y al apagar el worker).
+PEDIDOS_AUDITORIA = {
+    'modo': 'sincrono',
+    'max_buffer': 5000,
+    'tamano_flush': 500,
+    'intervalo_flush': 1.0,
+}
+
+# --- Idempotencia de la entrada ---
+# Índice en memoria de payloads ya procesados (además de la tabla HuellaPedido).
+PEDIDOS_IDEMPOTENCIA = {
+    'max_entradas': 100000,
+    'ttl': 3600,
+}
+
+# --- Retención del historial y de los resultados de Huey ---
+# Cada hora se archivan en 'directorio' (JSONL.gz, un archivo por día) y se borran las filas de
+# TaskHistory con más de dias_historial días y los resultados de Huey con más de dias_resultados_huey.
+# Se consultan con: python manage.py consultar_archivo --desde AAAA-MM-DD
+PEDIDOS_RETENCION = {
+    'dias_historial': 30,
+    'dias_resultados_huey': 7,
+    'directorio': BASE_DIR / 'archivo',
+    'tamano_lote': 500,
+    'max_lotes': 200,
+    'pausa_entre_lotes': 0.05,
+    'paginas_vacuum': 2000,
+    'vacuum_completo': True,
+}
+
+# --- Exportación de pedidos procesados ---
+# /pedidos/exportar/ (solo staff) y python manage.py exportar_pedidos leen los pedidos en bloques
+# de tamano_lote filas paginados por clave (pk, o (fecha_procesado, pk) si se filtra por cliente o fecha)
+# y los escriben en streaming (CSV o NDJSON).
+PEDIDOS_EXPORTACION = {
+    'tamano_lote': 2000,
+}
+
+# --- Métricas ---
+# Puerto donde cada proceso worker expone sus métricas en formato Prometheus (None = desactivado),
+# p. ej. 9108. El endpoint no tiene autenticación: escucha en host_worker (127.0.0.1 por defecto) y
+# cada worker de la misma máquina necesita su propio puerto. El servidor web publica las suyas en /pedidos/metricas/.
+PEDIDOS_METRICAS = {
+    'puerto_worker': None,
+    'host_worker': '127.0.0.1',
+}
+
+# --- Caché de productos del worker ---
+# TTL en segundos para productos encontrados y para entradas negativas (SKUs inexistentes).
+PEDIDOS_CACHE_PRODUCTOS = {
+    'max_entradas': 1024,
+    'ttl': 300,
+    'ttl_negativo': 60,
+}
+
+# --- Consulta del estado de pedidos ---
+# /pedidos/estado/<id>/ y /pedidos/estado/?ids=1,2,3 sirven el estado desde una caché de cada proceso:
+# ttl_final segundos para pedidos procesados o fallidos y ttl_pendiente para los que aún pueden cambiar.
+PEDIDOS_ESTADO = {
+    'max_entradas': 10000,
+    'ttl_final': 300,
+    'ttl_pendiente': 1,
+    'max_ids': 100,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators